@@ -0,0 +1,116 @@
+"""
+Simulation of partial-mesh connection limits with ConnectionManager.
+
+NODES TcpTransports on loopback all discover each other. Without a manager
+every pair connects (full mesh). With a ConnectionManager of DEGREE each node
+keeps its rendezvous-selected peers. The run reports connection counts, the
+inbound spread and whether the graph stays connected. CHURN nodes then leave
+and the same number join, and the run counts the connections opened and
+closed across the cluster.
+
+Run from the repository root (Linux routes all of 127.0.0.0/8 locally):
+    python benchmarks/bench_connection_manager.py
+"""
+from p2p_networking.connection_manager import ConnectionManager
+from p2p_networking.events import EventBus, NodeDiscoveredEvent, NodeLostEvent, PeerConnectedEvent, PeerDisconnectedEvent
+from p2p_networking.tcp_transport import TcpTransport
+import asyncio
+import logging
+import statistics
+
+PORT = 47500
+NODES = 40
+DEGREE = 4
+CHURN = 4
+SETTLE = 3.0
+
+class Cluster:
+
+    def __init__(self, degree):
+        self.degree = degree
+        self.nodes = {}
+        self.managers = {}
+        self.opened = 0
+        self.closed = 0
+
+    async def add(self, index):
+        bus = EventBus()
+        transport = TcpTransport(bus)
+        transport.set_uid(f'node-{index:03}')
+        transport.set_addr(f'127.0.{index // 250}.{index % 250 + 1}')
+        transport.set_port(PORT)
+        if self.degree is not None:
+            manager = ConnectionManager(transport, self.degree, prune_grace=1.0, maintenance_interval=0.2)
+            self.managers[transport.uid] = manager
+
+        async def on_connected(event):
+            self.opened += 1
+
+        async def on_disconnected(event):
+            self.closed += 1
+        bus.subscribe(PeerConnectedEvent, on_connected)
+        bus.subscribe(PeerDisconnectedEvent, on_disconnected)
+        asyncio.create_task(transport.start())
+        await asyncio.sleep(0.05)
+        for other in self.nodes.values():
+            await bus.publish(NodeDiscoveredEvent(other.uid, {'ip': other.addr}))
+            await other.event_bus.publish(NodeDiscoveredEvent(transport.uid, {'ip': transport.addr}))
+        self.nodes[transport.uid] = transport
+
+    async def remove(self, uid):
+        transport = self.nodes.pop(uid)
+        manager = self.managers.pop(uid, None)
+        if manager:
+            await manager.stop()
+        await transport.stop()
+        for other in self.nodes.values():
+            await other.event_bus.publish(NodeLostEvent(uid))
+
+    def report(self, label):
+        links = {frozenset((transport.uid, uid)) for transport in self.nodes.values() for uid in transport.peers.snapshot()}
+        degrees = [len(transport.peers.snapshot()) for transport in self.nodes.values()]
+        inbound = [sum(1 for peer in transport.peers.snapshot().values() if not peer.outbound) for transport in self.nodes.values()]
+        print(f'  {label}: {len(links)} connections, per node avg {statistics.mean(degrees):.1f} / max {max(degrees)}, '
+              f'inbound max {max(inbound)}, connected graph: {self.is_connected(links)}')
+
+    def is_connected(self, links):
+        neighbours = {uid: set() for uid in self.nodes}
+        for link in links:
+            a, b = tuple(link)
+            if a in neighbours and b in neighbours:
+                neighbours[a].add(b)
+                neighbours[b].add(a)
+        start = next(iter(neighbours))
+        seen, frontier = {start}, [start]
+        while frontier:
+            frontier = [other for uid in frontier for other in neighbours[uid] if other not in seen and not seen.add(other)]
+        return len(seen) == len(neighbours)
+
+    async def stop(self):
+        for uid in list(self.nodes):
+            await self.remove(uid)
+
+async def run(degree):
+    print(f'{"full mesh" if degree is None else f"ConnectionManager degree {degree}"}, {NODES} nodes:')
+    cluster = Cluster(degree)
+    for index in range(NODES):
+        await cluster.add(index)
+    await asyncio.sleep(SETTLE)
+    cluster.report('steady state')
+    opened, closed = cluster.opened, cluster.closed
+    for uid in list(cluster.nodes)[:CHURN]:
+        await cluster.remove(uid)
+    for index in range(NODES, NODES + CHURN):
+        await cluster.add(index)
+    await asyncio.sleep(SETTLE)
+    cluster.report(f'after {CHURN} left and {CHURN} joined')
+    print(f'  churn: {cluster.opened - opened} connection events opened, {cluster.closed - closed} closed')
+    await cluster.stop()
+
+async def main():
+    await run(None)
+    await run(DEGREE)
+
+if __name__ == '__main__':
+    logging.disable(logging.WARNING)
+    asyncio.run(main())
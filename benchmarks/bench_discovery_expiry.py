@@ -0,0 +1,77 @@
+"""
+Benchmark of discovered-node expiry with 10k simulated nodes.
+
+Compares the former BroadcastManager approach (a full scan of the node
+table on every cleanup tick) with ExpiryIndex (heap keyed on deadline).
+Both are fed the same stream of refreshes; each simulated second a
+fraction of nodes stops announcing and must be expired.
+
+Run from the repository root:
+    python benchmarks/bench_discovery_expiry.py
+"""
+from p2p_networking.expiry import ExpiryIndex
+import random
+import time
+
+NODES = 10_000
+SECONDS = 60
+NODE_TIMEOUT = 30
+ANNOUNCE_INTERVAL = 10
+CRASHES_PER_SECOND = 20
+
+def simulate(refresh, expire):
+    random.seed(1)
+    alive = set(range(NODES))
+    refresh_time = 0.0
+    expire_time = 0.0
+    expired_total = 0
+    for second in range(SECONDS):
+        now = float(second)
+        for uid in random.sample(sorted(alive), min(CRASHES_PER_SECOND, len(alive))):
+            alive.discard(uid)
+        started = time.perf_counter()
+        for uid in alive:
+            if uid % ANNOUNCE_INTERVAL == second % ANNOUNCE_INTERVAL:
+                refresh(uid, now)
+        refresh_time += time.perf_counter() - started
+        started = time.perf_counter()
+        expired_total += expire(now)
+        expire_time += time.perf_counter() - started
+    return refresh_time, expire_time, expired_total
+
+def linear_scan():
+    table = {uid: {'last_seen': 0.0} for uid in range(NODES)}
+
+    def refresh(uid, now):
+        table[uid] = {'last_seen': now}
+
+    def expire(now):
+        expired = [uid for uid, data in table.items() if now - data['last_seen'] >= NODE_TIMEOUT]
+        for uid in expired:
+            del table[uid]
+        return len(expired)
+
+    return simulate(refresh, expire)
+
+def expiry_index():
+    index = ExpiryIndex()
+    for uid in range(NODES):
+        index.set(uid, NODE_TIMEOUT)
+
+    def refresh(uid, now):
+        index.set(uid, now + NODE_TIMEOUT)
+
+    def expire(now):
+        return len(index.pop_expired(now))
+
+    return simulate(refresh, expire)
+
+def main():
+    print(f'{NODES} nodes, {SECONDS} simulated seconds, {CRASHES_PER_SECOND} crashes/s')
+    for name, run in (('linear scan', linear_scan), ('ExpiryIndex', expiry_index)):
+        refresh_time, expire_time, expired = run()
+        print(f'{name:12} refresh {refresh_time * 1e3:8.1f} ms   expiry {expire_time * 1e3:8.1f} ms   '
+              f'expiry/tick {expire_time / SECONDS * 1e6:8.1f} us   expired {expired}')
+
+if __name__ == '__main__':
+    main()
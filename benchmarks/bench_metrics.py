@@ -0,0 +1,131 @@
+"""
+Overhead of the metrics subsystem on the hot paths.
+
+Each instrumented path is timed with metrics disabled and enabled:
+EventBus.publish to a direct handler, SendQueue put/batch, and a loopback
+message flood between two TcpTransports. The cost of the bare
+`if metrics.enabled` guard is measured separately; with metrics disabled
+that guard is all the instrumentation adds.
+
+Run from the repository root (Linux routes all of 127.0.0.0/8 locally):
+    python benchmarks/bench_metrics.py
+"""
+from p2p_networking import metrics
+from p2p_networking.events import EventBus, Event, MessageReceivedEvent, NodeDiscoveredEvent
+from p2p_networking.send_queue import SendQueue
+from p2p_networking.tcp_transport import TcpTransport
+import asyncio
+import logging
+import time
+import timeit
+
+EVENTS = 200_000
+FRAMES = 200_000
+MESSAGES = 50_000
+ROUNDS = 3
+PORT = 47200
+
+class Ping(Event):
+    pass
+
+class NullWriter:
+    def writelines(self, data):
+        pass
+
+    async def drain(self):
+        pass
+
+async def bench_publish() -> float:
+    event_bus = EventBus()
+
+    async def handler(event):
+        pass
+
+    event_bus.subscribe(Ping, handler)
+    event = Ping()
+    started = time.perf_counter()
+    for _ in range(EVENTS):
+        await event_bus.publish(event)
+    return (time.perf_counter() - started) / EVENTS
+
+async def bench_send_queue() -> float:
+    queue = SendQueue(NullWriter(), None)
+    frame = b'x' * 64
+    started = time.perf_counter()
+    for i in range(FRAMES):
+        queue.put_nowait(frame, i & 3)
+        if i % 64 == 63:
+            queue._next_batch()
+    queue._next_batch()
+    return (time.perf_counter() - started) / FRAMES
+
+async def bench_loopback(port: int) -> float:
+    transports = []
+    for uid, ip in (('a', '127.0.0.1'), ('b', '127.0.0.2')):
+        transport = TcpTransport(EventBus())
+        transport.set_uid(uid)
+        transport.set_addr(ip)
+        transport.set_port(port)
+        asyncio.create_task(transport.start())
+        transports.append(transport)
+    sender, receiver = transports
+    await asyncio.sleep(0.1)
+    done = asyncio.Event()
+    received = 0
+
+    async def on_message(event):
+        nonlocal received
+        received += 1
+        if received == MESSAGES:
+            done.set()
+
+    receiver.event_bus.subscribe(MessageReceivedEvent, on_message)
+    await sender.event_bus.publish(NodeDiscoveredEvent('b', {'ip': '127.0.0.2'}))
+    while 'b' not in sender.peers or sender.peers.get('b').codec is None:
+        await asyncio.sleep(0.01)
+    payload = {'n': 1, 'text': 'x' * 100}
+    started = time.perf_counter()
+    for _ in range(MESSAGES):
+        await sender.send_to_peer('b', payload)
+    await done.wait()
+    elapsed = time.perf_counter() - started
+    for transport in transports:
+        await transport.stop()
+    return elapsed / MESSAGES
+
+def best(values) -> float:
+    return min(values)
+
+async def main():
+    def guarded():
+        if metrics.enabled:
+            pass
+
+    def empty():
+        pass
+
+    runs = 2_000_000
+    guard = (timeit.timeit(guarded, number=runs) - timeit.timeit(empty, number=runs)) / runs
+    print(f'guard cost: {guard * 1e9:.1f} ns per call site')
+
+    port = PORT
+    for name, bench in (('EventBus.publish', bench_publish), ('SendQueue put+batch', bench_send_queue), ('loopback message', bench_loopback)):
+        results = {}
+        for state in (False, True):
+            metrics.enable() if state else metrics.disable()
+            samples = []
+            for _ in range(ROUNDS):
+                if bench is bench_loopback:
+                    port += 1
+                    samples.append(await bench(port))
+                else:
+                    samples.append(await bench())
+            results[state] = best(samples)
+        metrics.disable()
+        overhead = (results[True] - results[False]) / results[False] * 100
+        print(f'{name:22} disabled {results[False] * 1e6:7.2f} us/op   enabled {results[True] * 1e6:7.2f} us/op   (+{overhead:.1f}% when enabled)')
+    metrics.REGISTRY.reset()
+
+if __name__ == '__main__':
+    logging.disable(logging.WARNING)
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+"""
+Benchmark of Net subnet arithmetic against the former string implementation.
+
+LegacyNet below is a trimmed copy of the previous Net, which represented
+addresses and masks as 32-character '0'/'1' strings. Both are timed on
+iterating a /16, on 10k membership checks and on construction; the bulk
+contains_many path (and the numpy path, when numpy is installed) is
+reported alongside.
+
+Run from the repository root:
+    python benchmarks/bench_net.py
+"""
+from p2p_networking.net import Net
+import random
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+CHECKS = 10_000
+
+class LegacyNet:
+    def __init__(self, ip_and_mask: tuple):
+        self.ip, self.mask = ip_and_mask
+        self.mask_bin = LegacyNet._cidr_to_bin(self.mask)
+        self.network_address_str, self.net_address_bin = self._calculate_net(self._to_binary_string(self.ip), self.mask_bin)
+        self.broadcast_address_bin = self.net_address_bin[0:32 - self.mask_bin.count('0')] + '1' * self.mask_bin.count('0')
+        self.broadcast_address = self._bin_to_dec(self.broadcast_address_bin)
+
+    @staticmethod
+    def _ip_to_int(ip):
+        return int(LegacyNet._to_binary_string(ip), 2)
+
+    @staticmethod
+    def _int_to_ip(integer: int):
+        return LegacyNet._bin_to_dec(bin(integer)[2:].zfill(32))
+
+    def __contains__(self, ip: str):
+        ip = self._to_binary_string(ip)
+        ip_net_part = ''.join(str(int(x) & int(y)) for x, y in zip(ip, self.mask_bin))
+        return ip_net_part == self.net_address_bin
+
+    @staticmethod
+    def _to_binary_string(address_or_prefix: str):
+        return ''.join(bin(int(octet))[2:].zfill(8) for octet in address_or_prefix.split('.'))
+
+    @staticmethod
+    def _cidr_to_bin(prefix: str):
+        return '1' * int(prefix) + '0' * (32 - int(prefix))
+
+    @staticmethod
+    def _bin_to_dec(ip):
+        return '.'.join(str(int(ip[i:i+8], 2)) for i in range(0, 32, 8))
+
+    @staticmethod
+    def _calculate_net(ip, mask):
+        net_bin = ''.join(str(int(x) & int(y)) for x, y in zip(ip, mask))
+        return LegacyNet._bin_to_dec(net_bin), net_bin
+
+    def __iter__(self):
+        for x in range(LegacyNet._ip_to_int(self.network_address_str), LegacyNet._ip_to_int(self.broadcast_address) + 1):
+            yield LegacyNet._int_to_ip(x)
+
+def timed(func):
+    started = time.perf_counter()
+    result = func()
+    return time.perf_counter() - started, result
+
+def main():
+    random.seed(1)
+    ips = [f'10.{random.randrange(256)}.{random.randrange(256)}.{random.randrange(256)}' for _ in range(CHECKS)]
+    legacy, net = LegacyNet(('10.20.0.1', '16')), Net(('10.20.0.1', '16'))
+
+    rows = []
+    legacy_iter, legacy_count = timed(lambda: sum(1 for _ in legacy))
+    net_iter, net_count = timed(lambda: sum(1 for _ in net))
+    assert legacy_count == net_count == 65536
+    rows.append(('iterate /16', legacy_iter, net_iter))
+
+    legacy_check, legacy_hits = timed(lambda: [ip in legacy for ip in ips])
+    net_check, net_hits = timed(lambda: [ip in net for ip in ips])
+    assert legacy_hits == net_hits
+    rows.append((f'{CHECKS} x __contains__', legacy_check, net_check))
+
+    bulk, bulk_hits = timed(lambda: net.contains_many(ips))
+    assert bulk_hits == net_hits
+    rows.append((f'{CHECKS} x contains_many', legacy_check, bulk))
+
+    legacy_init, _ = timed(lambda: [LegacyNet(('192.168.1.100', '24')) for _ in range(1000)])
+    net_init, _ = timed(lambda: [Net(('192.168.1.100', '24')) for _ in range(1000)])
+    rows.append(('1000 x construct', legacy_init, net_init))
+
+    print(f'{"operation":24} {"legacy ms":>10} {"Net ms":>10} {"speedup":>8}')
+    for name, old, new in rows:
+        print(f'{name:24} {old * 1e3:10.2f} {new * 1e3:10.2f} {old / new:7.0f}x')
+
+    if numpy is not None:
+        array = numpy.array([Net._ip_to_int(ip) for ip in ips], dtype=numpy.uint32)
+        vector, _ = timed(lambda: net.contains_many(array))
+        arange, _ = timed(lambda: Net(('10.0.0.0', '8')).to_array())
+        print(f'numpy contains_many {vector * 1e3:.3f} ms, /8 to_array {arange * 1e3:.1f} ms')
+    else:
+        print('numpy not installed: skipping array benchmarks')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark of event loop responsiveness while receiving large messages.
+
+A sender process streams MESSAGES messages with a BODY_SIZE string body to a
+receiving TcpTransport whose handler hashes every body. The receiver runs
+with frame decoding on the loop or in the decode thread, and with the
+handler on the loop, in a thread pool or in a process pool. For each mode
+the receiver's LoopMonitor reports how long the loop was blocked.
+
+Run from the repository root (Linux routes all of 127.0.0.0/8 locally):
+    python benchmarks/bench_offload.py
+"""
+from p2p_networking.events import EventBus, NodeDiscoveredEvent, MessageReceivedEvent
+from p2p_networking.tcp_transport import TcpTransport
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import time
+
+PORT = 47200
+MESSAGES = 300
+BODY_SIZE = 1024 * 1024
+ROUNDS = 8
+MODES = (
+    ('decode on loop, handler on loop', 0, None),
+    ('decode off loop, handler on loop', 1, None),
+    ('decode off loop, handler in thread', 1, 'thread'),
+    ('decode off loop, handler in process', 1, 'process'),
+)
+
+def digest(event):
+    body = event.message.data['blob'].encode()
+    for _ in range(ROUNDS):
+        body = hashlib.sha256(body).digest() + body[32:]
+    return body[:32]
+
+async def on_message(event):
+    digest(event)
+
+async def send(ip):
+    transport = TcpTransport(EventBus())
+    transport.set_uid('sender')
+    transport.set_addr(ip)
+    transport.set_port(PORT)
+    asyncio.create_task(transport.start())
+    await asyncio.sleep(0.1)
+    await transport.event_bus.publish(NodeDiscoveredEvent('receiver', {'ip': '127.0.0.1'}))
+    while 'receiver' not in transport.peers or transport.peers.get('receiver').codec is None:
+        await asyncio.sleep(0.01)
+    blob = 'x' * BODY_SIZE
+    for n in range(MESSAGES):
+        await transport.send_to_peer('receiver', {'n': n, 'blob': blob})
+    await asyncio.sleep(60)
+
+def run_sender(ip):
+    logging.disable(logging.WARNING)
+    asyncio.run(send(ip))
+
+async def measure(index, decode_workers, executor):
+    bus = EventBus()
+    transport = TcpTransport(bus, decode_workers=decode_workers, loop_monitor_interval=0.005)
+    transport.set_uid('receiver')
+    transport.set_addr('127.0.0.1')
+    transport.set_port(PORT)
+    server = asyncio.create_task(transport.start())
+    await asyncio.sleep(0.1)
+    if executor is None:
+        subscription = bus.subscribe(MessageReceivedEvent, on_message)
+    else:
+        subscription = bus.subscribe(MessageReceivedEvent, digest, executor=executor)
+    sender = multiprocessing.get_context('spawn').Process(target=run_sender, args=(f'127.0.0.{index + 2}',))
+    sender.start()
+    started = None
+    while subscription.handled < MESSAGES:
+        if started is None and subscription.handled:
+            started = time.perf_counter()
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    stats = transport.get_loop_stats()
+    sender.terminate()
+    sender.join()
+    await transport.stop()
+    await bus.close()
+    server.cancel()
+    return elapsed, stats
+
+async def main():
+    for index, (name, decode_workers, executor) in enumerate(MODES):
+        elapsed, stats = await measure(index, decode_workers, executor)
+        print(f'{name:<38} {MESSAGES / elapsed:6.0f} msg/s, loop lag avg {stats["avg_lag"] * 1000:5.1f} ms, '
+              f'max {stats["max_lag"] * 1000:6.1f} ms, stalls {stats["stalls"]}')
+
+if __name__ == '__main__':
+    logging.disable(logging.WARNING)
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+"""
+Microbenchmark of the send-path peer lookup with 1k registered peers.
+
+Compares the old pattern (asyncio.Lock around a dict lookup) with the
+lock-free PeerRegistry read, both with an idle registry and while a
+background task keeps adding and removing peers.
+
+Run from the repository root:
+    python benchmarks/bench_peer_lookup.py
+"""
+from p2p_networking.peer_registry import PeerRegistry
+import asyncio
+import random
+import time
+
+PEERS = 1000
+LOOKUPS = 200_000
+
+class FakePeer:
+    def __init__(self, uid):
+        self.uid = uid
+
+async def locked_lookup(uids):
+    lock = asyncio.Lock()
+    table = {uid: (FakePeer(uid), None) for uid in uids}
+    started = time.perf_counter()
+    for uid in random.choices(uids, k=LOOKUPS):
+        async with lock:
+            pair = table.get(uid)
+    return time.perf_counter() - started
+
+async def registry_lookup(uids, churn: bool):
+    registry = PeerRegistry()
+    for uid in uids:
+        registry.add(FakePeer(uid))
+
+    async def mutate():
+        while True:
+            uid = random.choice(uids)
+            peer = registry.remove(uid)
+            if peer:
+                registry.add(peer)
+            await asyncio.sleep(0)
+
+    mutator = asyncio.create_task(mutate()) if churn else None
+    started = time.perf_counter()
+    for i, uid in enumerate(random.choices(uids, k=LOOKUPS)):
+        registry.get(uid)
+        if churn and i % 1000 == 0:
+            await asyncio.sleep(0)
+    elapsed = time.perf_counter() - started
+    if mutator:
+        mutator.cancel()
+    return elapsed
+
+async def main():
+    uids = [f'peer-{i}' for i in range(PEERS)]
+    results = {
+        'asyncio.Lock + dict': await locked_lookup(uids),
+        'PeerRegistry.get': await registry_lookup(uids, churn=False),
+        'PeerRegistry.get (with churn)': await registry_lookup(uids, churn=True),
+    }
+    print(f'{PEERS} peers, {LOOKUPS} lookups')
+    for name, elapsed in results.items():
+        print(f'{name:32} {elapsed / LOOKUPS * 1e9:8.1f} ns/lookup')
+
+if __name__ == '__main__':
+    asyncio.run(main())
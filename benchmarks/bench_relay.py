@@ -0,0 +1,90 @@
+"""
+Simulation of multi-hop flooding through Relay over a sparse local network.
+
+NODES TcpTransports on loopback are connected in a ring with random chords
+(average degree about DEGREE), so most pairs are several hops apart. For each
+fanout setting every run floods MESSAGES broadcasts from random origins and
+reports coverage, duplicate suppression and latency by hop count.
+
+Run from the repository root (Linux routes all of 127.0.0.0/8 locally):
+    python benchmarks/bench_relay.py
+"""
+from p2p_networking.events import EventBus, NodeDiscoveredEvent
+from p2p_networking.relay import Relay
+from p2p_networking.tcp_transport import TcpTransport
+import asyncio
+import logging
+import random
+
+PORT = 47400
+NODES = 24
+DEGREE = 4
+MESSAGES = 200
+FANOUTS = (None, 3, 2)
+
+def topology(rng):
+    links = {(index, (index + 1) % NODES) for index in range(NODES)}
+    while len(links) < NODES * DEGREE // 2:
+        a, b = rng.sample(range(NODES), 2)
+        if (b, a) not in links:
+            links.add((a, b))
+    return links
+
+async def start_network(links):
+    transports = []
+    for index in range(NODES):
+        transport = TcpTransport(EventBus())
+        transport.set_uid(f'node-{index:02}')
+        transport.set_addr(f'127.0.0.{index + 1}')
+        transport.set_port(PORT)
+        asyncio.create_task(transport.start())
+        transports.append(transport)
+    await asyncio.sleep(0.2)
+    for a, b in links:
+        await transports[a].event_bus.publish(NodeDiscoveredEvent(transports[b].uid, {'ip': transports[b].addr}))
+    expected = {(transports[a].uid, transports[b].uid) for a, b in links}
+    expected |= {(b, a) for a, b in expected}
+    while True:
+        ready = {(transport.uid, uid) for transport in transports
+                 for uid, peer in transport.peers.snapshot().items() if peer.codec is not None}
+        if expected <= ready:
+            return transports
+        await asyncio.sleep(0.05)
+
+async def flood(transports, fanout, rng):
+    relays = [Relay(transport, fanout=fanout) for transport in transports]
+    for _ in range(MESSAGES):
+        rng.choice(relays).broadcast({'payload': 'x' * 64})
+        await asyncio.sleep(0.002)
+    await asyncio.sleep(1.0)
+    totals = {'sent': 0, 'received': 0, 'duplicates': 0, 'delivered': 0, 'forwarded': 0, 'expired': 0, 'dropped': 0}
+    by_hops = {}
+    for relay in relays:
+        for key in totals:
+            totals[key] += relay.stats[key]
+        for hops, (count, total, peak) in relay.latency_by_hops.items():
+            entry = by_hops.setdefault(hops, [0, 0.0, 0.0])
+            entry[0] += count
+            entry[1] += total
+            entry[2] = max(entry[2], peak)
+    coverage = totals['delivered'] / (MESSAGES * (NODES - 1))
+    print(f'fanout {fanout or "all"}: coverage {coverage:.1%}, '
+          f'frames per message {totals["received"] / MESSAGES:.1f}, '
+          f'duplicates suppressed {totals["duplicates"] / totals["received"]:.1%} of received, '
+          f'dropped {totals["dropped"]}')
+    for hops, (count, total, peak) in sorted(by_hops.items()):
+        print(f'    {hops} hops: {count:5} deliveries, avg {total / count * 1000:6.2f} ms, max {peak * 1000:6.2f} ms')
+
+async def main():
+    rng = random.Random(7)
+    links = topology(rng)
+    transports = await start_network(links)
+    print(f'{NODES} nodes, {len(links)} links, {MESSAGES} broadcasts per run')
+    for fanout in FANOUTS:
+        await flood(transports, fanout, rng)
+    for transport in transports:
+        await transport.stop()
+
+if __name__ == '__main__':
+    logging.disable(logging.WARNING)
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+"""
+Benchmark of RPC round-trips between two TcpTransports over loopback.
+
+Measures sequential request latency (p50 / p99) and the throughput of
+pipelined requests issued concurrently over one connection.
+
+Run from the repository root (Linux routes all of 127.0.0.0/8 locally):
+    python benchmarks/bench_rpc.py
+"""
+from p2p_networking.events import EventBus, NodeDiscoveredEvent
+from p2p_networking.tcp_transport import TcpTransport
+import asyncio
+import logging
+import time
+
+PORT = 47100
+SEQUENTIAL = 5_000
+PIPELINED = 50_000
+PIPELINE_DEPTH = 1_000
+
+async def start(uid, ip):
+    transport = TcpTransport(EventBus())
+    transport.set_uid(uid)
+    transport.set_addr(ip)
+    transport.set_port(PORT)
+    asyncio.create_task(transport.start())
+    await asyncio.sleep(0.1)
+    return transport
+
+async def echo(payload, uid):
+    return payload
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+async def main():
+    client = await start('client', '127.0.0.1')
+    server = await start('server', '127.0.0.2')
+    server.register_handler('echo', echo)
+    await client.event_bus.publish(NodeDiscoveredEvent('server', {'ip': '127.0.0.2'}))
+    while 'server' not in client.peers or client.peers.get('server').codec is None:
+        await asyncio.sleep(0.01)
+
+    payload = {'id': 1, 'value': 'x' * 64}
+    latencies = []
+    for _ in range(SEQUENTIAL):
+        started = time.perf_counter()
+        await client.request('server', 'echo', payload)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    print(f'sequential: {SEQUENTIAL} requests, p50 {percentile(latencies, 0.5) * 1e6:.0f} us, '
+          f'p99 {percentile(latencies, 0.99) * 1e6:.0f} us')
+
+    started = time.perf_counter()
+    for _ in range(PIPELINED // PIPELINE_DEPTH):
+        await asyncio.gather(*(client.request('server', 'echo', payload) for _ in range(PIPELINE_DEPTH)))
+    elapsed = time.perf_counter() - started
+    print(f'pipelined:  {PIPELINED} requests (depth {PIPELINE_DEPTH}) in {elapsed:.2f}s, '
+          f'{PIPELINED / elapsed:,.0f} req/s')
+
+    await client.stop()
+    await server.stop()
+
+if __name__ == '__main__':
+    logging.disable(logging.WARNING)
+    asyncio.run(main())
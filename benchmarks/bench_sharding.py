@@ -0,0 +1,110 @@
+"""
+Messages per second through a ShardedTransport with 1..N worker processes.
+
+SENDERS sender processes, each with its own TcpTransport on a separate
+loopback address, flood the sharded node with messages. Every message is
+handled inside the worker that owns the connection (JSON round trip and a
+SHA-256 of the payload, standing in for application work). Workers count
+handled messages in shared memory; the run ends when all have arrived.
+
+Scaling needs as many free cores as workers plus senders.
+
+Run from the repository root (Linux routes all of 127.0.0.0/8 locally):
+    python benchmarks/bench_sharding.py [max_workers]
+"""
+from p2p_networking.events import EventBus, MessageReceivedEvent, NodeDiscoveredEvent
+from p2p_networking.sharding import ShardedTransport
+from p2p_networking.tcp_transport import TcpTransport
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+PORT = 47400
+SENDERS = 8
+MESSAGES_PER_SENDER = 20_000
+PAYLOAD = {'kind': 'update', 'values': list(range(32)), 'text': 'x' * 256}
+
+def count_messages(counters, transport, event_bus, shard):
+    # Runs inside each worker process.
+    logging.disable(logging.WARNING)
+
+    async def on_message(event):
+        body = json.dumps(event.message.data).encode()
+        hashlib.sha256(body).digest()
+        counters[shard] += 1
+
+    event_bus.subscribe(MessageReceivedEvent, on_message)
+
+def sender_main(index: int, port: int, start):
+    logging.disable(logging.WARNING)
+
+    async def run():
+        transport = TcpTransport(EventBus())
+        transport.set_uid(f'sender-{index:03}')
+        transport.set_addr(f'127.0.1.{index + 1}')
+        transport.set_port(port)
+        server = asyncio.create_task(transport.start())
+        await asyncio.sleep(0.1)
+        await transport.event_bus.publish(NodeDiscoveredEvent('receiver', {'ip': '127.0.0.1'}))
+        while 'receiver' not in transport.peers or transport.peers.get('receiver').codec is None:
+            await asyncio.sleep(0.01)
+        start.wait()
+        for _ in range(MESSAGES_PER_SENDER):
+            await transport.send_to_peer('receiver', PAYLOAD)
+        while transport.peers.get('receiver') and transport.peers.get('receiver').send_queue.queued_messages:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(1.0)
+        await transport.stop()
+        server.cancel()
+
+    asyncio.run(run())
+
+async def run(workers: int, port: int) -> float:
+    context = multiprocessing.get_context('spawn')
+    counters = context.Array('q', workers, lock=False)
+    transport = ShardedTransport(EventBus(), workers=workers, forward_messages=False,
+                                 worker_setup=functools.partial(count_messages, counters))
+    transport.set_uid('receiver')
+    transport.set_addr('127.0.0.1')
+    transport.set_port(port)
+    server = asyncio.create_task(transport.start())
+    while not all(shard.is_ready for shard in transport._shards) or len(transport._shards) < workers:
+        await asyncio.sleep(0.05)
+    start = context.Event()
+    senders = [context.Process(target=sender_main, args=(index, port, start), daemon=True) for index in range(SENDERS)]
+    for process in senders:
+        process.start()
+    while len(transport.routes) < SENDERS:
+        await asyncio.sleep(0.05)
+    total = SENDERS * MESSAGES_PER_SENDER
+    started = time.perf_counter()
+    start.set()
+    while sum(counters) < total:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    per_shard = list(counters)
+    for process in senders:
+        process.join()
+    await transport.stop()
+    server.cancel()
+    print(f'{workers:2} workers: {total / elapsed:10,.0f} msg/s   per worker {per_shard}')
+    return total / elapsed
+
+async def main():
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count() or 1
+    print(f'{os.cpu_count()} CPUs, {SENDERS} senders x {MESSAGES_PER_SENDER} messages')
+    baseline = None
+    for workers in range(1, max_workers + 1):
+        rate = await run(workers, PORT + workers)
+        baseline = baseline or rate
+        print(f'            speedup x{rate / baseline:.2f}')
+
+if __name__ == '__main__':
+    logging.disable(logging.WARNING)
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+"""
+Benchmark of SweepDiscovery over loopback subnets from /24 to /16.
+
+A handful of responders are bound to addresses inside 127.1.0.0/16 and
+answer probes with a hello; every other address stays silent. Each
+subnet is swept twice: the first pass probes every address, the second
+only re-probes known nodes because silent hosts are in backoff.
+
+Run from the repository root (Linux routes all of 127.0.0.0/8 locally):
+    python benchmarks/bench_sweep.py
+"""
+from p2p_networking.broadcast_discovery import encode_announcement, decode_announcement
+from p2p_networking.events import EventBus
+from p2p_networking.net import Net
+from p2p_networking.sweep_discovery import SweepDiscovery
+import asyncio
+import logging
+import random
+
+PORT = 47000
+RESPONDERS = 8
+PROBE_TIMEOUT = 0.2
+RATE_LIMIT = 50_000
+CONCURRENCY = 4096
+
+class Responder(asyncio.DatagramProtocol):
+
+    def __init__(self, uid, ip):
+        self.hello = bytes(encode_announcement('hello', uid, ip, 1, 1, 10))
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if decode_announcement(data).action == 'probe':
+            self.transport.sendto(self.hello, addr)
+
+async def run(prefix, responders):
+    event_bus = EventBus()
+    sweeper = SweepDiscovery(event_bus, Net(('127.1.0.1', str(prefix))), probe_port=PORT,
+                             concurrency=CONCURRENCY, rate_limit=RATE_LIMIT)
+    sweeper.PROBE_TIMEOUT = PROBE_TIMEOUT
+    sweeper.set_uid('sweeper')
+    sweeper.set_addr('127.0.0.1')
+    sweeper.set_port(PORT + 1)
+    await sweeper.start()
+    sweeper.sweep_task.cancel()
+    try:
+        for name in ('first sweep', 'second sweep'):
+            stats = await sweeper.sweep()
+            print(f"/{prefix:<3} {name:13} probed {stats['probed']:6} cached {stats['cached']:6} "
+                  f"found {len(sweeper.discovered_nodes):2}/{len(responders)}  "
+                  f"{stats['duration']:7.2f} s  {stats['probes_per_second']:8.0f} probes/s")
+    finally:
+        await sweeper.stop()
+        await event_bus.close()
+
+async def main():
+    logging.disable(logging.INFO)
+    loop = asyncio.get_running_loop()
+    random.seed(1)
+    for prefix in (24, 22, 20, 18, 16):
+        net = Net(('127.1.0.1', str(prefix)))
+        ips = [net[i] for i in random.sample(range(1, len(net) - 1), RESPONDERS)]
+        transports = []
+        for i, ip in enumerate(ips):
+            transport, _ = await loop.create_datagram_endpoint(lambda ip=ip, i=i: Responder(f'node-{i}', ip), local_addr=(ip, PORT))
+            transports.append(transport)
+        try:
+            await run(prefix, ips)
+        finally:
+            for transport in transports:
+                transport.close()
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+"""
+Benchmark of time to the first connected peer after a node restarts.
+
+PEERS nodes are already running. Their announcements reach the starting
+node after a uniform random delay of up to BROADCAST_INTERVAL seconds,
+i.e. whenever each of them sends its next periodic hello. A cold start has
+an empty peer cache and has to wait for those announcements. A warm start
+dials the peers from the cache written by the previous run.
+
+Run from the repository root (Linux routes all of 127.0.0.0/8 locally):
+    python benchmarks/bench_warm_start.py
+"""
+from p2p_networking.abstract_classes import Discovery
+from p2p_networking.broadcast_discovery import BroadcastManager
+from p2p_networking.events import EventBus, PeerConnectedEvent
+from p2p_networking.node import Node
+from p2p_networking.tcp_transport import TcpTransport
+import asyncio
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+
+PORT = 47300
+PEERS = 16
+ROUNDS = 3
+BROADCAST_INTERVAL = BroadcastManager.BROADCAST_INTERVAL
+
+class ScriptedDiscovery(Discovery):
+    """Reports every peer once, after a random delay of up to one broadcast interval."""
+
+    def __init__(self, event_bus, peers):
+        super().__init__(event_bus)
+        self.peers = peers
+        self.tasks = []
+
+    async def start(self):
+        self.tasks = [asyncio.create_task(self._announce(uid, ip)) for uid, ip in self.peers]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def _announce(self, uid, ip):
+        await asyncio.sleep(random.uniform(0, BROADCAST_INTERVAL))
+        await self.publish_node_discovered_event(uid, {'ip': ip})
+
+async def start_peers():
+    peers = []
+    for index in range(PEERS):
+        transport = TcpTransport(EventBus())
+        transport.set_uid(f'peer-{index:02}')
+        transport.set_addr(f'127.0.0.{index + 2}')
+        transport.set_port(PORT)
+        asyncio.create_task(transport.start())
+        peers.append(transport)
+    await asyncio.sleep(0.2)
+    return peers
+
+async def run_node(directory):
+    peers = await start_peers()
+    bus = EventBus()
+    connected = []
+    started = time.perf_counter()
+
+    async def on_connected(event):
+        connected.append(time.perf_counter() - started)
+    bus.subscribe(PeerConnectedEvent, on_connected)
+
+    discovery = ScriptedDiscovery(bus, [(peer.uid, peer.addr) for peer in peers])
+    node = type('BenchNode', (Node,), {'CONFIG_PATH': os.path.join(directory, 'config.ini')})(
+        ('127.0.0.1', '255.0.0.0'), TcpTransport(bus), discovery, bus)
+    await node.start_network()
+    while len(connected) < PEERS:
+        await asyncio.sleep(0.005)
+    await node.stop_network()
+    for peer in peers:
+        await peer.stop()
+    return connected[0], connected[-1]
+
+def write_config(directory):
+    with open(os.path.join(directory, 'config.ini'), 'w') as file:
+        file.write('[network]\n'
+                   f'DiscoveryPort = {PORT + 1}\n'
+                   f'TransportPort = {PORT}\n'
+                   'uid = starting-node\n'
+                   f'PeerCache = {os.path.join(directory, "peers.cache")}\n')
+
+async def main():
+    results = {'cold': [], 'warm': []}
+    for _ in range(ROUNDS):
+        with tempfile.TemporaryDirectory() as directory:
+            write_config(directory)
+            results['cold'].append(await run_node(directory))
+            results['warm'].append(await run_node(directory))
+    for name, samples in results.items():
+        first = statistics.median(sample[0] for sample in samples)
+        last = statistics.median(sample[1] for sample in samples)
+        print(f'{name}: first peer connected after {first * 1000:7.1f} ms, all {PEERS} after {last * 1000:7.1f} ms '
+              f'(median of {ROUNDS})')
+
+if __name__ == '__main__':
+    logging.disable(logging.WARNING)
+    asyncio.run(main())
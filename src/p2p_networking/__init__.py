@@ -1,19 +1,41 @@
 from .abstract_classes import Discovery, Transport
+from .connection_manager import ConnectionManager
+from .compression import Compressor, register_compressor, register_dictionary, available_compressors
 from .broadcast_discovery import BroadcastManager
-from .events import Event, EventBus, NodeDiscoveredEvent, NodeLostEvent, MessageReceivedEvent
+from .gossip_discovery import GossipDiscovery
+from .sweep_discovery import SweepDiscovery
+from .events import Event, EventBus, Subscription, NodeDiscoveredEvent, NodeLostEvent, MessageReceivedEvent, StreamOpenedEvent, PeerConnectedEvent, PeerDisconnectedEvent
+from .loop_monitor import LoopMonitor
 from .messages import Message, MessageFactory, SystemMessage, UserMessage
-from .net import Net
+from .net import Net, AddressRange
 from .node import Node
+from .peer_cache import PeerCache
+from .relay import Relay, SeenFilter
+from .reliable import ReliableSession
+from .rpc import RpcError, RemoteError, MethodNotFoundError, DeadlineExceededError
+from .sharding import ShardedTransport
+from .streams import Stream, StreamResetError
 from .tcp_transport import TcpTransport
 from .utils import get_main_local_ip
+from .wire import Codec, JsonCodec, StructCodec, MsgpackCodec, register_codec, get_codec, available_codecs
 
 __all__ = [
     'Discovery', 'Transport',
-    'BroadcastManager',
-    'Event', 'EventBus', 'NodeDiscoveredEvent', 'NodeLostEvent', 'MessageReceivedEvent',
+    'Compressor', 'register_compressor', 'register_dictionary', 'available_compressors',
+    'ConnectionManager',
+    'BroadcastManager', 'GossipDiscovery', 'SweepDiscovery',
+    'Event', 'EventBus', 'Subscription', 'NodeDiscoveredEvent', 'NodeLostEvent', 'MessageReceivedEvent', 'StreamOpenedEvent', 'PeerConnectedEvent', 'PeerDisconnectedEvent',
     'Message', 'MessageFactory', 'SystemMessage', 'UserMessage',
-    'Net',
+    'Net', 'AddressRange',
     'Node',
+    'ReliableSession',
+    'RpcError', 'RemoteError', 'MethodNotFoundError', 'DeadlineExceededError',
+    'ShardedTransport',
+    'Stream', 'StreamResetError',
+    'LoopMonitor',
+    'PeerCache',
+    'Relay', 'SeenFilter',
     'TcpTransport',
-    'get_main_local_ip'
+    'get_main_local_ip',
+    'Codec', 'JsonCodec', 'StructCodec', 'MsgpackCodec', 'register_codec', 'get_codec', 'available_codecs'
 ]
\ No newline at end of file
@@ -2,6 +2,9 @@ from abc import ABC, abstractmethod
 from typing import Any
 from p2p_networking import events
 from p2p_networking import messages
+from p2p_networking import metrics
+
+DISCOVERY_EVENTS = metrics.counter('p2p_discovery_events_total', 'Nodes reported found or lost by discovery', ('event',))
 
 class Discovery(ABC):
 
@@ -25,10 +28,14 @@ class Discovery(ABC):
 
     async def publish_node_discovered_event(self, uid: str, nodedata: dict[str, Any]) -> None:
         event = events.NodeDiscoveredEvent(uid, nodedata)
+        if metrics.enabled:
+            DISCOVERY_EVENTS.inc(1, ('discovered',))
         await self.event_bus.publish(event)
 
     async def publish_node_lost_event(self, uid: str) -> None:
         event = events.NodeLostEvent(uid)
+        if metrics.enabled:
+            DISCOVERY_EVENTS.inc(1, ('lost',))
         await self.event_bus.publish(event)
 
     def set_uid(self, uid: str) -> None:
@@ -57,11 +64,23 @@ class Transport(ABC):
         pass
 
     @abstractmethod
-    async def send_to_peer(self, uid: str, message: str) -> None:
+    async def send_to_peer(self, uid: str, message: str, channel: int = 0) -> bool:
+        pass
+
+    @abstractmethod
+    async def send_to_many(self, uids: list[str], message: str, *, channel: int = 0, timeout: float = None) -> dict[str, bool]:
+        pass
+
+    @abstractmethod
+    async def broadcast(self, message: str, *, channel: int = 0, timeout: float = None) -> dict[str, bool]:
+        pass
+
+    def dial_cached_peer(self, uid: str, ip: str) -> None:
+        """Соединение с узлом из кэша до его обнаружения; транспорт может это не поддерживать."""
         pass
 
     async def publish_message_received_event(self, message:messages.Message, uid: str) -> None:
-        event = events.MessageReceivedEvent(message, uid)
+        event = events.MessageReceivedEvent(message, uid, message.channel)
         await self.event_bus.publish(event)
 
     def set_uid(self, uid: str) -> None:
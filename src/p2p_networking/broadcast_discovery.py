@@ -1,13 +1,78 @@
 from p2p_networking.abstract_classes import Discovery
 from p2p_networking import events
+from p2p_networking import metrics
+from p2p_networking.expiry import ExpiryIndex
 import asyncio
 import socket
 import logging
+from collections import deque
 import json
+import struct
 import time
+import weakref
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Binary announcement: magic, version, action, sequence number, incarnation,
+# announce interval in deciseconds, IPv4 address, uid length, uid.
+ANNOUNCE_MAGIC = b'P2'
+ANNOUNCE_VERSION = 1
+_ANNOUNCE_HEADER = struct.Struct('>2sBBIIH4sB')
+_SEQ_OFFSET = 4
+_INTERVAL_OFFSET = 12
+_ACTION_CODES = {'hello': 1, 'bye': 2, 'probe': 3}
+_ACTION_NAMES = {code: name for name, code in _ACTION_CODES.items()}
+
+PACKETS_SENT = metrics.counter('p2p_discovery_packets_sent_total', 'Discovery announcements sent')
+PACKETS_RECEIVED = metrics.counter('p2p_discovery_packets_received_total', 'Discovery announcements received', ('action',))
+DUPLICATES_DROPPED = metrics.counter('p2p_discovery_duplicates_total', 'Duplicate or reordered announcements dropped')
+DISCOVERED_NODES = metrics.gauge('p2p_discovered_nodes', 'Nodes currently known to broadcast discovery')
+
+_managers = weakref.WeakSet()
+DISCOVERED_NODES.set_function(lambda: sum(len(manager.discovered_nodes) for manager in list(_managers)))
+
+class Announcement:
+
+    def __init__(self, action: str, uid: str, ip: str, seq: int = None, incarnation: int = None, interval: float = None):
+        self.action = action
+        self.uid = uid
+        self.ip = ip
+        self.seq = seq
+        self.incarnation = incarnation
+        self.interval = interval
+
+def encode_announcement(action: str, uid: str, ip: str, seq: int, incarnation: int, interval: float) -> bytearray:
+    raw_uid = uid.encode()
+    datagram = bytearray(_ANNOUNCE_HEADER.size + len(raw_uid))
+    _ANNOUNCE_HEADER.pack_into(datagram, 0, ANNOUNCE_MAGIC, ANNOUNCE_VERSION, _ACTION_CODES[action],
+                               seq & 0xFFFFFFFF, incarnation & 0xFFFFFFFF, min(int(interval * 10), 0xFFFF),
+                               socket.inet_aton(ip), len(raw_uid))
+    datagram[_ANNOUNCE_HEADER.size:] = raw_uid
+    return datagram
+
+def decode_announcement(data: bytes) -> Announcement:
+    """
+    Разбирает анонс в бинарном формате или в устаревшем JSON.
+
+    Raises:
+        ValueError: Если датаграмма повреждена.
+    """
+    if data[:2] == ANNOUNCE_MAGIC:
+        if len(data) < _ANNOUNCE_HEADER.size:
+            raise ValueError('Truncated announcement')
+        _, version, action, seq, incarnation, interval, ip, uid_length = _ANNOUNCE_HEADER.unpack_from(data)
+        if version != ANNOUNCE_VERSION:
+            raise ValueError(f'Unsupported announcement version: {version}')
+        if action not in _ACTION_NAMES:
+            raise ValueError(f'Unknown announcement action: {action}')
+        uid = bytes(data[_ANNOUNCE_HEADER.size:_ANNOUNCE_HEADER.size + uid_length]).decode()
+        return Announcement(_ACTION_NAMES[action], uid, socket.inet_ntoa(ip), seq, incarnation, interval / 10)
+    try:
+        message = json.loads(data)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError(f'incorrect JSON: {e}')
+    return Announcement(message.get('action'), message.get('id'), message.get('ip'))
+
 class UDPProtocol(asyncio.DatagramProtocol):
 
     def __init__(self, on_datagram_received, transport_ready):
@@ -29,8 +94,7 @@ class UDPProtocol(asyncio.DatagramProtocol):
             logging.exception(f'[UDP Protocol] unexpected error: {e}')
 
     def datagram_received(self, data, addr):
-        message = data.decode()
-        self.on_datagram_received(message, addr)
+        self.on_datagram_received(data, addr)
 
     def error_received(self, exc):
         logging.error(f"[UDP Protocol] Error received: {exc}")
@@ -45,17 +109,42 @@ class BroadcastManager(Discovery):
     KEY_IP = 'ip'
     KEY_ACTION = 'action'
     BROADCAST_INTERVAL = 10
-    CLEANUP_INTERVAL = 10
+    MIN_BROADCAST_INTERVAL = 1
+    BACKOFF_FACTOR = 2
     NODE_TIMEOUT = 30
+    MISSED_ANNOUNCEMENTS = 3
+    MIN_NODE_TIMEOUT = 3
+    # Nodes that predate binary announcements only parse JSON, so JSON stays the default until
+    # every node on the network is upgraded; then switch to datagram_format='binary'.
+    DATAGRAM_FORMAT = 'json'
+    STATS_WINDOW = 60
 
-    def __init__(self, broadcast_addr: "None | str", event_bus: events.EventBus):
+    def __init__(self, broadcast_addr: "None | str", event_bus: events.EventBus, datagram_format: str = None):
         super().__init__(event_bus)
         self.broadcast_address = broadcast_addr
+        self.datagram_format = datagram_format or self.DATAGRAM_FORMAT
+        if self.datagram_format not in ('binary', 'json'):
+            raise ValueError(f'Unknown datagram format: {self.datagram_format}')
         self.transport = None
         self.protocol_instance = None
         self.sending_task: asyncio.Task = None
         self.cleaning_task: asyncio.Task = None
         self.lock = asyncio.Lock()
+        self.interval = self.MIN_BROADCAST_INTERVAL
+        self.incarnation = 0
+        self.seq = 0
+        self.packets_sent = 0
+        self.packets_received = 0
+        self.duplicates_dropped = 0
+        self._hello_datagram = None
+        self._bye_datagram = None
+        self._last_seq = {}
+        self._membership_changed = asyncio.Event()
+        self._expiry = ExpiryIndex()
+        self._expiry_changed = asyncio.Event()
+        self._sent_times = deque()
+        self._loss_latencies = deque(maxlen=1000)
+        _managers.add(self)
     
     def set_broadcast_addr(self, addr: str):
         self.broadcast_address = addr
@@ -63,6 +152,8 @@ class BroadcastManager(Discovery):
     async def start(self):
         loop = asyncio.get_running_loop()
         if self.broadcast_address is not None and self.addr is not None:
+            self.incarnation = int(time.time())
+            self._build_datagrams()
             transport_ready = loop.create_future()
             self.transport, self.protocol_instance = await loop.create_datagram_endpoint(
                 lambda: UDPProtocol(self._on_datagram_received, transport_ready),
@@ -100,40 +191,101 @@ class BroadcastManager(Discovery):
             self.sending_task = None
             self.cleaning_task = None
 
-    async def _send_message(self, message:str):
+    def _build_datagrams(self):
+        if self.datagram_format == 'binary':
+            self._hello_datagram = encode_announcement('hello', self.uid, self.addr, 0, self.incarnation, self.interval)
+            self._bye_datagram = encode_announcement('bye', self.uid, self.addr, 0, self.incarnation, 0)
+        else:
+            self._hello_datagram = json.dumps({self.KEY_ACTION: 'hello', self.KEY_ID: self.uid, self.KEY_IP: self.addr}).encode()
+            self._bye_datagram = json.dumps({self.KEY_ACTION: 'bye', self.KEY_ID: self.uid, self.KEY_IP: self.addr}).encode()
+
+    def _stamp(self, datagram, interval: float):
+        # Only the sequence number and interval change between announcements.
+        if self.datagram_format == 'binary':
+            self.seq += 1
+            struct.pack_into('>I', datagram, _SEQ_OFFSET, self.seq & 0xFFFFFFFF)
+            struct.pack_into('>H', datagram, _INTERVAL_OFFSET, min(int(interval * 10), 0xFFFF))
+        return datagram
+
+    async def _send_message(self, message):
         if not self.transport:
             return
         try:
-            self.transport.sendto(message.encode(),(self.broadcast_address, self.port))
+            self.transport.sendto(message, (self.broadcast_address, self.port))
+            self.packets_sent += 1
+            if metrics.enabled:
+                PACKETS_SENT.inc()
+            self._sent_times.append(time.monotonic())
         except Exception as e:
             logging.exception(f'[Broadcast Manager] unexpected error: {e}')
 
+    def _answer_probe(self, addr):
+        # Unicast sweeps (SweepDiscovery) probe hosts directly; reply with a hello.
+        if not self.transport:
+            return
+        try:
+            self.transport.sendto(self._stamp(self._hello_datagram, self.interval), addr)
+            self.packets_sent += 1
+            if metrics.enabled:
+                PACKETS_SENT.inc()
+        except Exception as e:
+            logging.exception(f'[Broadcast Manager] unexpected error: {e}')
+
+    def _node_timeout(self, announcement: Announcement) -> float:
+        if not announcement.interval:
+            return self.NODE_TIMEOUT
+        return max(self.MISSED_ANNOUNCEMENTS * announcement.interval, self.MIN_NODE_TIMEOUT)
+
+    def _is_duplicate(self, announcement: Announcement) -> bool:
+        if announcement.seq is None:
+            return False
+        key = (announcement.incarnation, announcement.seq)
+        last = self._last_seq.get(announcement.uid)
+        if last is not None and key <= last:
+            return True
+        self._last_seq[announcement.uid] = key
+        return False
+
     def _on_datagram_received(self, message, addr):
         try:
-            data = json.loads(message)
-            action = data.get(self.KEY_ACTION)
-            uid = data.get(self.KEY_ID)
-            ip = data.get(self.KEY_IP)
-            node_data = {self.KEY_IP: ip, 'last_seen': time.time()}
+            announcement = decode_announcement(message)
+            uid = announcement.uid
+            ip = announcement.ip
             if uid and ip and uid != self.uid:
-                if action == 'hello':
+                if metrics.enabled:
+                    PACKETS_RECEIVED.inc(1, (announcement.action,))
+                if announcement.action == 'probe':
+                    self._answer_probe(addr)
+                    return
+                self.packets_received += 1
+                if self._is_duplicate(announcement):
+                    self.duplicates_dropped += 1
+                    if metrics.enabled:
+                        DUPLICATES_DROPPED.inc()
+                    return
+                if announcement.action == 'hello':
+                    now = time.time()
+                    node_data = {self.KEY_IP: ip, 'last_seen': now, 'expires_at': now + self._node_timeout(announcement)}
                     asyncio.create_task(self._update_nodes(uid, node_data))
-                elif action == 'bye':
+                elif announcement.action == 'bye':
                     asyncio.create_task(self._delete_node(uid))
                     logging.info(f'[Broadcast Manager] Received a farewell message from {uid}')
-        except json.JSONDecodeError:
-            logging.warning(f'[Broadcast Manager] incorrect JSON in message from {addr}: {message}')
-        except KeyError as e:
-            logging.warning(f'[Broadcast Manager] Expected field {e} missing in message from {addr}: {message}')
+        except ValueError as e:
+            logging.warning(f'[Broadcast Manager] {e} in message from {addr}: {message}')
         except Exception as e:
             logging.error(f'[Broadcast Manager] unexpected error processing message from {addr}: {e}')
+
+    def _on_membership_changed(self):
+        self._membership_changed.set()
     
     async def _delete_node(self, uid):
-        node_info = self.discovered_nodes.get(uid, None)
+        async with self.lock:
+            node_info = self.discovered_nodes.pop(uid, None)
+            self._expiry.discard(uid)
+            self._last_seq.pop(uid, None)
         if node_info:
-            async with self.lock:
-                del self.discovered_nodes[uid]
             logging.info(f"[Broadcast Manager] Node {uid} was deleted from the list")
+            self._on_membership_changed()
             await self.publish_node_lost_event(uid)
         else:
             logging.warning(f"[Broadcast Manager] Attempt to delete non-existent node: {uid}.")
@@ -142,41 +294,75 @@ class BroadcastManager(Discovery):
         async with self.lock:
             is_new_node = uid not in self.discovered_nodes
             self.discovered_nodes[uid] = node_data
+            if self._expiry.set(uid, node_data['expires_at']):
+                self._expiry_changed.set()
         node_info = {self.KEY_IP: node_data[self.KEY_IP]}
         if is_new_node:
+            self._on_membership_changed()
             await self.publish_node_discovered_event(uid, node_info)
             logging.info(f"[Broadcast Manager] Discovered the new node {uid}. Total: {len(self.discovered_nodes)}")
 
     async def _say_goodbye(self):
-        message_data = {
-            self.KEY_ACTION: 'bye',
-            self.KEY_ID: self.uid,
-            self.KEY_IP: self.addr
-        }
-        message = json.dumps(message_data)
         try:
             for _ in range(3):    
-                await self._send_message(message)
+                await self._send_message(self._stamp(self._bye_datagram, 0))
                 await asyncio.sleep(0.3)
         except Exception as e:
             logging.warning(f"[Broadcast Manager] Failed to send goodbye message: {e}")
 
     async def _schedule_broadcasts(self):
         while True:
-            message_data = {
-                self.KEY_ACTION: 'hello',
-                self.KEY_ID: self.uid,
-                self.KEY_IP: self.addr
-            }
-            message = json.dumps(message_data)
-            await self._send_message(message)
-            await asyncio.sleep(self.BROADCAST_INTERVAL)
+            await self._send_message(self._stamp(self._hello_datagram, self.interval))
+            self._membership_changed.clear()
+            try:
+                await asyncio.wait_for(self._membership_changed.wait(), self.interval)
+                # Membership is changing: announce quickly so new nodes learn about us.
+                self.interval = self.MIN_BROADCAST_INTERVAL
+                await asyncio.sleep(self.MIN_BROADCAST_INTERVAL)
+            except asyncio.TimeoutError:
+                self.interval = min(self.interval * self.BACKOFF_FACTOR, self.BROADCAST_INTERVAL)
+
+    def get_stats(self) -> dict:
+        now = time.monotonic()
+        while self._sent_times and now - self._sent_times[0] > self.STATS_WINDOW:
+            self._sent_times.popleft()
+        latencies = sorted(self._loss_latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))]
+
+        return {
+            'interval': self.interval,
+            'packets_sent': self.packets_sent,
+            'packets_per_minute': len(self._sent_times) * 60 / self.STATS_WINDOW,
+            'packets_received': self.packets_received,
+            'duplicates_dropped': self.duplicates_dropped,
+            'nodes': len(self.discovered_nodes),
+            'loss_detection_latency': {'p50': percentile(50), 'p90': percentile(90), 'p99': percentile(99)},
+        }
 
     async def _cleanup_nodes(self):
         while True:
             current_time = time.time()
             async with self.lock:
-                expired = [uid for uid, data in self.discovered_nodes.items() if current_time - data['last_seen'] > self.NODE_TIMEOUT]
-                for uid in expired:
-                    await self._delete_node(uid)
-            await asyncio.sleep(self.CLEANUP_INTERVAL)
\ No newline at end of file
+                expired = []
+                for uid in self._expiry.pop_expired(current_time):
+                    self._last_seq.pop(uid, None)
+                    node_info = self.discovered_nodes.pop(uid, None)
+                    if node_info:
+                        expired.append((uid, node_info))
+            # Lost-node events are published only after the lock is released.
+            for uid, node_info in expired:
+                self._loss_latencies.append(current_time - node_info['last_seen'])
+                logging.info(f"[Broadcast Manager] Node {uid} expired and was deleted from the list")
+                self._on_membership_changed()
+                await self.publish_node_lost_event(uid)
+            self._expiry_changed.clear()
+            deadline = self._expiry.next_deadline()
+            timeout = None if deadline is None else max(0.0, deadline - time.time())
+            try:
+                await asyncio.wait_for(self._expiry_changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,321 @@
+import lzma
+import struct
+import threading
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+# Compressed frame body (after the wire header, when FLAG_COMPRESSED is set):
+#   byte 0:   compressor id (low 7 bits) | DICTIONARY_BIT
+#   4 bytes:  dictionary id, present only when DICTIONARY_BIT is set
+#   rest:     compressed codec output
+DICTIONARY_BIT = 0x80
+_DICTIONARY_ID = struct.Struct('>I')
+
+MAX_DECOMPRESSED_SIZE = 16 * 1024 * 1024
+
+
+class Compressor:
+    name = None
+    id = None
+    priority = 0
+    supports_dictionary = False
+
+    def compress(self, data, dictionary: bytes = None) -> bytes:
+        raise NotImplementedError("Subclasses must implement compress")
+
+    def decompress(self, data, max_size: int, dictionary: bytes = None) -> bytes:
+        raise NotImplementedError("Subclasses must implement decompress")
+
+
+class ZlibCompressor(Compressor):
+    name = 'zlib'
+    id = 1
+    priority = 10
+    supports_dictionary = True
+    LEVEL = 6
+
+    def compress(self, data, dictionary: bytes = None) -> bytes:
+        if dictionary is None:
+            return zlib.compress(data, self.LEVEL)
+        compressor = zlib.compressobj(self.LEVEL, zlib.DEFLATED, zlib.MAX_WBITS, zdict=dictionary)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data, max_size: int, dictionary: bytes = None) -> bytes:
+        decompressor = zlib.decompressobj(zdict=dictionary) if dictionary is not None else zlib.decompressobj()
+        result = decompressor.decompress(data, max_size)
+        if decompressor.unconsumed_tail:
+            raise ValueError(f'Decompressed frame exceeds {max_size} bytes')
+        return result
+
+
+class LzmaCompressor(Compressor):
+    """Лучшее сжатие ценой заметно большего времени CPU; подходит для медленных каналов."""
+    name = 'lzma'
+    id = 2
+    priority = 0
+    PRESET = 1
+
+    def compress(self, data, dictionary: bytes = None) -> bytes:
+        return lzma.compress(data, format=lzma.FORMAT_XZ, preset=self.PRESET)
+
+    def decompress(self, data, max_size: int, dictionary: bytes = None) -> bytes:
+        decompressor = lzma.LZMADecompressor()
+        result = decompressor.decompress(data, max_size)
+        if not decompressor.eof:
+            raise ValueError(f'Decompressed frame exceeds {max_size} bytes')
+        return result
+
+
+class ZstdCompressor(Compressor):
+    name = 'zstd'
+    id = 3
+    priority = 30
+    supports_dictionary = True
+    LEVEL = 3
+
+    def __init__(self):
+        # zstd contexts must not be shared between threads, and large frames are decoded off the event loop.
+        self._local = threading.local()
+
+    def _contexts(self, kind: str) -> dict:
+        contexts = getattr(self._local, kind, None)
+        if contexts is None:
+            contexts = {}
+            setattr(self._local, kind, contexts)
+        return contexts
+
+    def _dict(self, dictionary: bytes):
+        return zstandard.ZstdCompressionDict(dictionary) if dictionary is not None else None
+
+    def compress(self, data, dictionary: bytes = None) -> bytes:
+        compressors = self._contexts('compressors')
+        compressor = compressors.get(dictionary)
+        if compressor is None:
+            compressor = compressors[dictionary] = zstandard.ZstdCompressor(level=self.LEVEL, dict_data=self._dict(dictionary))
+        return compressor.compress(data)
+
+    def decompress(self, data, max_size: int, dictionary: bytes = None) -> bytes:
+        decompressors = self._contexts('decompressors')
+        decompressor = decompressors.get(dictionary)
+        if decompressor is None:
+            decompressor = decompressors[dictionary] = zstandard.ZstdDecompressor(dict_data=self._dict(dictionary))
+        try:
+            return decompressor.decompress(data, max_output_size=max_size)
+        except zstandard.ZstdError as e:
+            raise ValueError(f'Malformed zstd frame: {e}')
+
+
+class Lz4Compressor(Compressor):
+    name = 'lz4'
+    id = 4
+    priority = 20
+
+    def compress(self, data, dictionary: bytes = None) -> bytes:
+        return lz4_frame.compress(data)
+
+    def decompress(self, data, max_size: int, dictionary: bytes = None) -> bytes:
+        decompressor = lz4_frame.LZ4FrameDecompressor()
+        result = decompressor.decompress(bytes(data), max_length=max_size)
+        if not decompressor.eof:
+            raise ValueError(f'Decompressed frame exceeds {max_size} bytes')
+        return result
+
+
+_compressors_by_name = {}
+_compressors_by_id = {}
+_dictionaries = {}
+
+
+def register_compressor(compressor: Compressor) -> None:
+    if compressor.name is None or compressor.id is None:
+        raise ValueError('Compressor must define name and id')
+    if not 0 < compressor.id < DICTIONARY_BIT:
+        raise ValueError('Compressor id must fit in 7 bits and not be zero')
+    existing = _compressors_by_id.get(compressor.id)
+    if existing is not None and existing.name != compressor.name:
+        raise ValueError(f'Compressor id {compressor.id} is already taken by {existing.name}')
+    _compressors_by_name[compressor.name] = compressor
+    _compressors_by_id[compressor.id] = compressor
+
+
+def get_compressor(name: str) -> "Compressor | None":
+    return _compressors_by_name.get(name)
+
+
+def available_compressors() -> list[str]:
+    compressors = sorted(_compressors_by_name.values(), key=lambda compressor: compressor.priority, reverse=True)
+    return [compressor.name for compressor in compressors]
+
+
+def register_dictionary(data: bytes) -> int:
+    """
+    Регистрирует общий словарь сжатия и возвращает его идентификатор.
+
+    Идентификатор вычисляется из содержимого, поэтому узлы с одинаковыми
+    словарями получают одинаковые идентификаторы и могут договориться о них.
+    """
+    dictionary_id = zlib.crc32(data)
+    _dictionaries[dictionary_id] = bytes(data)
+    return dictionary_id
+
+
+def get_dictionary(dictionary_id: int) -> "bytes | None":
+    return _dictionaries.get(dictionary_id)
+
+
+def available_dictionaries() -> list[int]:
+    return list(_dictionaries)
+
+
+def negotiate(offered: list, supported: list, offered_dictionaries: list = None) -> tuple:
+    """
+    Выбирает первый общий алгоритм из предложенных инициатором и общий словарь,
+    если алгоритм их поддерживает. Возвращает (имя алгоритма | None, id словаря | None).
+    """
+    for name in offered:
+        compressor = _compressors_by_name.get(name)
+        if name in supported and compressor is not None:
+            dictionary_id = None
+            if compressor.supports_dictionary:
+                dictionary_id = next((d for d in offered_dictionaries or [] if d in _dictionaries), None)
+            return name, dictionary_id
+    return None, None
+
+
+register_compressor(ZlibCompressor())
+register_compressor(LzmaCompressor())
+if zstandard is not None:
+    register_compressor(ZstdCompressor())
+if lz4_frame is not None:
+    register_compressor(Lz4Compressor())
+
+
+def decompress_body(body, max_size: int = MAX_DECOMPRESSED_SIZE) -> bytes:
+    """
+    Распаковывает тело сжатого кадра. Алгоритм и словарь указаны в самом кадре.
+
+    Raises:
+        ValueError: Если алгоритм или словарь неизвестны, или данные повреждены.
+    """
+    if not len(body):
+        raise ValueError('Empty compressed frame')
+    compressor = _compressors_by_id.get(body[0] & ~DICTIONARY_BIT)
+    if compressor is None:
+        raise ValueError(f'Unknown compressor id: {body[0] & ~DICTIONARY_BIT}')
+    offset = 1
+    dictionary = None
+    if body[0] & DICTIONARY_BIT:
+        if len(body) < 1 + _DICTIONARY_ID.size:
+            raise ValueError('Truncated compression dictionary id')
+        dictionary_id = _DICTIONARY_ID.unpack_from(body, 1)[0]
+        dictionary = _dictionaries.get(dictionary_id)
+        if dictionary is None:
+            raise ValueError(f'Unknown compression dictionary: {dictionary_id}')
+        offset += _DICTIONARY_ID.size
+    try:
+        return compressor.decompress(body[offset:], max_size, dictionary)
+    except (zlib.error, lzma.LZMAError, RuntimeError) as e:
+        raise ValueError(f'Malformed {compressor.name} frame: {e}')
+
+
+class FrameCompression:
+    """
+    Политика сжатия кадров одного соединения и её статистика.
+
+    Кадры меньше threshold не сжимаются. У больших кадров сначала сжимается
+    выборка SAMPLE_SIZE байтов: если она сжимается хуже MAX_RATIO, кадр
+    отправляется как есть. После каждого несжимаемого кадра следующие
+    кадры пропускаются без попытки сжатия, и число пропусков удваивается
+    до MAX_SKIP, пока сжатие снова не начнёт окупаться.
+    """
+
+    THRESHOLD = 512
+    SAMPLE_SIZE = 4096
+    MAX_RATIO = 0.9
+    MAX_SKIP = 64
+
+    def __init__(self, compressor: Compressor = None, dictionary_id: int = None, threshold: int = None):
+        self.compressor = compressor
+        self.dictionary_id = dictionary_id if compressor is not None and compressor.supports_dictionary else None
+        self.dictionary = get_dictionary(self.dictionary_id) if self.dictionary_id is not None else None
+        self.threshold = threshold if threshold is not None else self.THRESHOLD
+        self.frames_compressed = 0
+        self.frames_skipped = 0
+        self.frames_decompressed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.compress_time = 0.0
+        self.decompress_time = 0.0
+        self._prefix = b''
+        if compressor is not None:
+            if self.dictionary is not None:
+                self._prefix = bytes((compressor.id | DICTIONARY_BIT,)) + _DICTIONARY_ID.pack(self.dictionary_id)
+            else:
+                self._prefix = bytes((compressor.id,))
+        self._skip = 0
+        self._backoff = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.compressor is not None
+
+    def compress(self, body: bytes) -> "bytes | None":
+        """Возвращает сжатое тело с префиксом или None, если кадр лучше отправить как есть."""
+        if self.compressor is None or len(body) < self.threshold:
+            return None
+        if self._skip:
+            self._skip -= 1
+            self.frames_skipped += 1
+            return None
+        started = time.thread_time()
+        compressed = None
+        if len(body) < 2 * self.SAMPLE_SIZE or self._compresses(body[:self.SAMPLE_SIZE]):
+            compressed = self.compressor.compress(body, self.dictionary)
+            if len(compressed) + len(self._prefix) > len(body) * self.MAX_RATIO:
+                compressed = None
+        self.compress_time += time.thread_time() - started
+        if compressed is None:
+            self._backoff = min(max(1, self._backoff * 2), self.MAX_SKIP)
+            self._skip = self._backoff
+            self.frames_skipped += 1
+            return None
+        self._backoff = 0
+        self.frames_compressed += 1
+        self.bytes_in += len(body)
+        self.bytes_out += len(compressed) + len(self._prefix)
+        return self._prefix + compressed
+
+    def _compresses(self, sample) -> bool:
+        return len(self.compressor.compress(sample, self.dictionary)) <= len(sample) * self.MAX_RATIO
+
+    def decompress(self, body, max_size: int = MAX_DECOMPRESSED_SIZE) -> bytes:
+        started = time.thread_time()
+        try:
+            return decompress_body(body, max_size)
+        finally:
+            self.decompress_time += time.thread_time() - started
+            self.frames_decompressed += 1
+
+    def get_stats(self) -> dict:
+        return {
+            'compressor': self.compressor.name if self.compressor else None,
+            'dictionary': self.dictionary_id,
+            'frames_compressed': self.frames_compressed,
+            'frames_skipped': self.frames_skipped,
+            'frames_decompressed': self.frames_decompressed,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'ratio': self.bytes_out / self.bytes_in if self.bytes_in else None,
+            'compress_cpu_time': self.compress_time,
+            'decompress_cpu_time': self.decompress_time,
+        }
@@ -0,0 +1,227 @@
+from p2p_networking import events
+from p2p_networking import metrics
+from bisect import bisect_left, insort
+import asyncio
+import hashlib
+import logging
+import time
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+MANAGER_DIALS = metrics.counter('p2p_connection_manager_dials_total', 'Connections requested by the connection manager')
+MANAGER_PRUNED = metrics.counter('p2p_connection_manager_pruned_total', 'Connections closed by the connection manager', ('reason',))
+
+def rendezvous_score(a: str, b: str) -> int:
+    """Вес пары узлов; одинаков с обеих сторон, поэтому узлы чаще выбирают друг друга взаимно."""
+    first, second = (a, b) if a < b else (b, a)
+    return int.from_bytes(hashlib.blake2b(f'{first}\0{second}'.encode(), digest_size=8).digest(), 'big')
+
+class ConnectionManager:
+    """
+    Частичная сетка вместо полной: узел держит около degree соединений.
+
+    Узлы, известные от обнаружения, упорядочены по весу rendezvous-хеша
+    пары (свой uid, uid узла); узел соединяется с degree узлами с наибольшим
+    весом. Вес пары не зависит от остальных узлов, поэтому появление или
+    уход узла меняет выбор не больше чем на одно соединение, а нагрузка
+    распределяется между узлами равномерно. Место в упорядоченном списке
+    ищется за O(log N), но вставка и удаление сдвигают хвост списка, так
+    что обнаружение и потеря узла стоят O(N) (один memmove). Выбор стоит
+    O(degree) плюс число пропущенных узлов на паузе.
+
+    Соединения с узлами, которые перестали быть выбранными, закрываются
+    через prune_grace секунд, если их открыли мы; входящие соединения
+    ограничены max_inbound на стороне TcpTransport, а при превышении
+    общего предела degree + max_inbound закрываются невыбранные соединения
+    с наименьшим весом. Узел, до которого не удаётся достучаться (или
+    который отказывает из-за своего предела), на COOLDOWN секунд
+    заменяется следующим по весу.
+
+    Рассчитан на то, что так настроены все узлы: транспорт с
+    auto_connect=True сам переподключается к закрытым соединениям.
+    """
+
+    DEGREE = 8
+    MAINTENANCE_INTERVAL = 1.0
+    PRUNE_GRACE = 30.0
+    DIAL_ATTEMPTS = 3
+    FAILURES_BEFORE_COOLDOWN = 3
+    COOLDOWN = 60.0
+    STABLE_AFTER = 10.0
+
+    def __init__(self, transport, degree: int = None, max_inbound: int = None, prune_grace: float = None,
+                 maintenance_interval: float = None):
+        self.transport = transport
+        self.event_bus = transport.event_bus
+        self.degree = degree if degree is not None else self.DEGREE
+        if self.degree < 1:
+            raise ValueError('Degree must be positive')
+        self.max_inbound = max_inbound if max_inbound is not None else 2 * self.degree
+        self.prune_grace = prune_grace if prune_grace is not None else self.PRUNE_GRACE
+        self.maintenance_interval = maintenance_interval if maintenance_interval is not None else self.MAINTENANCE_INTERVAL
+        self.wanted = set()
+        self.stats = {'dials': 0, 'pruned_deselected': 0, 'pruned_over_limit': 0, 'cooldowns': 0}
+        self._ranking = []
+        self._scores = {}
+        self._addresses = {}
+        self._dialing = set()
+        self._failures = {}
+        self._cooldown_until = {}
+        self._connected_at = {}
+        self._deselected_at = {}
+        self._changed = asyncio.Event()
+        self._task: asyncio.Task = None
+        self._stopped = False
+        transport.auto_connect = False
+        transport.max_inbound = self.max_inbound
+        self.event_bus.subscribe(events.NodeDiscoveredEvent, self._on_node_discovered)
+        self.event_bus.subscribe(events.NodeLostEvent, self._on_node_lost)
+        self.event_bus.subscribe(events.PeerConnectedEvent, self._on_peer_connected)
+        self.event_bus.subscribe(events.PeerDisconnectedEvent, self._on_peer_disconnected)
+
+    @property
+    def max_connections(self) -> int:
+        return self.degree + self.max_inbound
+
+    def start(self):
+        self._stopped = False
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._stopped = True
+        if self._task:
+            # wait_for can swallow a cancel that races with the event; the flag ends the loop anyway.
+            self._changed.set()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _on_node_discovered(self, event: events.NodeDiscoveredEvent):
+        uid = event.node_id
+        ip = event.node_metadata.get('ip')
+        if uid == self.transport.uid or not ip:
+            return
+        self._addresses[uid] = ip
+        if uid not in self._scores:
+            score = self._scores[uid] = rendezvous_score(self.transport.uid, uid)
+            insort(self._ranking, (-score, uid))
+        self._changed.set()
+        if not self._stopped and self._task is None:
+            self.start()
+
+    async def _on_node_lost(self, event: events.NodeLostEvent):
+        uid = event.node_id
+        score = self._scores.pop(uid, None)
+        if score is not None:
+            index = bisect_left(self._ranking, (-score, uid))
+            del self._ranking[index]
+        for table in (self._addresses, self._failures, self._cooldown_until, self._connected_at, self._deselected_at):
+            table.pop(uid, None)
+        self._dialing.discard(uid)
+        self.wanted.discard(uid)
+        self._changed.set()
+
+    async def _on_peer_connected(self, event: events.PeerConnectedEvent):
+        self._connected_at[event.node_id] = time.monotonic()
+        self._dialing.discard(event.node_id)
+        self._changed.set()
+
+    async def _on_peer_disconnected(self, event: events.PeerDisconnectedEvent):
+        uid = event.node_id
+        connected_at = self._connected_at.pop(uid, None)
+        # A connection closed right after the handshake usually means the other side is full.
+        if connected_at is not None and time.monotonic() - connected_at < self.STABLE_AFTER and uid in self._scores:
+            self._record_failure(uid)
+        self._changed.set()
+
+    def _record_failure(self, uid: str):
+        failures = self._failures[uid] = self._failures.get(uid, 0) + 1
+        if failures >= self.FAILURES_BEFORE_COOLDOWN:
+            self._failures[uid] = 0
+            self._cooldown_until[uid] = time.monotonic() + self.COOLDOWN
+            self.stats['cooldowns'] += 1
+            logging.info(f'[ConnectionManager] [{uid}]: Unreachable, trying other peers for {self.COOLDOWN}s')
+
+    def _select(self, now: float) -> set:
+        wanted = set()
+        for _, uid in self._ranking:
+            if len(wanted) >= self.degree:
+                break
+            if self._cooldown_until.get(uid, 0) > now:
+                continue
+            wanted.add(uid)
+        return wanted
+
+    async def _run(self):
+        while not self._stopped:
+            try:
+                await asyncio.wait_for(self._changed.wait(), self.maintenance_interval)
+            except asyncio.TimeoutError:
+                pass
+            if self._stopped:
+                break
+            self._changed.clear()
+            try:
+                await self._rebalance()
+            except Exception as e:
+                logging.warning(f'[ConnectionManager] unexpected error: {e}')
+
+    async def _rebalance(self):
+        now = time.monotonic()
+        peers = self.transport.peers.snapshot()
+        for uid in list(self._dialing):
+            # DialScheduler gave up after DIAL_ATTEMPTS failures; selecting afterwards replaces the node right away.
+            if uid not in peers and not self.transport.dialer.is_pending(uid):
+                self._dialing.discard(uid)
+                for _ in range(self.FAILURES_BEFORE_COOLDOWN):
+                    self._record_failure(uid)
+        self.wanted = self._select(now)
+        for uid in self.wanted:
+            if uid not in peers and uid not in self._dialing and self._cooldown_until.get(uid, 0) <= now:
+                self._dialing.add(uid)
+                self.stats['dials'] += 1
+                if metrics.enabled:
+                    MANAGER_DIALS.inc()
+                self.transport.dial_peer(uid, self._addresses[uid], self.DIAL_ATTEMPTS)
+        for uid in list(self._dialing):
+            if uid not in self.wanted:
+                self._dialing.discard(uid)
+                self.transport.dialer.cancel(uid)
+        prune = []
+        for uid, peer in peers.items():
+            if uid in self.wanted or not peer.outbound:
+                self._deselected_at.pop(uid, None)
+                continue
+            since = self._deselected_at.setdefault(uid, now)
+            if now - since >= self.prune_grace:
+                prune.append((uid, 'deselected'))
+        excess = len(peers) - len(prune) - self.max_connections
+        if excess > 0:
+            pruned = {uid for uid, _ in prune}
+            spare = sorted((self._scores.get(uid, -1), uid) for uid in peers if uid not in self.wanted and uid not in pruned)
+            prune.extend((uid, 'over_limit') for _, uid in spare[:excess])
+        for uid, reason in prune:
+            self._deselected_at.pop(uid, None)
+            self.stats[f'pruned_{reason}'] += 1
+            if metrics.enabled:
+                MANAGER_PRUNED.inc(1, (reason,))
+            logging.info(f'[ConnectionManager] [{uid}]: Closing connection ({reason})')
+            await self.transport.disconnect_peer(uid)
+
+    def get_stats(self) -> dict:
+        peers = self.transport.peers.snapshot()
+        return {
+            **self.stats,
+            'degree': self.degree,
+            'max_inbound': self.max_inbound,
+            'known': len(self._ranking),
+            'wanted': len(self.wanted),
+            'connected': len(peers),
+            'connected_wanted': sum(1 for uid in self.wanted if uid in peers),
+            'inbound': sum(1 for peer in peers.values() if not peer.outbound),
+            'cooling_down': sum(1 for until in self._cooldown_until.values() if until > time.monotonic()),
+        }
@@ -0,0 +1,181 @@
+from p2p_networking import metrics
+import asyncio
+import logging
+import random
+import time
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DIAL_ATTEMPTS = metrics.counter('p2p_dial_attempts_total', 'Outbound connection attempts')
+DIAL_FAILURES = metrics.counter('p2p_dial_failures_total', 'Failed outbound connection attempts')
+DIAL_SECONDS = metrics.histogram('p2p_dial_seconds', 'Time to establish an outbound connection')
+
+class DialTarget:
+
+    def __init__(self, uid: str, ip: str):
+        self.uid = uid
+        self.ip = ip
+        self.attempts = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.connects = 0
+        self.last_error: str = None
+        self.last_latency: float = None
+        self.total_latency = 0.0
+        self.next_attempt: float = None
+        self.connected_at: float = None
+        self.max_attempts: int = None
+        self.task: asyncio.Task = None
+
+class DialScheduler:
+    """
+    Планировщик исходящих соединений.
+
+    Одновременно выполняется не больше concurrency попыток, каждая
+    ограничена connect_timeout. После неудачи попытка повторяется через
+    экспоненциально растущую задержку (BACKOFF_BASE * 2^n, не больше
+    MAX_BACKOFF) со случайным разбросом, чтобы узлы, запущенные
+    одновременно, не соединялись друг с другом в один и тот же момент.
+    Повторы продолжаются, пока цель не отменена через cancel() или, если
+    задан max_attempts, пока не наберётся столько неудач подряд. Соединение,
+    оборвавшееся раньше чем через STABLE_AFTER секунд, считается неудачной
+    попыткой, так что узел, который принимает и сразу сбрасывает
+    соединения, тоже получает растущую задержку.
+    """
+
+    CONCURRENCY = 32
+    CONNECT_TIMEOUT = 5.0
+    BACKOFF_BASE = 0.5
+    MAX_BACKOFF = 60.0
+    INITIAL_JITTER = 0.1
+    STABLE_AFTER = 10.0
+
+    def __init__(self, dial: callable, concurrency: int = None, connect_timeout: float = None,
+                 backoff_base: float = None, max_backoff: float = None):
+        self.dial = dial
+        self.concurrency = concurrency if concurrency is not None else self.CONCURRENCY
+        self.connect_timeout = connect_timeout if connect_timeout is not None else self.CONNECT_TIMEOUT
+        self.backoff_base = backoff_base if backoff_base is not None else self.BACKOFF_BASE
+        self.max_backoff = max_backoff if max_backoff is not None else self.MAX_BACKOFF
+        self.targets = {}
+        self.in_progress = 0
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._stopped = False
+
+    def start(self):
+        self._stopped = False
+
+    def schedule(self, uid: str, ip: str, max_attempts: int = None):
+        """Ставит узел в очередь на соединение; повторный вызов только обновляет адрес и предел попыток."""
+        if self._stopped:
+            return
+        target = self.targets.get(uid)
+        if target is None:
+            target = self.targets[uid] = DialTarget(uid, ip)
+        target.ip = ip
+        target.max_attempts = max_attempts
+        if target.task is not None and not target.task.done():
+            return
+        delay = random.uniform(0, self.INITIAL_JITTER)
+        if target.connected_at is not None and time.monotonic() - target.connected_at < self.STABLE_AFTER:
+            target.failures += 1
+            target.consecutive_failures += 1
+            target.last_error = 'Connection dropped shortly after it was established'
+            if metrics.enabled:
+                DIAL_FAILURES.inc()
+            delay = self._backoff(target.consecutive_failures)
+        elif target.connected_at is not None:
+            target.consecutive_failures = 0
+        target.connected_at = None
+        target.task = asyncio.create_task(self._run(target, delay))
+
+    def is_pending(self, uid: str) -> bool:
+        """True, если соединение с узлом устанавливается или ждёт повторной попытки."""
+        target = self.targets.get(uid)
+        return target is not None and target.task is not None and not target.task.done()
+
+    def cancel(self, uid: str):
+        target = self.targets.pop(uid, None)
+        if target and target.task:
+            target.task.cancel()
+
+    async def stop(self):
+        self._stopped = True
+        tasks = [target.task for target in self.targets.values() if target.task]
+        self.targets.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _backoff(self, failures: int) -> float:
+        ceiling = min(self.max_backoff, self.backoff_base * 2 ** (failures - 1))
+        # Equal jitter: at least half of the ceiling, so retries never collapse to zero.
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+    async def _run(self, target: DialTarget, delay: float):
+        try:
+            target.next_attempt = time.monotonic() + delay
+            await asyncio.sleep(delay)
+            while True:
+                async with self._semaphore:
+                    target.attempts += 1
+                    self.in_progress += 1
+                    started = time.monotonic()
+                    try:
+                        await asyncio.wait_for(self.dial(target.uid, target.ip), self.connect_timeout)
+                        error = None
+                    except asyncio.TimeoutError:
+                        error = f'Timed out after {self.connect_timeout}s'
+                    except OSError as e:
+                        error = f'{type(e).__name__}: {e}'
+                    except Exception as e:
+                        logging.warning(f'[DialScheduler] [{target.uid}]: unexpected error: {e}')
+                        error = f'{type(e).__name__}: {e}'
+                    finally:
+                        self.in_progress -= 1
+                    latency = time.monotonic() - started
+                if metrics.enabled:
+                    DIAL_ATTEMPTS.inc()
+                    if error is None:
+                        DIAL_SECONDS.observe(latency)
+                    else:
+                        DIAL_FAILURES.inc()
+                if error is None:
+                    target.connects += 1
+                    target.connected_at = time.monotonic()
+                    target.last_latency = latency
+                    target.total_latency += latency
+                    target.next_attempt = None
+                    return
+                target.failures += 1
+                target.consecutive_failures += 1
+                target.last_error = error
+                if target.max_attempts is not None and target.consecutive_failures >= target.max_attempts:
+                    logging.info(f'[DialScheduler] [{target.uid}]: Giving up after {target.consecutive_failures} failed attempts ({error})')
+                    if self.targets.get(target.uid) is target:
+                        del self.targets[target.uid]
+                    return
+                backoff = self._backoff(target.consecutive_failures)
+                target.next_attempt = time.monotonic() + backoff
+                logging.info(f'[DialScheduler] [{target.uid}]: Connection attempt {target.consecutive_failures} failed ({error}), retrying in {backoff:.1f}s')
+                await asyncio.sleep(backoff)
+        except asyncio.CancelledError:
+            pass
+
+    def get_stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            uid: {
+                'ip': target.ip,
+                'dialing': target.task is not None and not target.task.done(),
+                'attempts': target.attempts,
+                'connects': target.connects,
+                'failures': target.failures,
+                'consecutive_failures': target.consecutive_failures,
+                'last_error': target.last_error,
+                'last_latency': target.last_latency,
+                'avg_latency': target.total_latency / target.connects if target.connects else None,
+                'next_attempt_in': max(0.0, target.next_attempt - now) if target.next_attempt is not None else None,
+            }
+            for uid, target in self.targets.items()
+        }
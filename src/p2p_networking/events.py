@@ -1,5 +1,11 @@
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
 from p2p_networking import messages
+from p2p_networking import metrics
+import asyncio
+import logging
+import multiprocessing
+import time
 
 class Event:
     pass
@@ -17,19 +23,292 @@ class NodeLostEvent(Event):
 
 class MessageReceivedEvent(Event):
 
-    def __init__(self, message: messages.Message, uid: str):
+    def __init__(self, message: messages.Message, uid: str, channel: int = 0):
         self.message = message
         self.node_id = uid
+        self.channel = channel
+
+class PeerConnectedEvent(Event):
+
+    def __init__(self, uid: str, outbound: bool):
+        self.node_id = uid
+        self.outbound = outbound
+
+class PeerDisconnectedEvent(Event):
+
+    def __init__(self, uid: str):
+        self.node_id = uid
+
+class StreamOpenedEvent(Event):
+
+    def __init__(self, stream, uid: str):
+        self.stream = stream
+        self.node_id = uid
+
+EVENTS_PUBLISHED = metrics.counter('p2p_events_published_total', 'Events published on the event bus', ('event',))
+EVENTS_DROPPED = metrics.counter('p2p_events_dropped_total', 'Events dropped by full subscriber queues', ('event', 'handler'))
+HANDLER_SECONDS = metrics.histogram('p2p_event_handler_seconds', 'Event handler run time', ('event', 'handler'))
+
+BLOCK = 'block'
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+
+THREAD = 'thread'
+PROCESS = 'process'
+
+class Subscription:
+    """
+    Подписка обработчика на события одного типа.
+
+    Если задан executor, обработчик — обычная функция, которая выполняется
+    в пуле потоков или процессов, а не в event loop. События одного узла
+    (по node_id) обрабатываются строго по очереди, события разных узлов —
+    параллельно, насколько позволяет пул. queue_size ограничивает общее
+    число ещё не обработанных событий подписки.
+    """
+
+    def __init__(self, event_type: type[Event], handler: callable, queue_size: int = None, overflow: str = BLOCK,
+                 executor: Executor = None, executor_name: str = None):
+        if overflow not in (BLOCK, DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f'Unknown overflow policy: {overflow}')
+        if queue_size is not None and queue_size < 1:
+            raise ValueError('Queue size must be positive')
+        if executor is not None and asyncio.iscoroutinefunction(handler):
+            raise ValueError('Handlers run in an executor must be regular functions')
+        self.event_type = event_type
+        self.handler = handler
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.handled = 0
+        self.dropped = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self._queue = deque()
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+        self._worker: asyncio.Task = None
+        self.executor = executor
+        self.executor_name = executor_name or (type(executor).__name__ if executor is not None else None)
+        self._lanes = {}
+        self._lane_tasks = {}
+        self._pending = 0
+        self._metric_labels = (event_type.__name__, self.name)
+
+    @property
+    def name(self) -> str:
+        return getattr(self.handler, '__qualname__', repr(self.handler))
+
+    @property
+    def is_queued(self) -> bool:
+        return self.queue_size is not None
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue) + self._pending
+
+    async def deliver(self, event: Event):
+        if self.executor is not None:
+            if self.is_queued and self.overflow == BLOCK:
+                while self._pending >= self.queue_size:
+                    await self._not_full.wait()
+            self._deliver_ordered(event)
+            return
+        if not self.is_queued:
+            await self._call(event)
+            return
+        if self.overflow == BLOCK:
+            while len(self._queue) >= self.queue_size:
+                self._ensure_worker()
+                await self._not_full.wait()
+        self.deliver_nowait(event)
+
+    def deliver_nowait(self, event: Event) -> bool:
+        if self.executor is not None:
+            return self._deliver_ordered(event)
+        if not self.is_queued:
+            asyncio.create_task(self._call_safely(event))
+            return True
+        if len(self._queue) >= self.queue_size:
+            if metrics.enabled:
+                EVENTS_DROPPED.inc(1, self._metric_labels)
+            if self.overflow == DROP_OLDEST:
+                self._queue.popleft()
+                self.dropped += 1
+            else:
+                # BLOCK cannot wait here, so a full queue behaves like DROP_NEWEST.
+                self.dropped += 1
+                return False
+        self._queue.append(event)
+        if len(self._queue) >= self.queue_size:
+            self._not_full.clear()
+        self._not_empty.set()
+        self._ensure_worker()
+        return True
+
+    def get_stats(self) -> dict:
+        return {
+            'event': self.event_type.__name__,
+            'handler': self.name,
+            'queued': self.is_queued,
+            'queue_depth': self.queue_depth,
+            'queue_size': self.queue_size,
+            'executor': self.executor_name,
+            'lanes': len(self._lanes),
+            'handled': self.handled,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'avg_latency': self.total_latency / self.handled if self.handled else 0.0,
+            'max_latency': self.max_latency,
+        }
+
+    async def close(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        tasks = list(self._lane_tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._lanes.clear()
+        self._lane_tasks.clear()
+        self._pending = 0
+        self._queue.clear()
+        self._not_full.set()
+
+    async def _call(self, event: Event):
+        started = time.perf_counter()
+        try:
+            if self.executor is not None:
+                await asyncio.get_running_loop().run_in_executor(self.executor, self.handler, event)
+            else:
+                await self.handler(event)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            latency = time.perf_counter() - started
+            self.handled += 1
+            self.total_latency += latency
+            if latency > self.max_latency:
+                self.max_latency = latency
+            if metrics.enabled:
+                HANDLER_SECONDS.observe(latency, self._metric_labels)
+
+    async def _call_safely(self, event: Event):
+        try:
+            await self._call(event)
+        except Exception as e:
+            logging.warning(f'[EventBus] Handler {self.name} failed on {type(event).__name__}: {e}')
+
+    def _deliver_ordered(self, event: Event) -> bool:
+        key = getattr(event, 'node_id', None)
+        lane = self._lanes.get(key)
+        if self.is_queued and self._pending >= self.queue_size:
+            if metrics.enabled:
+                EVENTS_DROPPED.inc(1, self._metric_labels)
+            self.dropped += 1
+            # The head of a lane is already running, so the oldest event that can go is the next one of the same node.
+            if self.overflow != DROP_OLDEST or lane is None or len(lane) < 2:
+                return False
+            del lane[1]
+            self._pending -= 1
+        if lane is None:
+            lane = self._lanes[key] = deque()
+            self._lane_tasks[key] = asyncio.create_task(self._run_lane(key, lane))
+        lane.append(event)
+        self._pending += 1
+        if self.is_queued and self._pending >= self.queue_size:
+            self._not_full.clear()
+        return True
+
+    async def _run_lane(self, key, lane: deque):
+        try:
+            while lane:
+                await self._call_safely(lane[0])
+                lane.popleft()
+                self._pending -= 1
+                self._not_full.set()
+        finally:
+            if self._lanes.get(key) is lane:
+                del self._lanes[key]
+                del self._lane_tasks[key]
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._work())
+
+    async def _work(self):
+        while True:
+            if not self._queue:
+                self._not_empty.clear()
+                await self._not_empty.wait()
+                continue
+            event = self._queue.popleft()
+            self._not_full.set()
+            await self._call_safely(event)
 
 class EventBus:
 
-    def __init__(self):
+    def __init__(self, thread_workers: int = None, process_workers: int = None):
         self._subscribers = defaultdict(list)
+        self.thread_workers = thread_workers
+        self.process_workers = process_workers
+        self._executors = {}
 
     async def publish(self, event: Event):
+        if metrics.enabled:
+            EVENTS_PUBLISHED.inc(1, (type(event).__name__,))
+        if type(event) in self._subscribers:
+            for subscription in self._subscribers[type(event)]:
+                await subscription.deliver(event)
+
+    def publish_nowait(self, event: Event):
+        if metrics.enabled:
+            EVENTS_PUBLISHED.inc(1, (type(event).__name__,))
         if type(event) in self._subscribers:
-            for handler in self._subscribers[type(event)]:
-                await handler(event)
+            for subscription in self._subscribers[type(event)]:
+                subscription.deliver_nowait(event)
+
+    def subscribe(self, event_type: type[Event], handler: callable, queue_size: int = None, overflow: str = BLOCK,
+                  executor: "str | Executor" = None) -> Subscription:
+        """
+        executor: THREAD или PROCESS — общий пул шины, либо свой Executor.
+        В пул процессов событие передаётся через pickle, поэтому обработчик
+        должен быть функцией уровня модуля.
+        """
+        name = executor if isinstance(executor, str) else None
+        subscription = Subscription(event_type, handler, queue_size, overflow, self._get_executor(executor), name)
+        self._subscribers[event_type].append(subscription)
+        return subscription
+
+    def _get_executor(self, executor: "str | Executor") -> "Executor | None":
+        if executor is None or isinstance(executor, Executor):
+            return executor
+        if executor not in (THREAD, PROCESS):
+            raise ValueError(f'Unknown executor: {executor}')
+        pool = self._executors.get(executor)
+        if pool is None:
+            if executor == THREAD:
+                pool = ThreadPoolExecutor(self.thread_workers, thread_name_prefix='p2p-events')
+            else:
+                # Spawned workers do not inherit the running event loop or open sockets.
+                pool = ProcessPoolExecutor(self.process_workers, mp_context=multiprocessing.get_context('spawn'))
+            self._executors[executor] = pool
+        return pool
+
+    def get_stats(self) -> list[dict]:
+        return [subscription.get_stats() for subscriptions in self._subscribers.values() for subscription in subscriptions]
 
-    def subscribe(self, event_type: type[Event], handler: callable):
-        self._subscribers[event_type].append(handler)
+    async def close(self):
+        for subscriptions in self._subscribers.values():
+            for subscription in subscriptions:
+                await subscription.close()
+        for pool in self._executors.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        self._executors.clear()
@@ -0,0 +1,57 @@
+import heapq
+import itertools
+
+class ExpiryIndex:
+    """
+    Индекс сроков истечения на основе двоичной кучи.
+
+    Обновление срока — O(log n): в кучу добавляется новая запись, а старая
+    остаётся в ней и отбрасывается при извлечении (ленивое удаление).
+    Когда устаревших записей становится слишком много, куча перестраивается.
+    """
+
+    def __init__(self):
+        self._deadlines = {}
+        self._heap = []
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def get(self, key):
+        return self._deadlines.get(key)
+
+    def set(self, key, deadline: float) -> bool:
+        """Устанавливает срок для ключа. Возвращает True, если он стал ближайшим."""
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, next(self._counter), key))
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._compact()
+        return self._heap[0][2] == key and self._heap[0][0] == deadline
+
+    def discard(self, key):
+        self._deadlines.pop(key, None)
+
+    def next_deadline(self) -> "float | None":
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_expired(self, now: float) -> list:
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, key = heapq.heappop(self._heap)
+            if self._deadlines.get(key) == deadline:
+                del self._deadlines[key]
+                expired.append(key)
+        return expired
+
+    def _drop_stale(self):
+        while self._heap and self._deadlines.get(self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def _compact(self):
+        self._heap = [(deadline, next(self._counter), key) for key, deadline in self._deadlines.items()]
+        heapq.heapify(self._heap)
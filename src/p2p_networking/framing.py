@@ -0,0 +1,199 @@
+from collections import deque
+import asyncio
+import logging
+import struct
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+_LENGTH = struct.Struct('>I')
+
+class FrameTooLargeError(Exception):
+    pass
+
+class FrameProtocol(asyncio.BufferedProtocol):
+    """
+    Протокол приёма кадров с 4-байтовым префиксом длины.
+
+    Данные читаются в один переиспользуемый bytearray, за один вызов buffer_updated
+    разбирается столько кадров, сколько поместилось в буфер, и они передаются
+    обработчику одним пакетом в виде memoryview. Обработчик вызывается синхронно
+    и не должен сохранять переданные memoryview после возврата.
+
+    Со стороны записи объект повторяет интерфейс asyncio.StreamWriter
+    (write, writelines, drain, close, wait_closed), поэтому его можно отдавать SendQueue.
+    """
+
+    BUFFER_SIZE = 64 * 1024
+    MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+    def __init__(self, max_frame_size: int = None, buffer_size: int = None, on_connection_made: callable = None):
+        self.max_frame_size = max_frame_size if max_frame_size is not None else self.MAX_FRAME_SIZE
+        self.buffer_size = buffer_size if buffer_size is not None else self.BUFFER_SIZE
+        self.on_connection_made = on_connection_made
+        self.transport: asyncio.Transport = None
+        self._buffer = bytearray(self.buffer_size)
+        self._start = 0
+        self._end = 0
+        self._on_frames: callable = None
+        self._on_close: callable = None
+        self._pending = deque()
+        self._frame_waiter: asyncio.Future = None
+        self._drain_waiter: asyncio.Future = None
+        self._write_paused = False
+        self._connection_lost = False
+        self._exception: Exception = None
+        self._closed: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def set_frame_handler(self, handler: callable):
+        self._on_frames = handler
+        if self._pending:
+            pending = list(self._pending)
+            self._pending.clear()
+            handler([memoryview(frame) for frame in pending])
+
+    def set_close_handler(self, handler: callable):
+        self._on_close = handler
+        if self._connection_lost:
+            handler(self._exception)
+
+    async def read_frame(self) -> bytes:
+        while not self._pending:
+            if self._connection_lost:
+                raise ConnectionError('Connection closed before a frame was received')
+            self._frame_waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._frame_waiter
+            finally:
+                self._frame_waiter = None
+        return self._pending.popleft()
+
+    # asyncio.BufferedProtocol
+
+    def connection_made(self, transport):
+        self.transport = transport
+        if self.on_connection_made:
+            self.on_connection_made(self)
+
+    def get_buffer(self, sizehint):
+        if self._end == len(self._buffer):
+            self._reserve(len(self._buffer) - self._start + max(sizehint, 1))
+        return memoryview(self._buffer)[self._end:]
+
+    def buffer_updated(self, nbytes):
+        self._end += nbytes
+        buffer = self._buffer
+        start = self._start
+        end = self._end
+        frames = []
+        required = 0
+        with memoryview(buffer) as view:
+            while end - start >= 4:
+                length = _LENGTH.unpack_from(buffer, start)[0]
+                if length > self.max_frame_size:
+                    self._abort(FrameTooLargeError(f'Frame of {length} bytes exceeds the limit of {self.max_frame_size} bytes'))
+                    return
+                if end - start - 4 < length:
+                    required = 4 + length
+                    break
+                frames.append(view[start + 4:start + 4 + length])
+                start += 4 + length
+            self._start = start
+            if frames:
+                self._dispatch(frames)
+                for frame in frames:
+                    frame.release()
+        if self._start == self._end:
+            self._start = self._end = 0
+            if len(self._buffer) > self.buffer_size:
+                self._buffer = bytearray(self.buffer_size)
+        elif required:
+            self._reserve(required)
+
+    def eof_received(self):
+        return False
+
+    def connection_lost(self, exc):
+        self._connection_lost = True
+        if exc is None:
+            exc = self._exception
+        self._exception = exc
+        if not self._closed.done():
+            self._closed.set_result(None)
+        if self._frame_waiter and not self._frame_waiter.done():
+            self._frame_waiter.set_result(None)
+        if self._drain_waiter and not self._drain_waiter.done():
+            self._drain_waiter.set_exception(ConnectionResetError('Connection lost'))
+        if self._on_close:
+            self._on_close(exc)
+
+    def pause_writing(self):
+        self._write_paused = True
+
+    def resume_writing(self):
+        self._write_paused = False
+        if self._drain_waiter and not self._drain_waiter.done():
+            self._drain_waiter.set_result(None)
+
+    # StreamWriter-like interface
+
+    def write(self, data):
+        self.transport.write(data)
+
+    def writelines(self, data):
+        self.transport.writelines(data)
+
+    async def drain(self):
+        if self._connection_lost or self.transport.is_closing():
+            raise ConnectionResetError('Connection lost')
+        if not self._write_paused:
+            return
+        self._drain_waiter = asyncio.get_running_loop().create_future()
+        try:
+            await self._drain_waiter
+        finally:
+            self._drain_waiter = None
+
+    def pause_reading(self):
+        if self.transport and not self._connection_lost:
+            self.transport.pause_reading()
+
+    def resume_reading(self):
+        if self.transport and not self._connection_lost:
+            self.transport.resume_reading()
+
+    def get_extra_info(self, name, default=None):
+        return self.transport.get_extra_info(name, default)
+
+    def close(self):
+        if self.transport:
+            self.transport.close()
+
+    async def wait_closed(self):
+        await self._closed
+
+    def _dispatch(self, frames: list):
+        if self._on_frames:
+            self._on_frames(frames)
+            return
+        for frame in frames:
+            self._pending.append(frame.tobytes())
+        if self._frame_waiter and not self._frame_waiter.done():
+            self._frame_waiter.set_result(None)
+
+    def _reserve(self, required: int):
+        unread = self._end - self._start
+        if self._start + required <= len(self._buffer):
+            return
+        if required <= len(self._buffer):
+            self._buffer[:unread] = self._buffer[self._start:self._end]
+        else:
+            buffer = bytearray(max(required, min(len(self._buffer) * 2, self.max_frame_size + 4)))
+            buffer[:unread] = self._buffer[self._start:self._end]
+            self._buffer = buffer
+        self._start = 0
+        self._end = unread
+
+    def _abort(self, error: Exception):
+        logging.warning(f'[FrameProtocol] Closing connection: {error}')
+        self._exception = error
+        self.transport.abort()
@@ -0,0 +1,357 @@
+from p2p_networking.abstract_classes import Discovery
+from p2p_networking.broadcast_discovery import UDPProtocol
+from p2p_networking import events
+import asyncio
+import itertools
+import json
+import logging
+import math
+import random
+import socket
+import time
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+ALIVE = 'alive'
+SUSPECT = 'suspect'
+DEAD = 'dead'
+
+class Member:
+
+    def __init__(self, uid: str, ip: str, port: int, incarnation: int, state: str = ALIVE):
+        self.uid = uid
+        self.ip = ip
+        self.port = port
+        self.incarnation = incarnation
+        self.state = state
+        self.state_changed_at = time.monotonic()
+        self.last_seen = time.time()
+
+    @property
+    def addr(self) -> tuple:
+        return (self.ip, self.port)
+
+    def to_update(self) -> list:
+        return [self.uid, self.ip, self.port, self.state, self.incarnation]
+
+
+class GossipDiscovery(Discovery):
+    """
+    Обнаружение узлов по протоколу членства SWIM.
+
+    Каждый период узел пингует одного участника; если ответа нет, просит
+    INDIRECT_PROBES других участников пропинговать его (ping-req). Не ответивший
+    участник становится подозреваемым, а по истечении SUSPECT_PERIODS периодов
+    удаляется. Изменения членства не рассылаются отдельно, а добавляются к
+    ping/ack (не более MAX_PIGGYBACK обновлений на сообщение), поэтому нагрузка
+    на один узел за период ограничена и не зависит от размера кластера.
+
+    Начальные участники берутся из статического списка seeds и/или из
+    широковещательного join, поэтому сеть не ограничена одним широковещательным доменом.
+    """
+
+    KEY_ID = 'id'
+    KEY_IP = 'ip'
+    KEY_ACTION = 'action'
+    PROTOCOL_PERIOD = 1.0
+    PING_TIMEOUT = 0.3
+    INDIRECT_PROBES = 3
+    SUSPECT_PERIODS = 5
+    MAX_PIGGYBACK = 6
+    RETRANSMIT_MULTIPLIER = 3
+    JOIN_INTERVAL = 5.0
+    TOMBSTONE_TTL = 60.0
+
+    def __init__(self, event_bus: events.EventBus, seeds: list = None, broadcast_addr: "None | str" = None):
+        super().__init__(event_bus)
+        self.seeds = list(seeds or [])
+        self.broadcast_address = broadcast_addr
+        self.incarnation = 0
+        self.members = {}
+        self.transport = None
+        self.protocol_instance = None
+        self.probe_task: asyncio.Task = None
+        self.join_task: asyncio.Task = None
+        self._tombstones = {}
+        self._updates = {}
+        self._pending_acks = {}
+        self._probe_order = []
+        self._seq = itertools.count(1)
+
+    def set_broadcast_addr(self, addr: str):
+        self.broadcast_address = addr
+
+    def add_seed(self, seed: str):
+        self.seeds.append(seed)
+
+    async def start(self):
+        if self.addr is None or self.port is None:
+            raise ValueError('[Gossip Discovery] Node address or port is None')
+        loop = asyncio.get_running_loop()
+        transport_ready = loop.create_future()
+        self.transport, self.protocol_instance = await loop.create_datagram_endpoint(
+            lambda: UDPProtocol(self._on_datagram_received, transport_ready),
+            local_addr=('0.0.0.0', self.port),
+            family=socket.AF_INET,
+            proto=socket.IPPROTO_UDP,
+            allow_broadcast=True
+        )
+        await asyncio.wait_for(transport_ready, timeout=5)
+        # Peers keep a tombstone for our last DEAD incarnation, so a restarted node must start above it;
+        # milliseconds stay ahead of the few increments a previous run could have made.
+        self.incarnation = max(self.incarnation, time.time_ns() // 1_000_000)
+        self.probe_task = asyncio.create_task(self._probe_loop())
+        self.join_task = asyncio.create_task(self._join_loop())
+
+    async def stop(self):
+        if self.transport:
+            self._leave()
+            for task in (self.probe_task, self.join_task):
+                if task:
+                    task.cancel()
+                    try:
+                        await task
+                    except asyncio.CancelledError:
+                        pass
+            self.transport.close()
+            self.transport = None
+            self.protocol_instance = None
+            self.probe_task = None
+            self.join_task = None
+            for future in self._pending_acks.values():
+                if not future.done():
+                    future.cancel()
+            self._pending_acks.clear()
+
+    # Outgoing messages
+
+    def _seed_addrs(self) -> list:
+        addrs = []
+        for seed in self.seeds:
+            host, _, port = str(seed).partition(':')
+            addrs.append((host, int(port) if port else self.port))
+        return addrs
+
+    def _send(self, message: dict, addr: tuple):
+        if not self.transport:
+            return
+        message[self.KEY_ID] = self.uid
+        message[self.KEY_IP] = self.addr
+        message['port'] = self.port
+        message['inc'] = self.incarnation
+        message['updates'] = self._take_updates()
+        try:
+            self.transport.sendto(json.dumps(message, separators=(',', ':')).encode(), addr)
+        except Exception as e:
+            logging.warning(f'[Gossip Discovery] Failed to send {message[self.KEY_ACTION]} to {addr}: {e}')
+
+    def _send_join(self):
+        targets = self._seed_addrs()
+        if self.broadcast_address:
+            targets.append((self.broadcast_address, self.port))
+        for addr in targets:
+            if addr != (self.addr, self.port):
+                self._send({self.KEY_ACTION: 'join'}, addr)
+
+    def _leave(self):
+        self.incarnation += 1
+        self._enqueue_update([self.uid, self.addr, self.port, DEAD, self.incarnation])
+        targets = random.sample(list(self.members.values()), min(len(self.members), self.INDIRECT_PROBES + 1))
+        for member in targets:
+            self._send({self.KEY_ACTION: 'leave'}, member.addr)
+
+    # Dissemination
+
+    def _retransmit_limit(self) -> int:
+        return self.RETRANSMIT_MULTIPLIER * max(1, math.ceil(math.log2(len(self.members) + 2)))
+
+    def _enqueue_update(self, update: list):
+        self._updates[update[0]] = [update, 0]
+
+    def _take_updates(self) -> list:
+        if not self._updates:
+            return []
+        limit = self._retransmit_limit()
+        chosen = sorted(self._updates.values(), key=lambda entry: entry[1])[:self.MAX_PIGGYBACK]
+        updates = []
+        for entry in chosen:
+            entry[1] += 1
+            updates.append(entry[0])
+            if entry[1] >= limit:
+                del self._updates[entry[0][0]]
+        return updates
+
+    # Incoming messages
+
+    def _on_datagram_received(self, message, addr):
+        try:
+            data = json.loads(message)
+            uid = data.get(self.KEY_ID)
+            action = data.get(self.KEY_ACTION)
+            if not uid or uid == self.uid:
+                return
+            if action in ('ping', 'ack', 'ping-req', 'join', 'leave'):
+                if action != 'leave':
+                    self._apply_update([uid, data.get(self.KEY_IP) or addr[0], data.get('port') or addr[1], ALIVE, data.get('inc', 0)])
+                for update in data.get('updates') or []:
+                    self._apply_update(update)
+                self._handle(action, data, addr)
+        except json.JSONDecodeError:
+            logging.warning(f'[Gossip Discovery] incorrect JSON in message from {addr}: {message}')
+        except Exception as e:
+            logging.error(f'[Gossip Discovery] unexpected error processing message from {addr}: {e}')
+
+    def _handle(self, action: str, data: dict, addr: tuple):
+        if action == 'ping':
+            self._send({self.KEY_ACTION: 'ack', 'seq': data.get('seq')}, addr)
+        elif action == 'ack':
+            future = self._pending_acks.get(data.get('seq'))
+            if future and not future.done():
+                future.set_result(True)
+        elif action == 'ping-req':
+            target = self.members.get(data.get('target'))
+            if target:
+                asyncio.create_task(self._relay_probe(target, data.get('seq'), addr))
+        elif action == 'join':
+            for member in random.sample(list(self.members.values()), min(len(self.members), self.MAX_PIGGYBACK)):
+                self._enqueue_update(member.to_update())
+            self._send({self.KEY_ACTION: 'ack', 'seq': None}, addr)
+
+    def _apply_update(self, update: list):
+        uid, ip, port, state, incarnation = update
+        if uid == self.uid:
+            if state != ALIVE and incarnation >= self.incarnation:
+                # Refute suspicion about ourselves by bumping the incarnation.
+                self.incarnation = incarnation + 1
+                self._enqueue_update([self.uid, self.addr, self.port, ALIVE, self.incarnation])
+            return
+        member = self.members.get(uid)
+        if member is None:
+            if state == DEAD:
+                return
+            tombstone = self._tombstones.get(uid)
+            if tombstone and incarnation <= tombstone[0]:
+                return
+            self._tombstones.pop(uid, None)
+            member = Member(uid, ip, port, incarnation, state)
+            self.members[uid] = member
+            self._probe_order.insert(random.randint(0, len(self._probe_order)), uid)
+            self.discovered_nodes[uid] = {self.KEY_IP: ip, 'last_seen': member.last_seen}
+            self._enqueue_update(member.to_update())
+            logging.info(f'[Gossip Discovery] Discovered the new node {uid}. Total: {len(self.members)}')
+            asyncio.create_task(self.publish_node_discovered_event(uid, {self.KEY_IP: ip}))
+            return
+        if state == ALIVE:
+            if incarnation > member.incarnation or (incarnation == member.incarnation and member.state == ALIVE):
+                changed = member.state != ALIVE or incarnation > member.incarnation
+                member.incarnation = incarnation
+                member.ip, member.port = ip, port
+                member.last_seen = time.time()
+                self.discovered_nodes[uid] = {self.KEY_IP: ip, 'last_seen': member.last_seen}
+                if member.state != ALIVE:
+                    member.state = ALIVE
+                    member.state_changed_at = time.monotonic()
+                if changed:
+                    self._enqueue_update(member.to_update())
+        elif state == SUSPECT:
+            if incarnation > member.incarnation or (incarnation == member.incarnation and member.state == ALIVE):
+                self._suspect(member, incarnation)
+        elif state == DEAD:
+            if incarnation >= member.incarnation:
+                self._remove(member, incarnation)
+
+    def _suspect(self, member: Member, incarnation: int):
+        member.incarnation = incarnation
+        if member.state != SUSPECT:
+            member.state = SUSPECT
+            member.state_changed_at = time.monotonic()
+            logging.info(f'[Gossip Discovery] Node {member.uid} is suspected to have failed')
+        self._enqueue_update(member.to_update())
+
+    def _remove(self, member: Member, incarnation: int):
+        if self.members.pop(member.uid, None) is None:
+            return
+        self.discovered_nodes.pop(member.uid, None)
+        self._tombstones[member.uid] = (incarnation, time.monotonic())
+        self._enqueue_update([member.uid, member.ip, member.port, DEAD, incarnation])
+        logging.info(f'[Gossip Discovery] Node {member.uid} was deleted from the list')
+        asyncio.create_task(self.publish_node_lost_event(member.uid))
+
+    # Failure detection
+
+    async def _probe(self, addr: tuple, extra: dict = None, timeout: float = None) -> bool:
+        seq = next(self._seq)
+        future = asyncio.get_running_loop().create_future()
+        self._pending_acks[seq] = future
+        message = {self.KEY_ACTION: 'ping', 'seq': seq}
+        if extra:
+            message.update(extra)
+        try:
+            self._send(message, addr)
+            return await asyncio.wait_for(future, timeout if timeout is not None else self.PING_TIMEOUT)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._pending_acks.pop(seq, None)
+
+    async def _indirect_probe(self, target: Member) -> bool:
+        helpers = [member for member in self.members.values() if member.uid != target.uid and member.state == ALIVE]
+        helpers = random.sample(helpers, min(len(helpers), self.INDIRECT_PROBES))
+        if not helpers:
+            return False
+        seq = next(self._seq)
+        future = asyncio.get_running_loop().create_future()
+        self._pending_acks[seq] = future
+        try:
+            for helper in helpers:
+                self._send({self.KEY_ACTION: 'ping-req', 'seq': seq, 'target': target.uid}, helper.addr)
+            return await asyncio.wait_for(future, self.PROTOCOL_PERIOD - self.PING_TIMEOUT)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._pending_acks.pop(seq, None)
+
+    async def _relay_probe(self, target: Member, seq: int, requester: tuple):
+        if await self._probe(target.addr):
+            self._send({self.KEY_ACTION: 'ack', 'seq': seq}, requester)
+
+    def _next_target(self) -> "Member | None":
+        while True:
+            if not self._probe_order:
+                self._probe_order = list(self.members)
+                random.shuffle(self._probe_order)
+                if not self._probe_order:
+                    return None
+            uid = self._probe_order.pop()
+            member = self.members.get(uid)
+            if member:
+                return member
+
+    def _expire_suspects(self):
+        deadline = time.monotonic() - self.SUSPECT_PERIODS * self.PROTOCOL_PERIOD
+        for member in list(self.members.values()):
+            if member.state == SUSPECT and member.state_changed_at <= deadline:
+                self._remove(member, member.incarnation)
+        tombstone_deadline = time.monotonic() - self.TOMBSTONE_TTL
+        for uid, (_, removed_at) in list(self._tombstones.items()):
+            if removed_at <= tombstone_deadline:
+                del self._tombstones[uid]
+
+    async def _probe_loop(self):
+        while True:
+            started = time.monotonic()
+            self._expire_suspects()
+            target = self._next_target()
+            if target:
+                alive = await self._probe(target.addr)
+                if not alive:
+                    alive = await self._indirect_probe(target)
+                if not alive and target.uid in self.members and target.state == ALIVE:
+                    self._suspect(target, target.incarnation)
+            await asyncio.sleep(max(0.0, self.PROTOCOL_PERIOD - (time.monotonic() - started)))
+
+    async def _join_loop(self):
+        while True:
+            if not self.members:
+                self._send_join()
+            await asyncio.sleep(self.JOIN_INTERVAL)
@@ -0,0 +1,114 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+class HeartbeatScheduler:
+    """
+    Общий планировщик keepalive для всех соединений транспорта.
+
+    Для каждого соединения хранится один элемент в куче с ближайшим сроком:
+    либо пора отправить keepalive (канал простаивает interval секунд),
+    либо соединение молчит timeout секунд и считается потерянным.
+    Отправка и приём кадров только обновляют отметки времени у соединения,
+    куча перестраивается лишь при срабатывании срока.
+    """
+
+    INTERVAL = 10
+    TIMEOUT = 30
+
+    def __init__(self, interval: float = None, timeout: float = None):
+        self.interval = interval if interval is not None else self.INTERVAL
+        self.timeout = timeout if timeout is not None else self.TIMEOUT
+        if self.timeout <= self.interval:
+            raise ValueError('Heartbeat timeout must be greater than the interval')
+        self.keepalives_sent = 0
+        self.peers_lost = 0
+        self._peers = {}
+        self._heap = []
+        self._generations = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task = None
+
+    def __len__(self):
+        return len(self._peers)
+
+    def add(self, peer):
+        generation = next(self._generations)
+        self._peers[peer.uid] = (peer, generation, 0.0)
+        deadline = self._next_deadline(peer, 0.0)
+        heapq.heappush(self._heap, (deadline, generation, peer.uid))
+        if self._heap[0][1] == generation:
+            self._wakeup.set()
+
+    def remove(self, peer):
+        entry = self._peers.get(peer.uid)
+        if entry and entry[0] is peer:
+            del self._peers[peer.uid]
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._peers.clear()
+        self._heap.clear()
+
+    def _next_deadline(self, peer, keepalive_at: float) -> float:
+        return min(max(peer.last_send, keepalive_at) + self.interval, peer.last_receive + self.timeout)
+
+    def _tick(self, now: float) -> list:
+        lost = []
+        while self._heap and self._heap[0][0] <= now:
+            _, generation, uid = heapq.heappop(self._heap)
+            entry = self._peers.get(uid)
+            if entry is None or entry[1] != generation:
+                continue
+            peer, _, keepalive_at = entry
+            if peer.is_closing:
+                del self._peers[uid]
+                continue
+            if now - peer.last_receive >= self.timeout:
+                del self._peers[uid]
+                lost.append(peer)
+                continue
+            if now - max(peer.last_send, keepalive_at) >= self.interval:
+                # last_send moves only after a write, so a stalled writer must not get a keepalive every tick;
+                # a non-empty queue will send soon anyway.
+                keepalive_at = now
+                self._peers[uid] = (peer, generation, keepalive_at)
+                if not peer.is_sending and peer.send_keepalive_nowait():
+                    self.keepalives_sent += 1
+            heapq.heappush(self._heap, (max(self._next_deadline(peer, keepalive_at), now + 0.001), generation, uid))
+        # Drop stale entries once they clearly dominate the heap.
+        if len(self._heap) > 2 * len(self._peers) + 64:
+            self._heap = [item for item in self._heap if self._peers.get(item[2], (None, None, None))[1] == item[1]]
+            heapq.heapify(self._heap)
+        return lost
+
+    async def _run(self):
+        try:
+            while True:
+                lost = self._tick(time.monotonic())
+                for peer in lost:
+                    self.peers_lost += 1
+                    logging.info(f'[HeartbeatScheduler] [{peer.uid}]: No frames received for {self.timeout}s, connection considered lost')
+                    asyncio.create_task(peer.report_lost())
+                self._wakeup.clear()
+                delay = self._heap[0][0] - time.monotonic() if self._heap else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            pass
@@ -0,0 +1,81 @@
+from p2p_networking import metrics
+import asyncio
+import logging
+import time
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+LOOP_LAG_SECONDS = metrics.histogram('p2p_event_loop_lag_seconds', 'Delay of a periodic timer on the event loop',
+                                     buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+LOOP_STALLS = metrics.counter('p2p_event_loop_stalls_total', 'Timer delays longer than the stall threshold')
+
+class LoopMonitor:
+    """
+    Измеряет, насколько event loop занят синхронным кодом.
+
+    Каждые interval секунд задача засыпает и сравнивает фактическое время
+    пробуждения с ожидаемым: разница — это время, на которое цикл был
+    заблокирован (разбор больших кадров, тяжёлые обработчики событий).
+    Задержки дольше stall_threshold считаются зависаниями и пишутся в лог,
+    так что по ним видно, почему keepalive пришёл поздно.
+    """
+
+    INTERVAL = 0.1
+    STALL_THRESHOLD = 0.25
+
+    def __init__(self, interval: float = None, stall_threshold: float = None):
+        self.interval = interval if interval is not None else self.INTERVAL
+        self.stall_threshold = stall_threshold if stall_threshold is not None else self.STALL_THRESHOLD
+        self.samples = 0
+        self.stalls = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+        self.blocked_time = 0.0
+        self._task: asyncio.Task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self._record(max(0.0, time.monotonic() - expected))
+
+    def _record(self, lag: float):
+        self.samples += 1
+        self.last_lag = lag
+        self.total_lag += lag
+        if lag > self.max_lag:
+            self.max_lag = lag
+        if metrics.enabled:
+            LOOP_LAG_SECONDS.observe(lag)
+        if lag >= self.stall_threshold:
+            self.stalls += 1
+            self.blocked_time += lag
+            if metrics.enabled:
+                LOOP_STALLS.inc()
+            logging.warning(f'[LoopMonitor] Event loop was blocked for {lag * 1000:.0f} ms')
+
+    def get_stats(self) -> dict:
+        return {
+            'running': self._task is not None and not self._task.done(),
+            'interval': self.interval,
+            'samples': self.samples,
+            'last_lag': self.last_lag,
+            'avg_lag': self.total_lag / self.samples if self.samples else 0.0,
+            'max_lag': self.max_lag,
+            'stalls': self.stalls,
+            'blocked_time': self.blocked_time,
+        }
@@ -4,11 +4,12 @@ from p2p_networking import tcp_transport
 from p2p_networking import broadcast_discovery
 from p2p_networking import events
 from p2p_networking import node
+from p2p_networking import metrics
 from pathlib import Path
 from fastapi import FastAPI, WebSocket, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from starlette.websockets import WebSocketState
 from contextlib import asynccontextmanager
 from pydantic import BaseModel
@@ -22,6 +23,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent.parent
 
 class Message(BaseModel):
     body_of_message: str
+metrics.enable()
 net = Net((get_main_local_ip()))
 event_bus = events.EventBus()
 transport = tcp_transport.TcpTransport(event_bus)
@@ -34,7 +36,7 @@ list_events = []
 async def lifespan(app: FastAPI):
     global peer
     peer = node.Node((net.ip, net.mask), transport, discovery, event_bus)
-    event_bus.subscribe(events.MessageReceivedEvent, on_message)
+    event_bus.subscribe(events.MessageReceivedEvent, on_message, queue_size=1000, overflow=events.DROP_OLDEST)
     event_bus.subscribe(events.NodeDiscoveredEvent, on_node_discovered)
     event_bus.subscribe(events.NodeLostEvent, on_node_lost)
     logging.info(f"Node's IP: {peer.node_addr} ID: {peer.node_uid}")
@@ -44,6 +46,7 @@ async def lifespan(app: FastAPI):
         yield
     finally:
         await peer.stop_network()
+        await event_bus.close()
 app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
@@ -109,6 +112,27 @@ async def send_message(uid: str, message: Message):
     await peer.transport.send_to_peer(uid, message.body_of_message)
     return {"status": "ok", "to": uid, "body": message.body_of_message}
 
+@app.post("/broadcast")
+async def broadcast_message(message: Message):
+    results = await peer.transport.broadcast(message.body_of_message)
+    return {"status": "ok", "delivered": results, "body": message.body_of_message}
+
+@app.get("/discovery/stats")
+def discovery_stats():
+    return discovery.get_stats()
+
+@app.get("/events/stats")
+def events_stats():
+    return event_bus.get_stats()
+
+@app.get("/loop/stats")
+def loop_stats():
+    return transport.get_loop_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
+
 @app.get("/ping")
 def ping():
     return {"status": "ok"}
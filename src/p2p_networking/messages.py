@@ -1,8 +1,9 @@
 import json
 
 class Message:
-    def __init__(self, data):
+    def __init__(self, data, channel: int = 0):
         self.data = data
+        self.channel = channel
 
     @property
     def type(self):
@@ -0,0 +1,190 @@
+from bisect import bisect_left
+import math
+
+# Metrics are off by default. Instrumented code checks `metrics.enabled` before
+# touching a metric, so a disabled build pays one attribute lookup per call site.
+enabled = False
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def enable() -> None:
+    global enabled
+    enabled = True
+
+def disable() -> None:
+    global enabled
+    enabled = False
+
+def is_enabled() -> bool:
+    return enabled
+
+def _format_labels(labelnames: tuple, labels: tuple, extra: str = None) -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+class Metric:
+    type = None
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> list:
+        raise NotImplementedError("Subclasses must implement samples")
+
+    def reset(self) -> None:
+        raise NotImplementedError("Subclasses must implement reset")
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        lines.extend(f'{name}{labels} {_format_value(value)}' for name, labels, value in self.samples())
+        return '\n'.join(lines)
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        super().__init__(name, help, labelnames)
+        self.values = {}
+
+    def inc(self, amount: float = 1, labels: tuple = ()) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, labels: tuple = ()) -> float:
+        return self.values.get(labels, 0)
+
+    def samples(self) -> list:
+        return [(self.name, _format_labels(self.labelnames, labels), value) for labels, value in self.values.items()]
+
+    def reset(self) -> None:
+        self.values.clear()
+
+class Gauge(Metric):
+    """
+    Значение, которое может как расти, так и уменьшаться.
+
+    Вместо set() можно задать функцию, которая вычисляет значение в момент
+    сбора метрик: так глубина очередей и число соединений ничего не стоят
+    на горячем пути. Функция возвращает число или словарь {метки: число}.
+    """
+    type = 'gauge'
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), function: callable = None):
+        super().__init__(name, help, labelnames)
+        self.values = {}
+        self.function = function
+
+    def set(self, value: float, labels: tuple = ()) -> None:
+        self.values[labels] = value
+
+    def inc(self, amount: float = 1, labels: tuple = ()) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, amount: float = 1, labels: tuple = ()) -> None:
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def set_function(self, function: callable) -> None:
+        self.function = function
+
+    def get(self, labels: tuple = ()) -> float:
+        return self._collect().get(labels, 0)
+
+    def _collect(self) -> dict:
+        if self.function is None:
+            return self.values
+        value = self.function()
+        return value if isinstance(value, dict) else {(): value}
+
+    def samples(self) -> list:
+        return [(self.name, _format_labels(self.labelnames, labels), value) for labels, value in self._collect().items()]
+
+    def reset(self) -> None:
+        self.values.clear()
+
+class Histogram(Metric):
+    """Гистограмма с фиксированными границами корзин; observe() — один bisect и два сложения."""
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}
+
+    def observe(self, value: float, labels: tuple = ()) -> None:
+        state = self.values.get(labels)
+        if state is None:
+            # Per label set: bucket counts (the last one is +Inf), sum, count.
+            state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def get_count(self, labels: tuple = ()) -> int:
+        state = self.values.get(labels)
+        return state[2] if state else 0
+
+    def samples(self) -> list:
+        samples = []
+        for labels, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                samples.append((f'{self.name}_bucket', _format_labels(self.labelnames, labels, f'le="{_format_value(float(bound))}"'), cumulative))
+            samples.append((f'{self.name}_sum', _format_labels(self.labelnames, labels), total))
+            samples.append((f'{self.name}_count', _format_labels(self.labelnames, labels), count))
+        return samples
+
+    def reset(self) -> None:
+        self.values.clear()
+
+class Registry:
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric: Metric) -> Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                raise ValueError(f'Metric {metric.name} is already registered with a different type or labels')
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> "Metric | None":
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Возвращает все метрики в текстовом формате Prometheus."""
+        return '\n'.join(metric.render() for metric in self._metrics.values()) + '\n'
+
+    def reset(self) -> None:
+        for metric in self._metrics.values():
+            metric.reset()
+
+REGISTRY = Registry()
+
+def counter(name: str, help: str, labelnames: tuple = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+def gauge(name: str, help: str, labelnames: tuple = (), function: callable = None) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, labelnames, function))
+
+def histogram(name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+def render() -> str:
+    return REGISTRY.render()
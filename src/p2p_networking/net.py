@@ -1,3 +1,51 @@
+import socket
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class AddressRange:
+    """Ленивый диапазон IPv4-адресов. Адреса вычисляются только при обращении."""
+
+    def __init__(self, addresses: range):
+        self._range = addresses
+
+    def __len__(self):
+        return len(self._range)
+
+    def __iter__(self):
+        for x in self._range:
+            yield Net._int_to_ip(x)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return AddressRange(self._range[index])
+        return Net._int_to_ip(self._range[index])
+
+    def __contains__(self, ip):
+        return Net._ip_to_int(ip) in self._range
+
+    def ints(self) -> range:
+        """Возвращает диапазон адресов в виде range целых чисел."""
+        return self._range
+
+    def to_array(self):
+        """
+        Возвращает адреса диапазона в виде numpy-массива uint32.
+
+        Raises:
+            ImportError: Если numpy не установлен.
+        """
+        if numpy is None:
+            raise ImportError('numpy is required for array address ranges: pip install p2p-networking[numpy]')
+        return numpy.arange(self._range.start, self._range.stop, self._range.step, dtype=numpy.uint32)
+
+    def __repr__(self):
+        if not self._range:
+            return 'AddressRange([])'
+        return f'AddressRange({Net._int_to_ip(self._range[0])}..{Net._int_to_ip(self._range[-1])}, step={self._range.step})'
+
 class Net:
     def __init__(self, ip_and_mask: tuple):
         """
@@ -17,85 +65,123 @@ class Net:
         if not Net._validate_dotted_decimal_str(self.ip):
             raise ValueError('Invalid IP address format')
         if not Net._validate_dotted_decimal_str(self.mask):
-            self.mask_bin = Net._cidr_to_bin(self.mask)
             if not Net._validate_cidr_prefix(self.mask):
                 raise ValueError('Invalid CIDR prefix. Prefix must be between 0 and 32')
+            self.prefix_length = int(self.mask)
+            self.mask_int = (0xFFFFFFFF << (32 - self.prefix_length)) & 0xFFFFFFFF
         else:
-            self.mask_bin = Net._to_binary_string(self.mask)
-            if not Net._validate_mask_bin(self.mask_bin):
+            self.mask_int = Net._ip_to_int(self.mask)
+            if not Net._validate_mask_int(self.mask_int):
                 raise ValueError('Invalid dotted decimal mask. In a subnet mask, the bits must be contiguous: first all 1s, then all 0s.')
-        self.network_address_str, self.net_address_bin = self._calculate_net(self._to_binary_string(self.ip), self.mask_bin)
-        self.netmask = self._bin_to_dec(self.mask_bin)
-        self.address_count = 2**self.mask_bin.count('0')
-        self.broadcast_address_bin = self.net_address_bin[0:32 - self.mask_bin.count('0')] + '1' * self.mask_bin.count('0')
-        self.broadcast_address = self._bin_to_dec(self.broadcast_address_bin)
+            self.prefix_length = bin(self.mask_int).count('1')
+        self.ip_int = Net._ip_to_int(self.ip)
+        self.network_int = self.ip_int & self.mask_int
+        self.broadcast_int = self.network_int | (~self.mask_int & 0xFFFFFFFF)
+        self.address_count = 2**(32 - self.prefix_length)
+        self.mask_bin = format(self.mask_int, '032b')
+        self.net_address_bin = format(self.network_int, '032b')
+        self.network_address_str = Net._int_to_ip(self.network_int)
+        self.netmask = Net._int_to_ip(self.mask_int)
+        self.broadcast_address_bin = format(self.broadcast_int, '032b')
+        self.broadcast_address = Net._int_to_ip(self.broadcast_int)
 
     @staticmethod
-    def _ip_to_int(ip):
-        ip_bin = Net._to_binary_string(ip)
-        return int(ip_bin, 2)
-    
+    def _ip_to_int(ip) -> int:
+        if isinstance(ip, int):
+            return ip
+        try:
+            # inet_aton would also accept short forms such as '192.168.1' (192.168.0.1).
+            return int.from_bytes(socket.inet_pton(socket.AF_INET, ip), 'big')
+        except (OSError, TypeError):
+            raise ValueError(f'Invalid IP address: {ip!r}') from None
+
     @staticmethod
-    def _int_to_ip(integer: int):
-        return Net._bin_to_dec(bin(integer)[2:].zfill(32))
+    def _int_to_ip(integer: int) -> str:
+        return socket.inet_ntoa(integer.to_bytes(4, 'big'))
 
     @staticmethod
     def _validate_dotted_decimal_str(address_str:str) -> bool:
         octets = address_str.split('.')
         return len(octets) == 4 and all(o.isdigit() and 0 <= int(o) <= 255 for o in octets)
-    
+
     @staticmethod
     def _validate_cidr_prefix(mask_str:str) -> bool:
         if (mask_str.isdigit() and 0 <= int(mask_str) <= 32):
             return True
         else:
             return False
-        
+
     @staticmethod
     def _validate_mask_bin(mask_bin:str) -> bool:
-        is_zero = False
-        for i in mask_bin:
-            if is_zero:
-                if i == '1':
-                    return False
-            elif i == '0':
-                is_zero = True
-        return True
-
+        return Net._validate_mask_int(int(mask_bin, 2))
 
-                        
+    @staticmethod
+    def _validate_mask_int(mask_int: int) -> bool:
+        host_bits = ~mask_int & 0xFFFFFFFF
+        return host_bits & (host_bits + 1) == 0
 
-    def __contains__(self, ip:str):
+    def __contains__(self, ip):
         """Возвращает True, если IP принадлежит сети, в противном случае False"""
-        ip = self._to_binary_string(ip)
-        ip_net_part = ''.join(str(int(x) & int(y)) for x, y in zip(ip, self.mask_bin))
-        return ip_net_part == self.net_address_bin
+        return Net._ip_to_int(ip) & self.mask_int == self.network_int
+
+    def contains_many(self, ips):
+        """
+        Проверяет принадлежность сети сразу для множества адресов.
+
+        Args:
+            ips: последовательность адресов в виде строк или целых чисел,
+                либо numpy-массив целых чисел.
+
+        Returns:
+            Маску принадлежности: numpy-массив bool для numpy-входа, иначе list[bool].
+        """
+        if numpy is not None and isinstance(ips, numpy.ndarray):
+            return (ips.astype(numpy.uint32, copy=False) & numpy.uint32(self.mask_int)) == numpy.uint32(self.network_int)
+        mask = self.mask_int
+        network = self.network_int
+        to_int = Net._ip_to_int
+        return [to_int(ip) & mask == network for ip in ips]
 
     @staticmethod
     def _to_binary_string(address_or_prefix: str):
-            return ''.join(bin(int(octet))[2:].zfill(8) for octet in address_or_prefix.split('.'))
-        
+        return format(Net._ip_to_int(address_or_prefix), '032b')
+
+    @staticmethod
     def _cidr_to_bin(prefix: str):
         return '1' * int(prefix) + '0' * (32 - int(prefix))
-    
+
     @staticmethod
     def _bin_to_dec(ip):
-            ip = '.'.join(str(int(ip[i:i+8], 2)) for i in range(0, 32, 8))
-            return ip
+        return Net._int_to_ip(int(ip, 2))
 
     @staticmethod
     def _calculate_net(ip, mask):
-        net_bin = ''.join(str(int(x) & int(y)) for x,y in zip(ip,mask))
-        net = Net._bin_to_dec(net_bin)
-        return net, net_bin
+        net_int = int(ip, 2) & int(mask, 2)
+        return Net._int_to_ip(net_int), format(net_int, '032b')
+
+    def addresses(self) -> AddressRange:
+        """Возвращает ленивый диапазон всех адресов сети, включая адрес сети и широковещательный"""
+        return AddressRange(range(self.network_int, self.broadcast_int + 1))
+
+    def to_array(self):
+        """Возвращает все адреса сети в виде numpy-массива uint32"""
+        return self.addresses().to_array()
+
+    def __len__(self):
+        return self.address_count
+
+    def __getitem__(self, index):
+        """Возвращает адрес по индексу или ленивый AddressRange для среза"""
+        return self.addresses()[index]
 
     def __iter__(self):
         """Возвращает IP, принадлежащие сети, включая адрес сети и широковещательный"""
-        for x in range(Net._ip_to_int(self.network_address_str), Net._ip_to_int(self.broadcast_address)+1):
-            yield Net._int_to_ip(x)
-    
+        int_to_ip = Net._int_to_ip
+        for x in range(self.network_int, self.broadcast_int + 1):
+            yield int_to_ip(x)
+
     def __str__(self):
-        return f'{self.network_address_str}/{self.mask_bin.count("1")}'
-    
+        return f'{self.network_address_str}/{self.prefix_length}'
+
     def __repr__(self):
-        return f'Net({self.network_address_str},{self.netmask})'
\ No newline at end of file
+        return f'Net({self.network_address_str},{self.netmask})'
@@ -1,6 +1,7 @@
 from p2p_networking.abstract_classes import Transport, Discovery
 import configparser
 from p2p_networking import events
+from p2p_networking.peer_cache import PeerCache
 import os
 import uuid
 import asyncio
@@ -11,6 +12,7 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 class Node:
 
     CONFIG_PATH = "config.ini"
+    PEER_CACHE_PATH = "peers.cache"
 
     def __init__(self, ip_and_mask, transport: Transport, discovery: Discovery, event_bus: events.EventBus):
         self.ip_and_mask = ip_and_mask
@@ -21,10 +23,14 @@ class Node:
         self.event_bus = event_bus
         self.event_bus.subscribe(events.NodeDiscoveredEvent, self._on_node_discovered)
         self.event_bus.subscribe(events.NodeLostEvent, self._on_node_lost)
+        self.event_bus.subscribe(events.PeerConnectedEvent, self._on_peer_connected)
+        self.event_bus.subscribe(events.PeerDisconnectedEvent, self._on_peer_disconnected)
         self.transport = transport
         self.discovery = discovery
         self.settings = self.load_config()
         self.node_uid = self.settings.get('uid')
+        # An empty PeerCache setting turns the cache off.
+        self.peer_cache = PeerCache(self.settings['peer_cache']) if self.settings.get('peer_cache') else None
         self.transport.set_uid(self.node_uid)
         self.discovery.set_uid(self.node_uid)
         self.transport.set_addr(self.node_addr)
@@ -34,9 +40,21 @@ class Node:
         
     async def _on_node_discovered(self, event: events.NodeDiscoveredEvent):
         self.nodes[event.node_id] = event.node_metadata
+        if self.peer_cache is not None and event.node_metadata.get('ip'):
+            self.peer_cache.update(event.node_id, event.node_metadata['ip'], event.node_metadata)
 
     async def _on_node_lost(self, event: events.NodeLostEvent):
         del self.nodes[event.node_id]
+        if self.peer_cache is not None:
+            self.peer_cache.touch(event.node_id)
+
+    async def _on_peer_connected(self, event: events.PeerConnectedEvent):
+        if self.peer_cache is not None:
+            self.peer_cache.touch(event.node_id, connected=True)
+
+    async def _on_peer_disconnected(self, event: events.PeerDisconnectedEvent):
+        if self.peer_cache is not None:
+            self.peer_cache.touch(event.node_id)
 
     def ensure_config_exists(self):
         if not os.path.exists(self.CONFIG_PATH):
@@ -46,6 +64,7 @@ class Node:
                 "DiscoveryPort": "50000",
                 "TransportPort": "50001",
                 "uid": str(uuid.uuid4()),
+                "PeerCache": self.PEER_CACHE_PATH,
             }
 
             with open(self.CONFIG_PATH, "w") as configfile:
@@ -62,14 +81,24 @@ class Node:
             "discovery_port": int(network["DiscoveryPort"]),
             "transport_port": int(network["TransportPort"]),
             "uid": network["uid"],
+            "peer_cache": network.get("PeerCache", self.PEER_CACHE_PATH),
         }
     
     async def start_network(self):
         asyncio.create_task(self.transport.start())
         logging.info('[Node] Transport started')
+        if self.peer_cache is not None:
+            self.peer_cache.load()
+            self.peer_cache.start()
+            # Peers seen in earlier runs are dialed right away, while discovery is still waiting for their announcements.
+            for uid, ip in self.peer_cache.peers():
+                if uid != self.node_uid:
+                    self.transport.dial_cached_peer(uid, ip)
         await self.discovery.start()
         logging.info('[Node] Discovery started')
 
     async def stop_network(self):
         await self.transport.stop()
         await self.discovery.stop()
+        if self.peer_cache is not None:
+            await self.peer_cache.stop()
@@ -0,0 +1,206 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def _encode(record: dict) -> str:
+    return json.dumps(record, separators=(',', ':'), default=str)
+
+class PeerCache:
+    """
+    Кэш известных узлов на диске: после перезапуска узел сразу соединяется
+    с теми, кого видел раньше, не дожидаясь обнаружения.
+
+    Файл — журнал JSON-строк, по строке на изменение записи. Изменения
+    копятся в памяти и раз в flush_interval дописываются в конец файла
+    одним блоком с fsync, поэтому при сбое теряется не больше последнего
+    недописанного блока, а оборванная строка при загрузке пропускается.
+    Когда строк в журнале становится вдвое больше, чем живых записей,
+    он переписывается во временный файл, который атомарно заменяет
+    старый. Записи старше max_age секунд при загрузке отбрасываются.
+    """
+
+    MAX_AGE = 7 * 24 * 3600
+    MAX_ENTRIES = 1024
+    FLUSH_INTERVAL = 1.0
+    COMPACT_MIN_LINES = 64
+
+    def __init__(self, path: str, max_age: float = None, max_entries: int = None, flush_interval: float = None):
+        self.path = path
+        self.max_age = max_age if max_age is not None else self.MAX_AGE
+        self.max_entries = max_entries if max_entries is not None else self.MAX_ENTRIES
+        self.flush_interval = flush_interval if flush_interval is not None else self.FLUSH_INTERVAL
+        self.entries = {}
+        self.lines = 0
+        self.skipped_lines = 0
+        self.writes = 0
+        self.compactions = 0
+        self._dirty = set()
+        self._writing: asyncio.Future = None
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task = None
+
+    def __contains__(self, uid: str) -> bool:
+        return uid in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def load(self):
+        """Читает журнал; последняя запись об узле заменяет предыдущие."""
+        self.entries = {}
+        self.lines = 0
+        self.skipped_lines = 0
+        try:
+            with open(self.path, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logging.warning(f'[PeerCache] Could not read {self.path}: {e}')
+            return
+        for line in data.splitlines():
+            try:
+                record = json.loads(line)
+                uid = record['uid']
+            except (ValueError, TypeError, KeyError):
+                # A torn write from a crash leaves at most one broken line at the end.
+                self.skipped_lines += 1
+                continue
+            self.lines += 1
+            if record.get('deleted'):
+                self.entries.pop(uid, None)
+            else:
+                self.entries[uid] = record
+        self._expire()
+        torn = data and not data.endswith(b'\n')
+        if self.skipped_lines or torn or self._needs_compaction():
+            self._compact(self._snapshot())
+        logging.info(f'[PeerCache] Loaded {len(self.entries)} peers from {self.path}')
+
+    def peers(self) -> list[tuple[str, str]]:
+        """(uid, ip) узлов, которые стоит попробовать при старте, начиная с недавно виденных."""
+        self._expire()
+        entries = sorted(self.entries.values(), key=lambda entry: entry['last_seen'], reverse=True)
+        return [(entry['uid'], entry['ip']) for entry in entries[:self.max_entries]]
+
+    def update(self, uid: str, ip: str, metadata: dict = None):
+        entry = self.entries.get(uid)
+        if entry is None:
+            entry = self.entries[uid] = {'uid': uid, 'ip': ip, 'last_seen': 0.0, 'last_connected': None, 'metadata': None}
+        entry['ip'] = ip
+        entry['last_seen'] = time.time()
+        if metadata is not None:
+            entry['metadata'] = metadata
+        self._mark_dirty(uid)
+
+    def touch(self, uid: str, connected: bool = False):
+        """Обновляет время, когда узел был виден (и соединён, если connected)."""
+        entry = self.entries.get(uid)
+        if entry is None:
+            return
+        entry['last_seen'] = time.time()
+        if connected:
+            entry['last_connected'] = entry['last_seen']
+        self._mark_dirty(uid)
+
+    def remove(self, uid: str):
+        if self.entries.pop(uid, None) is not None:
+            self._mark_dirty(uid)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        # A write cancelled together with the flush task keeps running in its thread; wait for it first.
+        if self._writing is not None and not self._writing.done():
+            await self._writing
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        records = [self.entries.get(uid) or {'uid': uid, 'deleted': True} for uid in dirty]
+        loop = asyncio.get_running_loop()
+        if self._needs_compaction(len(records)):
+            self._writing = loop.run_in_executor(None, self._compact, self._snapshot())
+        else:
+            self._writing = loop.run_in_executor(None, self._append, [_encode(record) for record in records])
+        await asyncio.shield(self._writing)
+
+    def get_stats(self) -> dict:
+        return {
+            'path': self.path,
+            'peers': len(self.entries),
+            'lines': self.lines,
+            'skipped_lines': self.skipped_lines,
+            'pending': len(self._dirty),
+            'writes': self.writes,
+            'compactions': self.compactions,
+        }
+
+    def _mark_dirty(self, uid: str):
+        self._dirty.add(uid)
+        self._wakeup.set()
+
+    def _expire(self):
+        deadline = time.time() - self.max_age
+        for uid in [uid for uid, entry in self.entries.items() if entry['last_seen'] < deadline]:
+            del self.entries[uid]
+
+    def _needs_compaction(self, extra_lines: int = 0) -> bool:
+        lines = self.lines + extra_lines
+        return lines >= self.COMPACT_MIN_LINES and lines > 2 * len(self.entries)
+
+    def _snapshot(self) -> list[str]:
+        return [_encode(entry) for entry in self.entries.values()]
+
+    def _append(self, lines: list[str]):
+        try:
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write('\n'.join(lines) + '\n')
+                file.flush()
+                os.fsync(file.fileno())
+        except OSError as e:
+            logging.warning(f'[PeerCache] Could not write {self.path}: {e}')
+            return
+        self.lines += len(lines)
+        self.writes += 1
+
+    def _compact(self, lines: list[str]):
+        temporary = f'{self.path}.tmp'
+        try:
+            with open(temporary, 'w', encoding='utf-8') as file:
+                if lines:
+                    file.write('\n'.join(lines) + '\n')
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary, self.path)
+        except OSError as e:
+            logging.warning(f'[PeerCache] Could not rewrite {self.path}: {e}')
+            return
+        self.lines = len(lines)
+        self.writes += 1
+        self.compactions += 1
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.warning(f'[PeerCache] unexpected error: {e}')
@@ -0,0 +1,62 @@
+class PeerRegistry:
+    """
+    Реестр соединений с копированием при записи.
+
+    Чтение (get, snapshot, итерация) не требует блокировок: словарь, на который
+    указывает self._peers, никогда не изменяется на месте, а при каждой записи
+    заменяется новой копией. Все методы изменения синхронные и не содержат await,
+    поэтому в пределах одного цикла событий выполняются атомарно.
+    """
+
+    def __init__(self):
+        self._peers = {}
+        self._dialing = set()
+
+    def __len__(self):
+        return len(self._peers)
+
+    def __contains__(self, uid):
+        return uid in self._peers
+
+    def __iter__(self):
+        return iter(self._peers)
+
+    def get(self, uid: str):
+        return self._peers.get(uid)
+
+    def snapshot(self) -> dict:
+        return self._peers
+
+    def is_dialing(self, uid: str) -> bool:
+        return uid in self._dialing
+
+    def begin_dial(self, uid: str) -> bool:
+        if uid in self._peers or uid in self._dialing:
+            return False
+        self._dialing.add(uid)
+        return True
+
+    def end_dial(self, uid: str):
+        self._dialing.discard(uid)
+
+    def add(self, peer):
+        peers = dict(self._peers)
+        previous = peers.get(peer.uid)
+        peers[peer.uid] = peer
+        self._peers = peers
+        return previous
+
+    def remove(self, uid: str, peer=None):
+        current = self._peers.get(uid)
+        if current is None or (peer is not None and current is not peer):
+            return None
+        peers = dict(self._peers)
+        del peers[uid]
+        self._peers = peers
+        return current
+
+    def clear(self) -> list:
+        peers = list(self._peers.values())
+        self._peers = {}
+        self._dialing.clear()
+        return peers
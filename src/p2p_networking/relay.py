@@ -0,0 +1,297 @@
+from p2p_networking import events
+from p2p_networking import messages
+from p2p_networking import metrics
+from p2p_networking import wire
+from collections import deque
+import hashlib
+import logging
+import math
+import os
+import random
+import struct
+import time
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# RELAY frame body, after the wire header (never compressed):
+#   16 bytes: message id
+#   1 byte:   remaining hops (TTL)
+#   1 byte:   hops taken so far
+#   8 bytes:  origin send time (time.time(), double)
+#   1 byte + utf-8: origin uid
+#   1 byte + utf-8: destination uid, empty for a broadcast
+#   rest:     payload encoded with the codec from the wire header
+_RELAY_HEADER = struct.Struct('>16sBBd')
+_TTL_OFFSET = 16
+
+RELAY_FRAMES = metrics.counter('p2p_relay_frames_total', 'Relay frames by outcome', ('result',))
+RELAY_DELIVERY_SECONDS = metrics.histogram('p2p_relay_delivery_seconds', 'Time from origin to delivery of relayed messages')
+
+def _pack_uid(uid: "str | None") -> bytes:
+    encoded = uid.encode() if uid else b''
+    if len(encoded) > 0xFF:
+        raise ValueError('Node id is too long for a relay frame')
+    return bytes((len(encoded),)) + encoded
+
+def _unpack_uid(frame, offset: int) -> tuple:
+    length = frame[offset]
+    offset += 1
+    if offset + length > len(frame):
+        raise ValueError('Truncated relay frame')
+    return (bytes(frame[offset:offset + length]).decode() or None), offset + length
+
+class SeenFilter:
+    """
+    Множество уже виденных идентификаторов сообщений с ограниченной памятью.
+
+    Идентификаторы записываются в фильтр Блума текущей корзины. Корзина
+    сменяется каждые interval секунд или после capacity записей, помнятся
+    последние buckets корзин, так что память постоянна, а сообщение
+    считается новым снова не раньше чем через buckets * interval секунд.
+    Ложноположительный ответ (новое сообщение сочтено повтором и не
+    переслано) возможен с вероятностью около error_rate на корзину.
+    """
+
+    CAPACITY = 50_000
+    ERROR_RATE = 0.001
+    BUCKETS = 3
+    INTERVAL = 20.0
+
+    def __init__(self, capacity: int = None, error_rate: float = None, buckets: int = None, interval: float = None):
+        self.capacity = capacity if capacity is not None else self.CAPACITY
+        self.error_rate = error_rate if error_rate is not None else self.ERROR_RATE
+        self.buckets = buckets if buckets is not None else self.BUCKETS
+        self.interval = interval if interval is not None else self.INTERVAL
+        if self.capacity < 1 or self.buckets < 1 or not 0 < self.error_rate < 1:
+            raise ValueError('Invalid seen filter parameters')
+        self.bits = max(8, math.ceil(-self.capacity * math.log(self.error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / self.capacity * math.log(2)))
+        self._size = (self.bits + 7) // 8
+        self._buckets = deque([bytearray(self._size)])
+        self._count = 0
+        self._rotated_at = time.monotonic()
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._size * self.buckets
+
+    def add(self, key: bytes) -> bool:
+        """Запоминает ключ; возвращает False, если он уже встречался."""
+        self._maybe_rotate()
+        positions = self._positions(key)
+        for bucket in self._buckets:
+            if all(bucket[position >> 3] & (1 << (position & 7)) for position in positions):
+                return False
+        current = self._buckets[-1]
+        for position in positions:
+            current[position >> 3] |= 1 << (position & 7)
+        self._count += 1
+        return True
+
+    def _positions(self, key: bytes) -> list:
+        # Ids come from other nodes, so they are hashed rather than trusted to be random.
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'big')
+        second = int.from_bytes(digest[8:], 'big') | 1
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    def _maybe_rotate(self):
+        now = time.monotonic()
+        elapsed = int((now - self._rotated_at) // self.interval)
+        if elapsed == 0 and self._count < self.capacity:
+            return
+        for _ in range(min(max(elapsed, 1), self.buckets)):
+            self._buckets.append(bytearray(self._size))
+            if len(self._buckets) > self.buckets:
+                self._buckets.popleft()
+        self._count = 0
+        self._rotated_at = now
+
+class Relay:
+    """
+    Доставка сообщений узлам, с которыми нет прямого соединения.
+
+    Сообщение рассылается затоплением: каждый узел, впервые увидев его
+    идентификатор, доставляет его себе (если оно адресовано всем или ему)
+    и пересылает fanout случайным соседям (всем, если fanout не задан),
+    кроме того, от кого оно пришло. Каждый переход уменьшает TTL; повторы
+    отсекаются фильтром SeenFilter, поэтому каждый узел пересылает
+    сообщение не больше одного раза. Если адресат — прямой сосед, сообщение
+    отправляется только ему.
+
+    Доставленные сообщения публикуются как MessageReceivedEvent от узла-
+    источника; порядок сообщений, пришедших разными путями, не сохраняется.
+    Задержка по числу переходов считается по часам источника, так что на
+    разных машинах она включает расхождение часов.
+
+    Таблица reachable (узел-источник -> число переходов) помнит не больше
+    REACHABLE_SIZE узлов и не дольше REACHABLE_TTL секунд: источник указан
+    отправителем, и иначе любой сосед мог бы растить её без предела.
+    """
+
+    TTL = 8
+    FANOUT = None
+    REACHABLE_SIZE = 1024
+    REACHABLE_TTL = 60.0
+
+    def __init__(self, transport, ttl: int = None, fanout: int = None, seen: SeenFilter = None,
+                 channel: int = wire.DEFAULT_CHANNEL):
+        self.transport = transport
+        self.ttl = ttl if ttl is not None else self.TTL
+        self.fanout = fanout if fanout is not None else self.FANOUT
+        if not 1 <= self.ttl <= 0xFF:
+            raise ValueError('TTL must be between 1 and 255')
+        if self.fanout is not None and self.fanout < 1:
+            raise ValueError('Fanout must be positive')
+        self.seen = seen or SeenFilter()
+        self.channel = channel
+        self.stats = {'sent': 0, 'received': 0, 'duplicates': 0, 'delivered': 0, 'forwarded': 0, 'expired': 0, 'dropped': 0}
+        self.latency_by_hops = {}
+        self.reachable = {}
+        transport.register_frame_handler(wire.KIND_RELAY, self._on_frame)
+
+    def broadcast(self, data, ttl: int = None) -> int:
+        """Рассылает сообщение всем узлам сети; возвращает число соседей, которым оно отправлено."""
+        return self._originate(None, data, ttl)
+
+    def send(self, uid: str, data, ttl: int = None) -> int:
+        """Отправляет сообщение узлу uid, возможно через промежуточные узлы."""
+        return self._originate(uid, data, ttl)
+
+    def _originate(self, destination: "str | None", data, ttl: int = None) -> int:
+        message_id = os.urandom(16)
+        self.seen.add(message_id)
+        self.stats['sent'] += 1
+        head = (_RELAY_HEADER.pack(message_id, ttl if ttl is not None else self.ttl, 0, time.time())
+                + _pack_uid(self.transport.uid) + _pack_uid(destination))
+        frames = {}
+
+        def frame_for(codec: wire.Codec) -> bytes:
+            frame = frames.get(codec.id)
+            if frame is None:
+                frame = frames[codec.id] = wire.frame_header(wire.KIND_RELAY, codec, channel=self.channel) + head + codec.encode(data)
+            return frame
+        return self._send(self._targets(destination, ()), frame_for, self.channel)
+
+    def _on_frame(self, peer, frame):
+        # Called synchronously by PeerConnection; the frame is only valid during this call.
+        offset = wire.body_offset(frame)
+        if frame[1] & wire.FLAG_COMPRESSED:
+            raise ValueError('Compressed relay frame')
+        message_id, ttl, hops, sent_at = _RELAY_HEADER.unpack_from(frame, offset)
+        origin, position = _unpack_uid(frame, offset + _RELAY_HEADER.size)
+        destination, position = _unpack_uid(frame, position)
+        self._count('received')
+        if not self.seen.add(message_id):
+            self._count('duplicates')
+            return
+        hops += 1
+        codec = wire.get_codec_by_id(frame[0] & 0x0F)
+        if codec is None:
+            raise ValueError(f'Unknown codec id: {frame[0] & 0x0F}')
+        body = frame[position:]
+        data = None
+        decoded = False
+        if origin is not None and origin != self.transport.uid:
+            self._remember(origin, hops)
+        if destination is None or destination == self.transport.uid:
+            data = codec.decode(body)
+            decoded = True
+            self._deliver(origin, data, hops, sent_at, wire.frame_channel(frame))
+            if destination is not None:
+                return
+        if ttl <= 1:
+            self._count('expired')
+            return
+        patched = bytearray(frame)
+        patched[offset + _TTL_OFFSET] = ttl - 1
+        patched[offset + _TTL_OFFSET + 1] = hops
+        frames = {codec.id: bytes(patched)}
+        head = bytes(patched[offset:position])
+        header_channel = wire.frame_channel(frame)
+
+        def frame_for(target_codec: wire.Codec) -> bytes:
+            nonlocal data, decoded
+            forwarded = frames.get(target_codec.id)
+            if forwarded is None:
+                # The next peer negotiated another codec: re-encode the payload.
+                if not decoded:
+                    data = codec.decode(patched[position:])
+                    decoded = True
+                forwarded = frames[target_codec.id] = (wire.frame_header(wire.KIND_RELAY, target_codec, channel=header_channel)
+                                                       + head + target_codec.encode(data))
+            return forwarded
+        self._send(self._targets(destination, (peer.uid, origin)), frame_for, header_channel, forwarded=True)
+
+    def _remember(self, origin: str, hops: int):
+        # Entries stay in update order, so the oldest ones are always at the front.
+        now = time.monotonic()
+        reachable = self.reachable
+        reachable.pop(origin, None)
+        reachable[origin] = (hops, now)
+        while reachable:
+            oldest = next(iter(reachable))
+            if len(reachable) <= self.REACHABLE_SIZE and now - reachable[oldest][1] < self.REACHABLE_TTL:
+                break
+            del reachable[oldest]
+
+    def _deliver(self, origin: str, data, hops: int, sent_at: float, channel: int):
+        latency = max(0.0, time.time() - sent_at)
+        entry = self.latency_by_hops.get(hops)
+        if entry is None:
+            entry = self.latency_by_hops[hops] = [0, 0.0, 0.0]
+        entry[0] += 1
+        entry[1] += latency
+        entry[2] = max(entry[2], latency)
+        self._count('delivered')
+        if metrics.enabled:
+            RELAY_DELIVERY_SECONDS.observe(latency)
+        message = messages.UserMessage(data, channel)
+        self.transport.event_bus.publish_nowait(events.MessageReceivedEvent(message, origin, channel))
+
+    def _targets(self, destination: "str | None", exclude) -> list:
+        peers = self.transport.peers.snapshot()
+        if destination is not None:
+            peer = peers.get(destination)
+            if peer is not None and peer.codec is not None and not peer.is_closing:
+                return [peer]
+        candidates = [peer for uid, peer in peers.items()
+                      if uid not in exclude and peer.codec is not None and not peer.is_closing]
+        if self.fanout is not None and len(candidates) > self.fanout:
+            candidates = random.sample(candidates, self.fanout)
+        return candidates
+
+    def _send(self, peers: list, frame_for: callable, channel: int, forwarded: bool = False) -> int:
+        sent = 0
+        for peer in peers:
+            queue = peer.send_queue
+            # Flooding must not grow queues without bound: a congested peer misses the message.
+            if queue.queued_bytes >= queue.high_watermark or not peer.send_frame_nowait(frame_for(peer.codec), channel):
+                self._count('dropped')
+                continue
+            sent += 1
+            if forwarded:
+                self._count('forwarded')
+        return sent
+
+    def _count(self, result: str):
+        self.stats[result] += 1
+        if metrics.enabled:
+            RELAY_FRAMES.inc(1, (result,))
+
+    def get_reachable(self) -> dict:
+        """Узлы, от которых приходили сообщения, с числом переходов до них."""
+        now = time.monotonic()
+        return {uid: hops for uid, (hops, seen) in self.reachable.items() if now - seen < self.REACHABLE_TTL}
+
+    def get_stats(self) -> dict:
+        received = self.stats['received']
+        return {
+            **self.stats,
+            'duplicate_rate': self.stats['duplicates'] / received if received else 0.0,
+            'seen_filter_bytes': self.seen.memory_bytes,
+            'latency_by_hops': {
+                hops: {'delivered': count, 'avg_latency': total / count, 'max_latency': peak}
+                for hops, (count, total, peak) in sorted(self.latency_by_hops.items())
+            },
+        }
@@ -0,0 +1,199 @@
+from p2p_networking import messages
+from p2p_networking import wire
+from p2p_networking.send_queue import CONTROL_CHANNEL
+from collections import OrderedDict
+import asyncio
+import logging
+import random
+import struct
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# ACK frame body: epoch, cumulative sequence number, count of selective
+# ranges, then (first, last) pairs of sequence numbers received above it.
+_ACK = struct.Struct('>IQH')
+_RANGE = struct.Struct('>QQ')
+
+class ReliableSession:
+    """
+    Надёжная доставка сообщений одному узлу.
+
+    Каждое сообщение получает номер в пределах эпохи отправителя и хранится
+    в буфере повторной отправки, пока получатель его не подтвердит. Сессия
+    привязана к uid, а не к PeerConnection: при замене соединения все
+    неподтверждённые сообщения отправляются заново, а получатель отбрасывает
+    дубликаты. Подтверждения накапливаются и отправляются одним кадром раз в
+    ACK_DELAY секунд или после ACK_EVERY сообщений.
+    """
+
+    MAX_UNACKED = 1024
+    ACK_DELAY = 0.02
+    ACK_EVERY = 64
+    MAX_ACK_RANGES = 32
+
+    def __init__(self, uid: str):
+        self.uid = uid
+        self.peer = None
+        self.epoch = random.getrandbits(32)
+        self.next_seq = 1
+        self.sent = 0
+        self.acked = 0
+        self.resent = 0
+        self.duplicates = 0
+        self.acks_sent = 0
+        self._unacked = OrderedDict()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._closed_error: Exception = None
+        self._remote_epoch = None
+        self._received_upto = 0
+        self._received_above = set()
+        self._unacknowledged = 0
+        self._ack_handle: asyncio.TimerHandle = None
+
+    @property
+    def unacked(self) -> int:
+        return len(self._unacked)
+
+    # Sending
+
+    async def send(self, message: messages.Message) -> asyncio.Future:
+        """
+        Ставит сообщение в очередь надёжной доставки.
+
+        Ждёт места в буфере повторной отправки, если в нём MAX_UNACKED сообщений.
+
+        Returns:
+            Future, который получит True, когда узел подтвердит приём.
+        """
+        while not self._space.is_set():
+            if self._closed_error:
+                raise self._closed_error
+            await self._space.wait()
+        if self._closed_error:
+            raise self._closed_error
+        seq = self.next_seq
+        self.next_seq += 1
+        future = asyncio.get_running_loop().create_future()
+        self._unacked[seq] = (message, future)
+        if len(self._unacked) >= self.MAX_UNACKED:
+            self._space.clear()
+        self.sent += 1
+        peer = self.peer
+        if peer is not None:
+            await peer.send_frame(self._encode(peer, seq, message), message.channel)
+        return future
+
+    def _encode(self, peer, seq: int, message: messages.Message) -> bytes:
+        return wire.encode_message(message, peer.codec, peer.compression, (self.epoch, seq))
+
+    def attach(self, peer):
+        """Привязывает сессию к новому соединению и повторно отправляет неподтверждённые сообщения."""
+        self.peer = peer
+        peer.add_close_handler(lambda error: self.detach(peer))
+        for seq, (message, _) in self._unacked.items():
+            peer.send_frame_nowait(self._encode(peer, seq, message), message.channel)
+            self.resent += 1
+        if self._unacknowledged:
+            self._flush_ack()
+
+    def detach(self, peer):
+        if self.peer is peer:
+            self.peer = None
+
+    def on_ack_frame(self, frame):
+        epoch, cumulative, count = _ACK.unpack_from(frame, wire.body_offset(frame))
+        if epoch != self.epoch:
+            return
+        while self._unacked:
+            seq = next(iter(self._unacked))
+            if seq > cumulative:
+                break
+            self._acknowledge(seq)
+        offset = wire.body_offset(frame) + _ACK.size
+        for _ in range(count):
+            first, last = _RANGE.unpack_from(frame, offset)
+            offset += _RANGE.size
+            for seq in range(first, last + 1):
+                if seq in self._unacked:
+                    self._acknowledge(seq)
+        if len(self._unacked) < self.MAX_UNACKED:
+            self._space.set()
+
+    def _acknowledge(self, seq: int):
+        _, future = self._unacked.pop(seq)
+        self.acked += 1
+        if not future.done():
+            future.set_result(True)
+
+    def close(self, error: Exception):
+        """Отменяет доставку: все ожидающие future завершаются ошибкой error."""
+        self._closed_error = error
+        for _, future in self._unacked.values():
+            if not future.done():
+                future.set_exception(error)
+        self._unacked.clear()
+        self._space.set()
+        if self._ack_handle:
+            self._ack_handle.cancel()
+            self._ack_handle = None
+
+    # Receiving
+
+    def accept(self, epoch: int, seq: int) -> bool:
+        """Отмечает входящий кадр как полученный; возвращает False для дубликата."""
+        if epoch != self._remote_epoch:
+            # The sender restarted: its sequence numbers start over.
+            self._remote_epoch = epoch
+            self._received_upto = 0
+            self._received_above.clear()
+        duplicate = seq <= self._received_upto or seq in self._received_above
+        if duplicate:
+            self.duplicates += 1
+        else:
+            self._received_above.add(seq)
+            while self._received_upto + 1 in self._received_above:
+                self._received_upto += 1
+                self._received_above.discard(self._received_upto)
+        # Duplicates are acknowledged too: the original ack may have been lost with the connection.
+        self._unacknowledged += 1
+        if self._unacknowledged >= self.ACK_EVERY:
+            self._flush_ack()
+        elif self._ack_handle is None:
+            self._ack_handle = asyncio.get_running_loop().call_later(self.ACK_DELAY, self._flush_ack)
+        return not duplicate
+
+    def _ack_ranges(self) -> list:
+        ranges = []
+        for seq in sorted(self._received_above):
+            if ranges and seq == ranges[-1][1] + 1:
+                ranges[-1][1] = seq
+            elif len(ranges) < self.MAX_ACK_RANGES:
+                ranges.append([seq, seq])
+            else:
+                break
+        return ranges
+
+    def _flush_ack(self):
+        if self._ack_handle:
+            self._ack_handle.cancel()
+            self._ack_handle = None
+        peer = self.peer
+        if peer is None or peer.codec is None or self._remote_epoch is None:
+            return
+        ranges = self._ack_ranges()
+        body = _ACK.pack(self._remote_epoch, self._received_upto, len(ranges)) + b''.join(_RANGE.pack(*r) for r in ranges)
+        if peer.send_frame_nowait(wire.frame_header(wire.KIND_ACK, peer.codec) + body, CONTROL_CHANNEL):
+            self._unacknowledged = 0
+            self.acks_sent += 1
+
+    def get_stats(self) -> dict:
+        return {
+            'connected': self.peer is not None,
+            'unacked': len(self._unacked),
+            'sent': self.sent,
+            'acked': self.acked,
+            'resent': self.resent,
+            'duplicates': self.duplicates,
+            'acks_sent': self.acks_sent,
+        }
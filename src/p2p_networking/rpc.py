@@ -0,0 +1,153 @@
+from p2p_networking import wire
+from p2p_networking.send_queue import CONTROL_CHANNEL
+import asyncio
+import itertools
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# REQUEST body:  [method, payload, timeout in seconds or None]
+# RESPONSE body: [status, result or error text]
+# CANCEL has no body. All three carry the correlation id in the header.
+STATUS_OK = 0
+STATUS_ERROR = 1
+STATUS_NOT_FOUND = 2
+STATUS_DEADLINE_EXCEEDED = 3
+
+class RpcError(Exception):
+    pass
+
+class RemoteError(RpcError):
+    pass
+
+class MethodNotFoundError(RpcError):
+    pass
+
+class DeadlineExceededError(RpcError):
+    pass
+
+_ERRORS = {
+    STATUS_ERROR: RemoteError,
+    STATUS_NOT_FOUND: MethodNotFoundError,
+    STATUS_DEADLINE_EXCEEDED: DeadlineExceededError,
+}
+
+class RpcChannel:
+    """
+    Запросы и ответы поверх одного соединения с узлом.
+
+    Ожидающие запросы хранятся в словаре по идентификатору корреляции, поэтому
+    ответ сопоставляется за O(1), а число одновременных запросов не ограничено.
+    Таймаут запроса передаётся обработчику на другой стороне как срок
+    выполнения; отмена запроса (или истечение таймаута) отправляет CANCEL, и
+    обработчик на другой стороне отменяется.
+    """
+
+    def __init__(self, peer, handlers: dict):
+        self.peer = peer
+        self.handlers = handlers
+        self.requests_sent = 0
+        self.requests_served = 0
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._serving = {}
+        peer.register_frame_handler(wire.KIND_REQUEST, self._on_request)
+        peer.register_frame_handler(wire.KIND_RESPONSE, self._on_response)
+        peer.register_frame_handler(wire.KIND_CANCEL, self._on_cancel)
+        peer.add_close_handler(self._on_connection_closed)
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def request(self, method: str, payload=None, timeout: float = None, channel: int = wire.DEFAULT_CHANNEL):
+        codec = self.peer.codec
+        if codec is None:
+            raise ConnectionError(f'Peer {self.peer.uid} does not support requests')
+        correlation = next(self._ids) & 0xFFFFFFFF
+        future = asyncio.get_running_loop().create_future()
+        self._pending[correlation] = future
+        try:
+            frame = wire.encode_frame(wire.KIND_REQUEST, [method, payload, timeout], codec, channel=channel,
+                                      compression=self.peer.compression, correlation=correlation)
+            if not await self.peer.send_frame(frame, channel):
+                raise ConnectionError(f'Connection to {self.peer.uid} is closed')
+            self.requests_sent += 1
+            return await asyncio.wait_for(future, timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            if correlation in self._pending:
+                self.peer.send_frame_nowait(wire.frame_header(wire.KIND_CANCEL, codec, correlation=correlation), CONTROL_CHANNEL)
+            raise
+        finally:
+            self._pending.pop(correlation, None)
+
+    def _on_request(self, frame):
+        correlation = wire.frame_correlation(frame)
+        _, _, (method, payload, timeout) = wire.decode_frame(frame, self.peer.compression)
+        task = asyncio.create_task(self._serve(correlation, method, payload, timeout, wire.frame_channel(frame)))
+        self._serving[correlation] = task
+        task.add_done_callback(lambda _: self._serving.pop(correlation, None))
+
+    async def _serve(self, correlation: int, method: str, payload, timeout: float, channel: int):
+        handler = self.handlers.get(method)
+        if handler is None:
+            status, result = STATUS_NOT_FOUND, method
+        else:
+            try:
+                result = await asyncio.wait_for(handler(payload, self.peer.uid), timeout)
+                status = STATUS_OK
+            except asyncio.TimeoutError:
+                status, result = STATUS_DEADLINE_EXCEEDED, f'{method} did not finish within {timeout}s'
+            except asyncio.CancelledError:
+                # Cancelled by the caller: nobody is waiting for a response.
+                return
+            except Exception as e:
+                logging.warning(f'[RPC] [{self.peer.uid}]: Handler for {method} failed: {e}')
+                status, result = STATUS_ERROR, f'{type(e).__name__}: {e}'
+        self.requests_served += 1
+        codec = self.peer.codec
+        try:
+            frame = wire.encode_frame(wire.KIND_RESPONSE, [status, result], codec, channel=channel,
+                                      compression=self.peer.compression, correlation=correlation)
+        except Exception as e:
+            # The caller would otherwise wait for a response that never comes.
+            logging.warning(f'[RPC] [{self.peer.uid}]: Cannot encode the result of {method}: {e}')
+            frame = wire.encode_frame(wire.KIND_RESPONSE, [STATUS_ERROR, f'Cannot encode the result of {method}: {e}'], codec,
+                                      channel=channel, compression=self.peer.compression, correlation=correlation)
+        await self.peer.send_frame(frame, channel)
+
+    def _on_response(self, frame):
+        future = self._pending.pop(wire.frame_correlation(frame), None)
+        if future is None or future.done():
+            return
+        try:
+            _, _, (status, result) = wire.decode_frame(frame, self.peer.compression)
+        except (ValueError, TypeError) as e:
+            future.set_exception(RpcError(f'Malformed response: {e}'))
+            return
+        if status == STATUS_OK:
+            future.set_result(result)
+        else:
+            future.set_exception(_ERRORS.get(status, RpcError)(result))
+
+    def _on_cancel(self, frame):
+        task = self._serving.pop(wire.frame_correlation(frame), None)
+        if task:
+            task.cancel()
+
+    def _on_connection_closed(self, error: Exception):
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError(f'Connection lost: {error}'))
+        self._pending.clear()
+        for task in self._serving.values():
+            task.cancel()
+        self._serving.clear()
+
+    def get_stats(self) -> dict:
+        return {
+            'pending': len(self._pending),
+            'serving': len(self._serving),
+            'requests_sent': self.requests_sent,
+            'requests_served': self.requests_served,
+        }
@@ -0,0 +1,209 @@
+from p2p_networking import metrics
+from collections import deque
+import asyncio
+import logging
+import time
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Handshakes, keepalives and flow-control frames: always written first and
+# never blocked by the watermarks.
+CONTROL_CHANNEL = -1
+
+FRAMES_SENT = metrics.counter('p2p_frames_sent_total', 'Frames written to peer connections')
+BYTES_SENT = metrics.counter('p2p_bytes_sent_total', 'Frame bytes written to peer connections, without length prefixes')
+SEND_LATENCY = metrics.histogram('p2p_send_latency_seconds', 'Time the oldest frame of a batch waited in the send queue')
+
+class _Lane:
+
+    def __init__(self):
+        self.frames = deque()
+        self.bytes = 0
+        self.deficit = 0
+        self.writable = asyncio.Event()
+        self.writable.set()
+
+class SendQueue:
+    """
+    Очередь отправки кадров одного соединения с планировщиком каналов.
+
+    Кадры канала CONTROL_CHANNEL уходят в первую очередь (строгий приоритет).
+    Остальные каналы обслуживаются по алгоритму deficit round robin: за один
+    обход канал может отправить до QUANTUM * вес байтов, поэтому массовые
+    данные одного канала не задерживают другие дольше одного пакета.
+    Водяные знаки считаются для каждого канала отдельно, так что переполненный
+    канал блокирует только своих отправителей.
+    """
+
+    HIGH_WATERMARK = 1024 * 1024
+    LOW_WATERMARK = 256 * 1024
+    MAX_BATCH_BYTES = 64 * 1024
+    MAX_BATCH_DELAY = 0.0
+    QUANTUM = 16 * 1024
+
+    def __init__(self, writer, on_error: callable, high_watermark: int = None, low_watermark: int = None,
+                 max_batch_bytes: int = None, max_batch_delay: float = None, weights: dict = None):
+        self.writer = writer
+        self.on_error = on_error
+        self.high_watermark = high_watermark if high_watermark is not None else self.HIGH_WATERMARK
+        self.low_watermark = low_watermark if low_watermark is not None else self.LOW_WATERMARK
+        self.max_batch_bytes = max_batch_bytes if max_batch_bytes is not None else self.MAX_BATCH_BYTES
+        self.max_batch_delay = max_batch_delay if max_batch_delay is not None else self.MAX_BATCH_DELAY
+        if self.low_watermark > self.high_watermark:
+            raise ValueError('Low watermark must not exceed high watermark')
+        self.weights = dict(weights or {})
+        self.queued_bytes = 0
+        self.last_write = time.monotonic()
+        self._control = deque()
+        self._lanes = {}
+        self._active = deque()
+        self._count = 0
+        self._has_data = asyncio.Event()
+        self._closed = False
+        self._draining = False
+        self._queued_since = 0.0
+
+    @property
+    def queued_messages(self) -> int:
+        return self._count
+
+    @property
+    def is_busy(self) -> bool:
+        """В очереди есть кадры или запись ждёт освобождения буфера сокета."""
+        return self._count > 0 or self._draining
+
+    def set_weight(self, channel: int, weight: int):
+        if weight < 1:
+            raise ValueError('Channel weight must be positive')
+        self.weights[channel] = weight
+
+    def get_channel_stats(self) -> dict:
+        stats = {channel: len(lane.frames) for channel, lane in self._lanes.items() if lane.frames}
+        if self._control:
+            stats[CONTROL_CHANNEL] = len(self._control)
+        return stats
+
+    def _lane(self, channel: int) -> _Lane:
+        lane = self._lanes.get(channel)
+        if lane is None:
+            lane = self._lanes[channel] = _Lane()
+        return lane
+
+    def is_writable(self, channel: int = 0) -> bool:
+        lane = self._lanes.get(channel)
+        return lane is None or lane.writable.is_set()
+
+    async def wait_writable(self, channel: int = 0):
+        lane = self._lane(channel)
+        while not lane.writable.is_set():
+            if self._closed:
+                raise ConnectionError('Send queue is closed')
+            await lane.writable.wait()
+
+    async def put(self, frame: bytes, channel: int = 0):
+        if channel != CONTROL_CHANNEL:
+            await self.wait_writable(channel)
+        self.put_nowait(frame, channel)
+
+    def put_nowait(self, frame: bytes, channel: int = 0):
+        if self._closed:
+            raise ConnectionError('Send queue is closed')
+        if metrics.enabled and not self._count:
+            self._queued_since = time.monotonic()
+        if channel == CONTROL_CHANNEL:
+            self._control.append(frame)
+        else:
+            lane = self._lane(channel)
+            if not lane.frames:
+                self._active.append(channel)
+                lane.deficit = 0
+            lane.frames.append(frame)
+            lane.bytes += len(frame)
+            if lane.bytes >= self.high_watermark:
+                lane.writable.clear()
+        self._count += 1
+        self.queued_bytes += len(frame)
+        self._has_data.set()
+
+    def close(self):
+        self._closed = True
+        self._control.clear()
+        self._active.clear()
+        self._count = 0
+        self.queued_bytes = 0
+        # Wake blocked senders so they observe the closed state.
+        for lane in self._lanes.values():
+            lane.frames.clear()
+            lane.bytes = 0
+            lane.writable.set()
+
+    def _next_batch(self) -> tuple[list, int]:
+        batch = []
+        batch_bytes = 0
+        count = 0
+        control = self._control
+        while control:
+            frame = control.popleft()
+            batch.append(len(frame).to_bytes(4, 'big'))
+            batch.append(frame)
+            batch_bytes += len(frame)
+            count += 1
+        active = self._active
+        while active and batch_bytes < self.max_batch_bytes:
+            channel = active.popleft()
+            lane = self._lanes[channel]
+            frames = lane.frames
+            deficit = lane.deficit + self.QUANTUM * self.weights.get(channel, 1)
+            lane_bytes = 0
+            while frames and len(frames[0]) <= deficit:
+                frame = frames.popleft()
+                batch.append(len(frame).to_bytes(4, 'big'))
+                batch.append(frame)
+                lane_bytes += len(frame)
+                deficit -= len(frame)
+                count += 1
+            batch_bytes += lane_bytes
+            lane.bytes -= lane_bytes
+            if frames:
+                lane.deficit = deficit
+                active.append(channel)
+            else:
+                lane.deficit = 0
+            if lane.bytes <= self.low_watermark:
+                lane.writable.set()
+        self._count -= count
+        self.queued_bytes -= batch_bytes
+        if not self._count:
+            self._has_data.clear()
+        return batch, batch_bytes
+
+    async def run(self):
+        try:
+            while not self._closed:
+                await self._has_data.wait()
+                if self.max_batch_delay > 0 and self.queued_bytes < self.max_batch_bytes:
+                    await asyncio.sleep(self.max_batch_delay)
+                else:
+                    # Yield one loop tick so frames from concurrent senders land in the same batch.
+                    await asyncio.sleep(0)
+                batch, batch_bytes = self._next_batch()
+                if not batch:
+                    continue
+                self.writer.writelines(batch)
+                self.last_write = time.monotonic()
+                if metrics.enabled:
+                    FRAMES_SENT.inc(len(batch) // 2)
+                    BYTES_SENT.inc(batch_bytes)
+                    SEND_LATENCY.observe(self.last_write - self._queued_since)
+                    # Frames left behind by this batch have waited at most until now.
+                    self._queued_since = self.last_write
+                self._draining = True
+                try:
+                    await self.writer.drain()
+                finally:
+                    self._draining = False
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.close()
+            await self.on_error(e)
@@ -0,0 +1,502 @@
+from p2p_networking.abstract_classes import Transport
+from p2p_networking import events
+from p2p_networking import framing
+from p2p_networking import messages
+from p2p_networking.send_queue import SendQueue
+from p2p_networking.tcp_transport import TcpTransport
+from collections import deque
+import asyncio
+import inspect
+import logging
+import multiprocessing
+import os
+import pickle
+import shutil
+import tempfile
+import zlib
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# IPC commands are pickled tuples (name, *args) in length-prefixed frames.
+# Parent -> worker:
+_DISCOVERED = 'discovered'    # uid, metadata: the worker owns the node and dials it
+_KNOWN = 'known'              # uid, metadata: the node exists, another worker dials it
+_LOST = 'lost'                # uid
+_DIAL_CACHED = 'dial_cached'  # uid, ip: a peer from the peer cache, dialed before discovery
+_SEND = 'send'                # uid, data, channel
+_SEND_MANY = 'send_many'      # uids, data, channel
+_BROADCAST = 'broadcast'      # data, channel
+_CLOSE_PEER = 'close_peer'    # uid: another worker keeps the connection
+_STOP = 'stop'
+# Worker -> parent:
+_READY = 'ready'              # shard, pid
+_CONNECTED = 'connected'      # uid, outbound
+_DISCONNECTED = 'disconnected'  # uid
+_MESSAGE = 'message'          # uid, message type, data, channel
+
+_MESSAGE_CLASSES = {'user': messages.UserMessage, 'system': messages.SystemMessage}
+
+def shard_of(uid: str, shards: int) -> int:
+    """Номер рабочего процесса, который соединяется с узлом uid."""
+    return zlib.crc32(uid.encode()) % shards
+
+class _IpcChannel:
+    """
+    Канал команд между родительским и рабочим процессом поверх unix-сокета.
+
+    Запись идёт через SendQueue, поэтому команды, отправленные за один проход
+    цикла событий, уходят одним системным вызовом. Принятые команды
+    выполняются по очереди в отдельной задаче; если очередь разрастается,
+    чтение из сокета приостанавливается.
+    """
+
+    HIGH_WATERMARK = 1024
+    LOW_WATERMARK = 256
+
+    def __init__(self, protocol: framing.FrameProtocol, on_command: callable, on_closed: callable = None):
+        self.protocol = protocol
+        self.on_command = on_command
+        self.on_closed = on_closed
+        self.shard: int = None
+        self.send_queue = SendQueue(protocol, self._on_send_error)
+        self._inbound = deque()
+        self._inbound_ready = asyncio.Event()
+        self._reading_paused = False
+        self._is_lost = False
+        self._send_task = asyncio.create_task(self.send_queue.run())
+        self._receive_task = asyncio.create_task(self._receive())
+        protocol.set_frame_handler(self._on_frames)
+        protocol.set_close_handler(self._on_protocol_closed)
+
+    async def send(self, *command) -> bool:
+        try:
+            await self.send_queue.put(pickle.dumps(command, pickle.HIGHEST_PROTOCOL))
+            return True
+        except ConnectionError:
+            return False
+
+    def send_nowait(self, *command) -> bool:
+        try:
+            self.send_queue.put_nowait(pickle.dumps(command, pickle.HIGHEST_PROTOCOL))
+            return True
+        except ConnectionError:
+            return False
+
+    async def close(self):
+        self.send_queue.close()
+        for task in (self._send_task, self._receive_task):
+            if task is not asyncio.current_task():
+                task.cancel()
+        self.protocol.close()
+        await self.protocol.wait_closed()
+
+    async def _on_send_error(self, error: Exception):
+        self.protocol.close()
+
+    def _on_frames(self, frames: list):
+        for frame in frames:
+            self._inbound.append(pickle.loads(frame))
+        self._inbound_ready.set()
+        if not self._reading_paused and len(self._inbound) >= self.HIGH_WATERMARK:
+            self._reading_paused = True
+            self.protocol.pause_reading()
+
+    def _on_protocol_closed(self, error: Exception):
+        self._is_lost = True
+        self._inbound_ready.set()
+
+    async def _receive(self):
+        try:
+            while True:
+                if not self._inbound:
+                    if self._is_lost:
+                        break
+                    self._inbound_ready.clear()
+                    await self._inbound_ready.wait()
+                    continue
+                command = self._inbound.popleft()
+                try:
+                    await self.on_command(*command)
+                except Exception as e:
+                    logging.warning(f'[ShardedTransport] Command {command[0]} failed: {e}')
+                if self._reading_paused and len(self._inbound) <= self.LOW_WATERMARK:
+                    self._reading_paused = False
+                    self.protocol.resume_reading()
+        except asyncio.CancelledError:
+            return
+        self.send_queue.close()
+        self._send_task.cancel()
+        if self.on_closed:
+            await self.on_closed()
+
+class _Worker:
+    """Рабочий процесс: свой цикл событий, свой TcpTransport на общем порту."""
+
+    def __init__(self, shard: int, socket_path: str, uid: str, addr: str, port: int, transport_options: dict,
+                 setup: callable, forward_messages: bool):
+        self.shard = shard
+        self.socket_path = socket_path
+        self.uid = uid
+        self.addr = addr
+        self.port = port
+        self.transport_options = transport_options
+        self.setup = setup
+        self.forward_messages = forward_messages
+        self.event_bus: events.EventBus = None
+        self.transport: TcpTransport = None
+        self.ipc: _IpcChannel = None
+        self._stopped: asyncio.Event = None
+
+    async def run(self):
+        self._stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        _, protocol = await loop.create_unix_connection(framing.FrameProtocol, self.socket_path)
+        self.ipc = _IpcChannel(protocol, self._on_command, self._on_parent_lost)
+        self.event_bus = events.EventBus()
+        self.transport = TcpTransport(self.event_bus, reuse_port=True, **self.transport_options)
+        self.transport.set_uid(self.uid)
+        self.transport.set_addr(self.addr)
+        self.transport.set_port(self.port)
+        self.event_bus.subscribe(events.PeerConnectedEvent, self._on_peer_connected)
+        self.event_bus.subscribe(events.PeerDisconnectedEvent, self._on_peer_disconnected)
+        if self.forward_messages:
+            self.event_bus.subscribe(events.MessageReceivedEvent, self._on_message)
+        if self.setup is not None:
+            result = self.setup(self.transport, self.event_bus, self.shard)
+            if inspect.isawaitable(result):
+                await result
+        server_task = asyncio.create_task(self.transport.start())
+        while not self.transport.is_serving:
+            if server_task.done():
+                # Surfaces the bind error in the worker log; the parent sees the channel close.
+                server_task.result()
+            await asyncio.sleep(0.01)
+        self.ipc.send_nowait(_READY, self.shard, os.getpid())
+        await self._stopped.wait()
+        await self.transport.stop()
+        server_task.cancel()
+        await self.event_bus.close()
+        await self.ipc.close()
+
+    async def _on_peer_connected(self, event: events.PeerConnectedEvent):
+        self.ipc.send_nowait(_CONNECTED, event.node_id, event.outbound)
+
+    async def _on_peer_disconnected(self, event: events.PeerDisconnectedEvent):
+        self.ipc.send_nowait(_DISCONNECTED, event.node_id)
+
+    async def _on_message(self, event: events.MessageReceivedEvent):
+        message = event.message
+        await self.ipc.send(_MESSAGE, event.node_id, message.type, message.data, message.channel)
+
+    async def _on_parent_lost(self):
+        logging.warning(f'[ShardedTransport] [shard {self.shard}]: Lost the parent process, stopping')
+        self._stopped.set()
+
+    async def _on_command(self, name: str, *args):
+        if name == _SEND:
+            uid, data, channel = args
+            await self.transport.send_to_peer(uid, data, channel)
+        elif name == _SEND_MANY:
+            uids, data, channel = args
+            await self.transport.send_to_many(uids, data, channel=channel)
+        elif name == _BROADCAST:
+            data, channel = args
+            await self.transport.broadcast(data, channel=channel)
+        elif name == _DISCOVERED:
+            uid, metadata = args
+            await self.event_bus.publish(events.NodeDiscoveredEvent(uid, metadata))
+        elif name == _KNOWN:
+            uid, metadata = args
+            self.transport.known_nodes[uid] = metadata.get('ip')
+        elif name == _DIAL_CACHED:
+            self.transport.dial_cached_peer(*args)
+        elif name == _LOST:
+            await self.event_bus.publish(events.NodeLostEvent(args[0]))
+        elif name == _CLOSE_PEER:
+            # Another worker holds the preferred connection: forget the node here.
+            await self.transport.delete_peer(events.NodeLostEvent(args[0]))
+        elif name == _STOP:
+            self._stopped.set()
+        else:
+            logging.warning(f'[ShardedTransport] [shard {self.shard}]: Unknown command {name}')
+
+def _worker_main(shard: int, socket_path: str, uid: str, addr: str, port: int, transport_options: dict,
+                 setup: callable, forward_messages: bool, use_uvloop: bool):
+    if use_uvloop and uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    worker = _Worker(shard, socket_path, uid, addr, port, transport_options, setup, forward_messages)
+    try:
+        asyncio.run(worker.run())
+    except KeyboardInterrupt:
+        pass
+
+class _Shard:
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process: multiprocessing.Process = None
+        self.ipc: _IpcChannel = None
+        self.pid: int = None
+        self.ready: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.restarts = 0
+
+    @property
+    def is_ready(self) -> bool:
+        return self.ipc is not None and self.ready.done()
+
+class ShardedTransport(Transport):
+    """
+    Транспорт, распределённый по нескольким процессам.
+
+    Запускает workers рабочих процессов, каждый со своим циклом событий
+    (uvloop, если он установлен) и своим TcpTransport. Все они слушают один
+    порт через SO_REUSEPORT, так что входящие соединения ядро распределяет
+    между процессами, а исходящие к узлу открывает процесс shard_of(uid).
+
+    Родительский процесс связан с рабочими unix-сокетами: он передаёт им
+    события обнаружения, хранит таблицу «узел -> процесс» и направляет
+    send_to_peer процессу, владеющему соединением. Если соединения с одним
+    узлом оказались в двух процессах, остаётся открытое узлом с меньшим uid,
+    как и в TcpTransport.
+
+    Сообщения обрабатываются в рабочих процессах: worker_setup(transport,
+    event_bus, shard) вызывается в каждом из них и может подписать свои
+    обработчики. С forward_messages=True сообщения также пересылаются
+    родителю и публикуются в его EventBus.
+    """
+
+    START_TIMEOUT = 30.0
+    STOP_TIMEOUT = 5.0
+    RESTART_DELAY = 1.0
+
+    def __init__(self, event_bus: events.EventBus, workers: int = None, worker_setup: callable = None,
+                 forward_messages: bool = True, use_uvloop: bool = True, **transport_options):
+        super().__init__(event_bus)
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        if self.workers < 1:
+            raise ValueError('At least one worker is required')
+        self.worker_setup = worker_setup
+        self.forward_messages = forward_messages
+        self.use_uvloop = use_uvloop
+        self.transport_options = transport_options
+        self.routes = {}
+        self.known_nodes = {}
+        self.cached_peers = {}
+        self._shards: list[_Shard] = []
+        self._server = None
+        self._directory: str = None
+        self._stopping = False
+        self._stopped: asyncio.Event = None
+        self.event_bus.subscribe(events.NodeDiscoveredEvent, self._on_node_discovered)
+        self.event_bus.subscribe(events.NodeLostEvent, self._on_node_lost)
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._stopping = False
+        self._stopped = asyncio.Event()
+        self._directory = tempfile.mkdtemp(prefix='p2p-shards-')
+        socket_path = os.path.join(self._directory, 'ipc.sock')
+        self._server = await loop.create_unix_server(lambda: framing.FrameProtocol(on_connection_made=self._on_worker_connected),
+                                                     socket_path)
+        self._shards = [_Shard(index) for index in range(self.workers)]
+        for shard in self._shards:
+            self._spawn(shard)
+        try:
+            await asyncio.wait_for(asyncio.gather(*(shard.ready for shard in self._shards)), self.START_TIMEOUT)
+        except asyncio.TimeoutError:
+            logging.error(f'[ShardedTransport] Workers did not start within {self.START_TIMEOUT}s')
+            await self.stop()
+            raise
+        logging.info(f'[ShardedTransport] {self.workers} workers are listening on port {self.port}')
+        await self._stopped.wait()
+
+    async def stop(self):
+        if self._server is None:
+            return
+        self._stopping = True
+        for shard in self._shards:
+            if shard.ipc:
+                shard.ipc.send_nowait(_STOP)
+        loop = asyncio.get_running_loop()
+        processes = [shard.process for shard in self._shards if shard.process]
+        await asyncio.gather(*(loop.run_in_executor(None, process.join, self.STOP_TIMEOUT) for process in processes))
+        for process in processes:
+            if process.is_alive():
+                logging.warning(f'[ShardedTransport] Worker {process.pid} did not stop, terminating')
+                process.terminate()
+        for shard in self._shards:
+            if shard.ipc:
+                await shard.ipc.close()
+                shard.ipc = None
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+        shutil.rmtree(self._directory, ignore_errors=True)
+        self.routes.clear()
+        self._stopped.set()
+        logging.info('[ShardedTransport] Workers stopped')
+
+    def _spawn(self, shard: _Shard):
+        context = multiprocessing.get_context('spawn')
+        shard.process = context.Process(
+            target=_worker_main,
+            args=(shard.index, os.path.join(self._directory, 'ipc.sock'), self.uid, self.addr, self.port,
+                  self.transport_options, self.worker_setup, self.forward_messages, self.use_uvloop),
+            name=f'p2p-shard-{shard.index}',
+            daemon=True,
+        )
+        shard.process.start()
+
+    def _on_worker_connected(self, protocol: framing.FrameProtocol):
+        # The worker identifies itself with its first command (READY).
+        channel = None
+
+        async def on_command(name, *args):
+            await self._on_worker_command(channel, name, *args)
+
+        async def on_closed():
+            await self._on_worker_lost(channel)
+
+        channel = _IpcChannel(protocol, on_command, on_closed)
+
+    async def _on_worker_command(self, channel: _IpcChannel, name: str, *args):
+        if name == _MESSAGE:
+            uid, message_type, data, message_channel = args
+            message_class = _MESSAGE_CLASSES.get(message_type, messages.UserMessage)
+            await self.publish_message_received_event(message_class(data, message_channel), uid)
+        elif name == _CONNECTED:
+            self._on_peer_connected(channel.shard, *args)
+        elif name == _DISCONNECTED:
+            uid = args[0]
+            if self.routes.get(uid, (None,))[0] == channel.shard:
+                del self.routes[uid]
+                self.event_bus.publish_nowait(events.PeerDisconnectedEvent(uid))
+        elif name == _READY:
+            index, pid = args
+            shard = self._shards[index]
+            channel.shard = index
+            shard.ipc = channel
+            shard.pid = pid
+            for uid, metadata in self.known_nodes.items():
+                self._announce(shard, uid, metadata)
+            for uid, ip in self.cached_peers.items():
+                if shard_of(uid, self.workers) == index and uid not in self.routes:
+                    channel.send_nowait(_DIAL_CACHED, uid, ip)
+            if not shard.ready.done():
+                shard.ready.set_result(None)
+            logging.info(f'[ShardedTransport] [shard {index}]: Worker {pid} is ready')
+
+    def _on_peer_connected(self, shard: int, uid: str, outbound: bool):
+        route = self.routes.get(uid)
+        if route is not None and route[0] != shard:
+            other, other_outbound = route
+            # Same rule as TcpTransport: prefer the connection dialed by the smaller uid;
+            # between two connections in the same direction the newer one replaces the stale one.
+            if outbound != other_outbound and outbound != (self.uid < uid):
+                self._shards[shard].ipc.send_nowait(_CLOSE_PEER, uid)
+                return
+            self._shards[other].ipc.send_nowait(_CLOSE_PEER, uid)
+        self.routes[uid] = (shard, outbound)
+        # Republished from the parent so Node and other subscribers see the same events as with TcpTransport.
+        self.event_bus.publish_nowait(events.PeerConnectedEvent(uid, outbound))
+
+    async def _on_worker_lost(self, channel: _IpcChannel):
+        index = channel.shard
+        if index is None or self._stopping:
+            return
+        shard = self._shards[index]
+        if shard.ipc is not channel:
+            return
+        shard.ipc = None
+        lost = [uid for uid, route in self.routes.items() if route[0] == index]
+        for uid in lost:
+            del self.routes[uid]
+            self.event_bus.publish_nowait(events.PeerDisconnectedEvent(uid))
+        shard.restarts += 1
+        logging.warning(f'[ShardedTransport] [shard {index}]: Worker {shard.pid} exited, restarting in {self.RESTART_DELAY}s')
+        await asyncio.sleep(self.RESTART_DELAY)
+        if not self._stopping:
+            self._spawn(shard)
+
+    def _announce(self, shard: _Shard, uid: str, metadata: dict):
+        # Only the owning worker dials, and only if no worker is connected already.
+        owner = shard.index == shard_of(uid, self.workers) and uid not in self.routes
+        shard.ipc.send_nowait(_DISCOVERED if owner else _KNOWN, uid, metadata)
+
+    def dial_cached_peer(self, uid: str, ip: str):
+        # Workers that are not ready yet get the peer together with the known nodes.
+        if uid == self.uid or uid in self.known_nodes:
+            return
+        self.cached_peers[uid] = ip
+        shard = self._shards[shard_of(uid, self.workers)] if self._shards else None
+        if shard is not None and shard.is_ready and uid not in self.routes:
+            shard.ipc.send_nowait(_DIAL_CACHED, uid, ip)
+
+    async def _on_node_discovered(self, event: events.NodeDiscoveredEvent):
+        self.known_nodes[event.node_id] = event.node_metadata
+        self.cached_peers.pop(event.node_id, None)
+        for shard in self._shards:
+            if shard.is_ready:
+                self._announce(shard, event.node_id, event.node_metadata)
+
+    async def _on_node_lost(self, event: events.NodeLostEvent):
+        self.known_nodes.pop(event.node_id, None)
+        if self.routes.pop(event.node_id, None) is not None:
+            self.event_bus.publish_nowait(events.PeerDisconnectedEvent(event.node_id))
+        for shard in self._shards:
+            if shard.is_ready:
+                shard.ipc.send_nowait(_LOST, event.node_id)
+
+    def _channel_for(self, uid: str) -> "_IpcChannel | None":
+        route = self.routes.get(uid)
+        return self._shards[route[0]].ipc if route else None
+
+    async def send_to_peer(self, uid, message_data, channel: int = 0) -> bool:
+        """Передаёт сообщение процессу, владеющему соединением с uid; True, если команда поставлена в очередь."""
+        ipc = self._channel_for(uid)
+        if ipc is None:
+            logging.info(f'[ShardedTransport] No connection to {uid}')
+            return False
+        return await ipc.send(_SEND, uid, message_data, channel)
+
+    async def send_to_many(self, uids, message_data, *, channel: int = 0, timeout: float = None) -> dict:
+        by_shard = {}
+        results = {}
+        for uid in uids:
+            route = self.routes.get(uid)
+            results[uid] = route is not None
+            if route is not None:
+                by_shard.setdefault(route[0], []).append(uid)
+        for index, shard_uids in by_shard.items():
+            ipc = self._shards[index].ipc
+            if ipc is None or not await ipc.send(_SEND_MANY, shard_uids, message_data, channel):
+                results.update(dict.fromkeys(shard_uids, False))
+        return results
+
+    async def broadcast(self, message_data, *, channel: int = 0, timeout: float = None) -> dict:
+        return await self.send_to_many(list(self.routes), message_data, channel=channel, timeout=timeout)
+
+    def get_stats(self) -> dict:
+        peers = [0] * self.workers
+        for shard, _ in self.routes.values():
+            peers[shard] += 1
+        return {
+            'workers': self.workers,
+            'uvloop': self.use_uvloop and uvloop is not None,
+            'shards': [
+                {
+                    'shard': shard.index,
+                    'pid': shard.pid,
+                    'alive': shard.process is not None and shard.process.is_alive(),
+                    'ready': shard.is_ready,
+                    'restarts': shard.restarts,
+                    'peers': peers[shard.index],
+                }
+                for shard in self._shards
+            ],
+        }
@@ -0,0 +1,397 @@
+from p2p_networking import wire
+from p2p_networking.send_queue import CONTROL_CHANNEL
+from collections import deque
+import asyncio
+import logging
+import mmap
+import os
+import struct
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Stream frame body (after the wire header and optional channel byte):
+#   OPEN:   stream id, metadata encoded with the peer codec
+#   DATA:   stream id, raw chunk bytes
+#   CREDIT: stream id, number of bytes the receiver has consumed
+#   CLOSE:  stream id, reason (END = half-close, RESET = abort)
+_STREAM_ID = struct.Struct('>I')
+_CREDIT = struct.Struct('>II')
+_CLOSE = struct.Struct('>IB')
+
+CLOSE_END = 0
+CLOSE_RESET = 1
+
+class StreamResetError(ConnectionError):
+    pass
+
+class Stream:
+    """
+    Двунаправленный поток байтов поверх соединения с узлом.
+
+    Данные режутся на кадры по CHUNK_SIZE, которые встают в очередь отправки
+    канала потока и чередуются с обычными сообщениями. Отправитель может иметь
+    в пути не больше WINDOW неподтверждённых байтов; получатель возвращает
+    кредит по мере чтения, поэтому память на обеих сторонах ограничена окном.
+    Кредит и сброс потока идут по управляющему каналу.
+
+    Соединение перестаёт отслеживать поток, когда он закрыт с обеих сторон,
+    а также когда данные от узла дочитаны до конца, а в поток с этой стороны
+    ещё ничего не записано; запись после этого снова регистрирует поток.
+    """
+
+    WINDOW = 256 * 1024
+    CHUNK_SIZE = 32 * 1024
+
+    def __init__(self, peer, stream_id: int, metadata: dict = None, on_finished: callable = None, channel: int = wire.DEFAULT_CHANNEL,
+                 on_reopened: callable = None):
+        self.peer = peer
+        self.id = stream_id
+        self.channel = channel
+        self.metadata = metadata or {}
+        self.on_finished = on_finished
+        self.on_reopened = on_reopened
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._send_credit = self.WINDOW
+        self._credit_available = asyncio.Event()
+        self._chunks = deque()
+        self._buffered = 0
+        self._unacknowledged = 0
+        self._data_ready = asyncio.Event()
+        self._local_closed = False
+        self._remote_closed = False
+        self._has_written = False
+        self._retired = False
+        self._error: Exception = None
+
+    @property
+    def uid(self) -> str:
+        return self.peer.uid
+
+    @property
+    def is_closed(self) -> bool:
+        return self._error is not None or (self._local_closed and self._remote_closed)
+
+    # Sending
+
+    async def write(self, data) -> None:
+        if self._retired and not self._error and not self._local_closed and self.on_reopened:
+            # Credit for a reply written after the end of the incoming data must reach this stream.
+            self._retired = False
+            self.on_reopened(self)
+        self._has_written = True
+        view = memoryview(data).cast('B')
+        offset = 0
+        while offset < len(view):
+            await self._wait_credit()
+            size = min(self.CHUNK_SIZE, self._send_credit, len(view) - offset)
+            header = wire.frame_header(wire.KIND_STREAM_DATA, self.peer.codec, channel=self.channel)
+            frame = b''.join((header, _STREAM_ID.pack(self.id), view[offset:offset + size]))
+            self._send_credit -= size
+            if not await self.peer.send_frame(frame, self.channel):
+                self._fail(ConnectionError('Connection closed while writing to stream'))
+                raise self._error
+            offset += size
+            self.bytes_sent += size
+
+    async def send_file(self, path, offset: int = 0, count: int = None) -> int:
+        """
+        Отправляет содержимое файла в поток.
+
+        Файл отображается в память через mmap, и кадры нарезаются прямо из
+        отображения; если mmap недоступен (пустой или специальный файл),
+        файл читается кусками по CHUNK_SIZE.
+
+        Returns:
+            Количество отправленных байтов.
+        """
+        with open(path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            end = size if count is None else min(size, offset + count)
+            try:
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                mapped = None
+            if mapped is not None:
+                with mapped:
+                    view = memoryview(mapped)
+                    try:
+                        await self.write(view[offset:end])
+                    finally:
+                        view.release()
+                return max(0, end - offset)
+            file.seek(offset)
+            sent = 0
+            while count is None or sent < count:
+                chunk = file.read(self.CHUNK_SIZE if count is None else min(self.CHUNK_SIZE, count - sent))
+                if not chunk:
+                    break
+                await self.write(chunk)
+                sent += len(chunk)
+            return sent
+
+    async def _wait_credit(self):
+        while self._send_credit <= 0:
+            if self._error:
+                raise self._error
+            self._credit_available.clear()
+            await self._credit_available.wait()
+        if self._error:
+            raise self._error
+        if self._local_closed:
+            raise ConnectionError('Stream is closed for writing')
+
+    async def close(self) -> None:
+        """Закрывает поток на запись; чтение продолжается до конца данных от узла."""
+        if self._local_closed or self._error:
+            return
+        self._local_closed = True
+        # END travels on the data channel so it cannot overtake queued chunks.
+        header = wire.frame_header(wire.KIND_STREAM_CLOSE, self.peer.codec, channel=self.channel)
+        await self.peer.send_frame(header + _CLOSE.pack(self.id, CLOSE_END), self.channel)
+        self._check_finished()
+
+    def abort(self) -> None:
+        """Прерывает поток в обоих направлениях."""
+        if self._error:
+            return
+        header = wire.frame_header(wire.KIND_STREAM_CLOSE, self.peer.codec)
+        self.peer.send_frame_nowait(header + _CLOSE.pack(self.id, CLOSE_RESET), CONTROL_CHANNEL)
+        self._fail(StreamResetError('Stream was aborted'))
+
+    # Receiving
+
+    async def read(self, n: int = -1) -> bytes:
+        """
+        Возвращает до n байтов (при n < 0 — всё, что уже получено).
+
+        Ждёт, пока появятся данные; пустой результат означает конец потока.
+        При n == 0 сразу возвращает b'' и ничего не читает.
+        """
+        if n == 0:
+            return b''
+        while not self._chunks:
+            if self._error:
+                raise self._error
+            if self._remote_closed:
+                return b''
+            self._data_ready.clear()
+            await self._data_ready.wait()
+        if n < 0 or n >= self._buffered:
+            data = b''.join(self._chunks)
+            self._chunks.clear()
+        else:
+            parts = []
+            remaining = n
+            while remaining:
+                chunk = self._chunks.popleft()
+                if len(chunk) > remaining:
+                    self._chunks.appendleft(chunk[remaining:])
+                    chunk = chunk[:remaining]
+                parts.append(chunk)
+                remaining -= len(chunk)
+            data = b''.join(parts)
+        self._consumed(len(data))
+        return data
+
+    async def receive_file(self, path) -> int:
+        """
+        Записывает данные потока в файл до конца потока.
+
+        Если отправитель указал в метаданных 'size', файл заранее создаётся
+        нужного размера и заполняется через mmap.
+
+        Returns:
+            Количество записанных байтов.
+        """
+        size = self.metadata.get('size')
+        received = 0
+        if isinstance(size, int) and size > 0:
+            with open(path, 'w+b') as file:
+                file.truncate(size)
+                with mmap.mmap(file.fileno(), size) as mapped:
+                    while True:
+                        chunk = await self.read()
+                        if not chunk:
+                            break
+                        if received + len(chunk) > size:
+                            self.abort()
+                            raise ValueError('Stream is longer than its declared size')
+                        mapped[received:received + len(chunk)] = chunk
+                        received += len(chunk)
+                if received != size:
+                    file.truncate(received)
+            return received
+        with open(path, 'wb') as file:
+            while True:
+                chunk = await self.read()
+                if not chunk:
+                    break
+                file.write(chunk)
+                received += len(chunk)
+        return received
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        chunk = await self.read()
+        if not chunk:
+            raise StopAsyncIteration
+        return chunk
+
+    def _consumed(self, size: int):
+        self._buffered -= size
+        self._unacknowledged += size
+        if self._unacknowledged >= self.WINDOW // 2 and not self._remote_closed:
+            header = wire.frame_header(wire.KIND_STREAM_CREDIT, self.peer.codec)
+            self.peer.send_frame_nowait(header + _CREDIT.pack(self.id, self._unacknowledged), CONTROL_CHANNEL)
+            self._unacknowledged = 0
+        self._check_finished()
+
+    # Called by StreamMultiplexer
+
+    def _on_data(self, chunk):
+        if self._remote_closed or self._error:
+            return
+        if self._buffered + len(chunk) > self.WINDOW:
+            logging.warning(f'[Stream] [{self.uid}:{self.id}]: Peer exceeded the flow control window, resetting')
+            self.abort()
+            return
+        self._chunks.append(bytes(chunk))
+        self._buffered += len(chunk)
+        self.bytes_received += len(chunk)
+        self._data_ready.set()
+
+    def _on_credit(self, size: int):
+        self._send_credit += size
+        self._credit_available.set()
+
+    def _on_close(self, reason: int):
+        if reason == CLOSE_RESET:
+            self._fail(StreamResetError('Stream was reset by peer'))
+        else:
+            self._remote_closed = True
+            self._data_ready.set()
+            self._check_finished()
+
+    def _fail(self, error: Exception):
+        if self._error is None:
+            self._error = error
+        self._chunks.clear()
+        self._buffered = 0
+        self._data_ready.set()
+        self._credit_available.set()
+        self._check_finished()
+
+    def _check_finished(self):
+        if self._retired or not self.on_finished:
+            return
+        # A drained stream with a closed remote side buffers nothing more; only an active writer still needs credit.
+        if self._error or (self._remote_closed and not self._chunks and (self._local_closed or not self._has_written)):
+            self._retired = True
+            self.on_finished(self)
+
+class StreamMultiplexer:
+    """
+    Таблица потоков одного соединения. Разбирает кадры потоков и раздаёт их
+    объектам Stream; регистрируется в PeerConnection как обработчик кадров.
+
+    Узел может держать открытыми не больше max_streams потоков, открытых
+    с его стороны; лишние сразу сбрасываются, так что память на соединение
+    ограничена max_streams * Stream.WINDOW.
+    """
+
+    MAX_STREAMS = 64
+
+    def __init__(self, peer, local_uid: str, on_stream_opened: callable, max_streams: int = None):
+        self.peer = peer
+        self.on_stream_opened = on_stream_opened
+        self.max_streams = max_streams if max_streams is not None else self.MAX_STREAMS
+        self.streams = {}
+        self.streams_refused = 0
+        self._remote_streams = set()
+        # The side with the smaller uid opens even ids, the other odd, so ids never collide.
+        self._next_id = 2 if local_uid < peer.uid else 1
+        peer.register_frame_handler(wire.KIND_STREAM_OPEN, self._on_open_frame)
+        peer.register_frame_handler(wire.KIND_STREAM_DATA, self._on_data_frame)
+        peer.register_frame_handler(wire.KIND_STREAM_CREDIT, self._on_credit_frame)
+        peer.register_frame_handler(wire.KIND_STREAM_CLOSE, self._on_close_frame)
+        peer.add_close_handler(self._on_connection_closed)
+
+    async def open(self, metadata: dict = None, channel: int = wire.DEFAULT_CHANNEL) -> Stream:
+        if self.peer.codec is None:
+            raise ConnectionError(f'Peer {self.peer.uid} does not support streams')
+        stream_id = self._next_id
+        self._next_id += 2
+        stream = self._add(stream_id, metadata, channel)
+        header = wire.frame_header(wire.KIND_STREAM_OPEN, self.peer.codec, channel=channel)
+        frame = header + _STREAM_ID.pack(stream_id) + self.peer.codec.encode(metadata or {})
+        if not await self.peer.send_frame(frame, channel):
+            stream._fail(ConnectionError('Connection closed while opening stream'))
+            raise stream._error
+        return stream
+
+    def _add(self, stream_id: int, metadata: dict, channel: int = wire.DEFAULT_CHANNEL) -> Stream:
+        stream = Stream(self.peer, stream_id, metadata, self._on_stream_finished, channel, self._on_stream_reopened)
+        self.streams[stream_id] = stream
+        return stream
+
+    def _is_remote(self, stream_id: int) -> bool:
+        return stream_id % 2 != self._next_id % 2
+
+    def _on_stream_finished(self, stream: Stream):
+        if self.streams.get(stream.id) is stream:
+            del self.streams[stream.id]
+        self._remote_streams.discard(stream.id)
+
+    def _on_stream_reopened(self, stream: Stream):
+        # Not counted against max_streams again: the remote side has ended and cannot buffer more data.
+        if not stream.is_closed:
+            self.streams[stream.id] = stream
+
+    def _on_open_frame(self, frame):
+        offset = wire.body_offset(frame)
+        stream_id = _STREAM_ID.unpack_from(frame, offset)[0]
+        if stream_id in self.streams:
+            logging.warning(f'[Stream] [{self.peer.uid}]: Duplicate stream id {stream_id}')
+            return
+        if not self._is_remote(stream_id):
+            raise ValueError(f'Stream id {stream_id} belongs to the local side')
+        if len(self._remote_streams) >= self.max_streams:
+            self.streams_refused += 1
+            logging.warning(f'[Stream] [{self.peer.uid}]: Too many open streams ({self.max_streams}), resetting stream {stream_id}')
+            header = wire.frame_header(wire.KIND_STREAM_CLOSE, self.peer.codec)
+            self.peer.send_frame_nowait(header + _CLOSE.pack(stream_id, CLOSE_RESET), CONTROL_CHANNEL)
+            return
+        codec = wire.get_codec_by_id(frame[0] & 0x0F)
+        body = frame[offset + _STREAM_ID.size:]
+        metadata = codec.decode(body) if codec and len(body) else {}
+        stream = self._add(stream_id, metadata, wire.frame_channel(frame))
+        self._remote_streams.add(stream_id)
+        self.on_stream_opened(stream)
+
+    def _on_data_frame(self, frame):
+        offset = wire.body_offset(frame)
+        stream_id = _STREAM_ID.unpack_from(frame, offset)[0]
+        stream = self.streams.get(stream_id)
+        if stream:
+            stream._on_data(frame[offset + _STREAM_ID.size:])
+
+    def _on_credit_frame(self, frame):
+        stream_id, size = _CREDIT.unpack_from(frame, wire.body_offset(frame))
+        stream = self.streams.get(stream_id)
+        if stream:
+            stream._on_credit(size)
+
+    def _on_close_frame(self, frame):
+        stream_id, reason = _CLOSE.unpack_from(frame, wire.body_offset(frame))
+        stream = self.streams.get(stream_id)
+        if stream:
+            stream._on_close(reason)
+
+    def _on_connection_closed(self, error: Exception):
+        for stream in list(self.streams.values()):
+            stream._fail(ConnectionError(f'Connection lost: {error}'))
+        self.streams.clear()
+        self._remote_streams.clear()
@@ -0,0 +1,308 @@
+from p2p_networking.abstract_classes import Discovery
+from p2p_networking.broadcast_discovery import UDPProtocol, encode_announcement, decode_announcement
+from p2p_networking.net import Net
+from p2p_networking import events
+import asyncio
+import logging
+import random
+import socket
+import time
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+PROBE_UDP = 'udp'
+PROBE_TCP = 'tcp'
+
+class Host:
+
+    def __init__(self, ip: str):
+        self.ip = ip
+        self.uid = None
+        self.failures = 0
+        self.last_seen = None
+        self.next_probe = 0.0
+
+class TokenBucket:
+    """Ограничитель скорости: не более rate событий в секунду с запасом burst."""
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate / 10)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class SweepDiscovery(Discovery):
+    """
+    Обнаружение узлов перебором адресов подсети, для сетей без широковещания.
+
+    Каждый проход отправляет на каждый адрес Net одноадресный UDP-пробник;
+    узлы (SweepDiscovery и BroadcastManager) отвечают на него hello. В режиме
+    'tcp' сначала проверяется, принимает ли хост соединения на transport_port,
+    и UDP-пробник отправляется только открытым хостам.
+
+    Адреса перебираются в случайном порядке не более чем CONCURRENCY
+    пробниками одновременно и не быстрее RATE_LIMIT пакетов в секунду.
+    Результаты кэшируются: известные узлы проверяются каждый проход, а
+    молчащие адреса откладываются с экспоненциальной задержкой до MAX_BACKOFF.
+    """
+
+    KEY_IP = 'ip'
+    CONCURRENCY = 1024
+    RATE_LIMIT = 1000
+    PROBE_TIMEOUT = 1.0
+    SWEEP_INTERVAL = 30
+    BACKOFF_BASE = 60
+    MAX_BACKOFF = 3600
+    MISSED_PROBES = 2
+
+    def __init__(self, event_bus: events.EventBus, net: Net, probe: str = PROBE_UDP, transport_port: int = None,
+                 probe_port: int = None, concurrency: int = None, rate_limit: float = None):
+        super().__init__(event_bus)
+        if probe not in (PROBE_UDP, PROBE_TCP):
+            raise ValueError(f'Unknown probe type: {probe}')
+        if probe == PROBE_TCP and transport_port is None:
+            raise ValueError('transport_port is required for TCP probes')
+        self.net = net
+        self.probe = probe
+        self.transport_port = transport_port
+        self.probe_port = probe_port
+        self.concurrency = concurrency or self.CONCURRENCY
+        self.rate_limit = rate_limit or self.RATE_LIMIT
+        self.hosts = {}
+        self.transport = None
+        self.protocol_instance = None
+        self.sweep_task: asyncio.Task = None
+        self.incarnation = 0
+        self.seq = 0
+        self.sweeps = 0
+        self.probes_sent = 0
+        self.last_sweep = None
+        self._pending = {}
+        self._probe_datagram = None
+
+    async def start(self):
+        if self.addr is None or self.port is None:
+            raise ValueError('[Sweep Discovery] Node address or port is None')
+        loop = asyncio.get_running_loop()
+        self.incarnation = int(time.time())
+        self._probe_datagram = bytes(encode_announcement('probe', self.uid, self.addr, 0, self.incarnation, 0))
+        transport_ready = loop.create_future()
+        self.transport, self.protocol_instance = await loop.create_datagram_endpoint(
+            lambda: UDPProtocol(self._on_datagram_received, transport_ready),
+            local_addr=('0.0.0.0', self.port),
+            family=socket.AF_INET,
+            proto=socket.IPPROTO_UDP
+        )
+        await asyncio.wait_for(transport_ready, timeout=5)
+        self.sweep_task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self.transport:
+            if self.sweep_task:
+                self.sweep_task.cancel()
+                try:
+                    await self.sweep_task
+                except asyncio.CancelledError:
+                    logging.info("[Sweep Discovery] The sweep task was successfully cancelled.")
+            self._say_goodbye()
+            self.transport.close()
+            self.transport = None
+            self.protocol_instance = None
+            self.sweep_task = None
+
+    def _announcement(self, action: str) -> bytearray:
+        self.seq += 1
+        return encode_announcement(action, self.uid, self.addr, self.seq, self.incarnation, self.SWEEP_INTERVAL)
+
+    def _say_goodbye(self):
+        datagram = self._announcement('bye')
+        for node in self.discovered_nodes.values():
+            try:
+                self.transport.sendto(datagram, (node[self.KEY_IP], self._probe_port()))
+            except Exception as e:
+                logging.warning(f"[Sweep Discovery] Failed to send goodbye message: {e}")
+
+    def _probe_port(self) -> int:
+        return self.probe_port or self.port
+
+    def _on_datagram_received(self, message, addr):
+        try:
+            announcement = decode_announcement(message)
+        except ValueError as e:
+            logging.warning(f'[Sweep Discovery] {e} in message from {addr}: {message}')
+            return
+        if not announcement.uid or not announcement.ip or announcement.uid == self.uid:
+            return
+        if announcement.action == 'probe':
+            if self.transport:
+                self.transport.sendto(self._announcement('hello'), addr)
+        elif announcement.action == 'hello':
+            waiter = self._pending.get(addr[0])
+            if waiter and not waiter.done():
+                waiter.set_result(announcement)
+            else:
+                asyncio.create_task(self._mark_alive(addr[0], announcement.uid, announcement.ip))
+        elif announcement.action == 'bye':
+            host = self.hosts.get(addr[0])
+            if host:
+                host.uid = None
+            asyncio.create_task(self._mark_lost(announcement.uid))
+
+    # Probing
+
+    async def _tcp_open(self, ip: str) -> bool:
+        self.probes_sent += 1
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(ip, self.transport_port), self.PROBE_TIMEOUT)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        return True
+
+    async def _udp_probe(self, ip: str):
+        waiter = asyncio.get_running_loop().create_future()
+        self._pending[ip] = waiter
+        try:
+            self.transport.sendto(self._probe_datagram, (ip, self._probe_port()))
+            self.probes_sent += 1
+            return await asyncio.wait_for(waiter, self.PROBE_TIMEOUT)
+        except (OSError, asyncio.TimeoutError):
+            return None
+        finally:
+            self._pending.pop(ip, None)
+
+    async def _probe(self, ip: str, bucket: TokenBucket):
+        await bucket.acquire()
+        if self.probe == PROBE_TCP:
+            if not await self._tcp_open(ip):
+                return None
+            await bucket.acquire()
+        return await self._udp_probe(ip)
+
+    def _backoff(self, failures: int) -> float:
+        delay = min(self.BACKOFF_BASE * 2 ** (failures - 1), self.MAX_BACKOFF)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _mark_alive(self, ip: str, uid: str, node_ip: str):
+        host = self.hosts.get(ip)
+        if host is None:
+            host = self.hosts[ip] = Host(ip)
+        host.uid = uid
+        host.failures = 0
+        host.last_seen = time.time()
+        host.next_probe = 0.0
+        is_new_node = uid not in self.discovered_nodes
+        self.discovered_nodes[uid] = {self.KEY_IP: node_ip, 'last_seen': host.last_seen}
+        if is_new_node:
+            await self.publish_node_discovered_event(uid, {self.KEY_IP: node_ip})
+            logging.info(f"[Sweep Discovery] Discovered the new node {uid}. Total: {len(self.discovered_nodes)}")
+
+    async def _mark_lost(self, uid: str):
+        if self.discovered_nodes.pop(uid, None):
+            logging.info(f"[Sweep Discovery] Node {uid} was deleted from the list")
+            await self.publish_node_lost_event(uid)
+
+    async def _mark_silent(self, ip: str):
+        host = self.hosts.get(ip)
+        if host is None:
+            host = self.hosts[ip] = Host(ip)
+        host.failures += 1
+        uid = host.uid
+        if uid is not None and host.failures < self.MISSED_PROBES:
+            # A known node gets re-probed on the next sweep before it is dropped.
+            host.next_probe = 0.0
+            return
+        host.uid = None
+        host.next_probe = time.monotonic() + self._backoff(host.failures)
+        if uid is not None:
+            await self._mark_lost(uid)
+
+    def _due_addresses(self, now: float):
+        addresses = self.net.addresses()
+        if len(addresses) > 2:
+            # Skip the network and broadcast addresses.
+            addresses = addresses[1:-1]
+        order = list(range(len(addresses)))
+        random.shuffle(order)
+        due = []
+        cached = 0
+        for index in order:
+            ip = addresses[index]
+            if ip == self.addr:
+                continue
+            host = self.hosts.get(ip)
+            if host is not None and host.next_probe > now:
+                cached += 1
+                continue
+            due.append(ip)
+        return due, cached
+
+    async def sweep(self) -> dict:
+        """
+        Выполняет один проход по подсети.
+
+        Returns:
+            Статистику прохода: число проверенных и пропущенных по кэшу адресов,
+            ответивших узлов, длительность и скорость в пакетах в секунду.
+        """
+        if not self.transport:
+            raise RuntimeError('[Sweep Discovery] Discovery is not started')
+        started = time.monotonic()
+        probes_before = self.probes_sent
+        due, cached = self._due_addresses(started)
+        bucket = TokenBucket(self.rate_limit)
+        pending = iter(due)
+        responded = 0
+
+        async def worker():
+            nonlocal responded
+            for ip in pending:
+                announcement = await self._probe(ip, bucket)
+                if announcement is None:
+                    await self._mark_silent(ip)
+                else:
+                    responded += 1
+                    await self._mark_alive(ip, announcement.uid, announcement.ip)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(due)))))
+        duration = time.monotonic() - started
+        probes = self.probes_sent - probes_before
+        self.sweeps += 1
+        self.last_sweep = {
+            'network': str(self.net),
+            'probed': len(due),
+            'cached': cached,
+            'responded': responded,
+            'duration': duration,
+            'probes_per_second': probes / duration if duration > 0 else 0.0,
+        }
+        return self.last_sweep
+
+    async def _sweep_loop(self):
+        while True:
+            try:
+                stats = await self.sweep()
+                logging.info(f"[Sweep Discovery] Swept {stats['network']}: {stats['probed']} probed, "
+                             f"{stats['cached']} cached, {stats['responded']} responded in {stats['duration']:.1f}s")
+            except Exception as e:
+                logging.exception(f'[Sweep Discovery] unexpected error: {e}')
+            await asyncio.sleep(self.SWEEP_INTERVAL)
+
+    def get_stats(self) -> dict:
+        return {
+            'sweeps': self.sweeps,
+            'probes_sent': self.probes_sent,
+            'nodes': len(self.discovered_nodes),
+            'hosts_cached': len(self.hosts),
+            'last_sweep': self.last_sweep,
+        }
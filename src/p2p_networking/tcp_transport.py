@@ -1,145 +1,477 @@
 from p2p_networking.abstract_classes import Transport
 from p2p_networking import messages
 from p2p_networking import events
+from p2p_networking import wire
+from p2p_networking import framing
+from p2p_networking import compression
+from p2p_networking import metrics
+from p2p_networking.send_queue import SendQueue, CONTROL_CHANNEL
+from p2p_networking.heartbeat import HeartbeatScheduler
+from p2p_networking.peer_registry import PeerRegistry
+from p2p_networking.streams import Stream, StreamMultiplexer
+from p2p_networking.reliable import ReliableSession
+from p2p_networking.rpc import RpcChannel
+from p2p_networking.dialer import DialScheduler
+from p2p_networking.loop_monitor import LoopMonitor
+from collections import deque
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 import asyncio
 import logging
+import time
+import weakref
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+FRAMES_RECEIVED = metrics.counter('p2p_frames_received_total', 'Frames received from peers')
+BYTES_RECEIVED = metrics.counter('p2p_bytes_received_total', 'Frame bytes received from peers, without length prefixes')
+CONNECTIONS_LOST = metrics.counter('p2p_connections_lost_total', 'Peer connections lost without a local close')
+HANDSHAKES = metrics.counter('p2p_handshakes_total', 'Inbound handshakes by result', ('result',))
+PEERS_CONNECTED = metrics.gauge('p2p_peers_connected', 'Open peer connections')
+SEND_QUEUE_BYTES = metrics.gauge('p2p_send_queue_bytes', 'Bytes waiting in peer send queues')
+SEND_QUEUE_FRAMES = metrics.gauge('p2p_send_queue_frames', 'Frames waiting in peer send queues')
+INBOUND_QUEUE_MESSAGES = metrics.gauge('p2p_inbound_queue_messages', 'Decoded messages waiting for delivery to the event bus')
+
+# Gauges are computed at scrape time over every live transport in the process.
+_transports = weakref.WeakSet()
+
+def _all_peers():
+    return [peer for transport in list(_transports) for peer in transport.peers.snapshot().values()]
+
+PEERS_CONNECTED.set_function(lambda: sum(len(transport.peers) for transport in list(_transports)))
+SEND_QUEUE_BYTES.set_function(lambda: sum(peer.send_queue.queued_bytes for peer in _all_peers()))
+SEND_QUEUE_FRAMES.set_function(lambda: sum(peer.send_queue.queued_messages for peer in _all_peers()))
+INBOUND_QUEUE_MESSAGES.set_function(lambda: sum(len(peer._inbound) for peer in _all_peers()))
+FRAMES_DECODED_OFFLOOP = metrics.counter('p2p_frames_decoded_offloop_total', 'Large frames decoded in the decode thread pool')
+
+def _decode_frames(frames: list, frame_compression: compression.FrameCompression, uid: str) -> list:
+    # Runs in the decode executor; frames are copies, so they outlive the protocol buffer.
+    decoded = []
+    for frame in frames:
+        try:
+            message = wire.decode_message(frame, frame_compression)
+        except Exception as e:
+            # An exception here would fail the whole batch and stop the listen task.
+            logging.warning(f'[PeerConnection] [{uid}]: Dropping malformed frame: {e!r}')
+            continue
+        if message is not None:
+            decoded.append(message)
+    return decoded
+
 class PeerConnection:
 
-    def __init__(self, id:str, ip: str, on_message: callable, on_connection_lost: callable, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    INBOUND_HIGH_WATERMARK = 1024
+    INBOUND_LOW_WATERMARK = 256
+    DECODE_THRESHOLD = 64 * 1024
+
+    def __init__(self, id:str, ip: str, on_message: callable, on_connection_lost: callable, protocol: framing.FrameProtocol,
+                 channel_weights: dict = None, outbound: bool = False, decode_executor: ThreadPoolExecutor = None,
+                 decode_threshold: int = None):
         self.uid = id
         self.ip = ip
+        self.outbound = outbound
         self.on_message = on_message
         self.on_connection_lost = on_connection_lost
-        self.writer = writer
-        self.reader = reader
+        self.protocol = protocol
+        self.writer = protocol
+        self.codec: wire.Codec = None
+        # Negotiation ended without a binary codec: only JSON messages can be exchanged.
+        self.json_only = False
+        self.compression = compression.FrameCompression()
+        self.send_queue = SendQueue(protocol, self._on_send_error, weights=channel_weights)
+        self.streams: StreamMultiplexer = None
+        self.rpc: RpcChannel = None
+        self.sequence_filter: callable = None
+        # Frames of at least decode_threshold bytes are decoded in decode_executor, in batches, in arrival order.
+        self.decode_executor = decode_executor
+        self.decode_threshold = decode_threshold if decode_threshold is not None else self.DECODE_THRESHOLD
+        self._frame_handlers = {}
+        self._close_handlers = []
+        self._inbound = deque()
+        self._inbound_ready = asyncio.Event()
+        self._reading_paused = False
+        self._lost_error: Exception = None
+        self._is_lost = False
+        self._lost_reported = False
         self._is_closing = False
         self._listen_task: asyncio.Task = None
-        self._keep_alive_task: asyncio.Task = None
+        self._send_task: asyncio.Task = None
+        self.last_receive = time.monotonic()
+        protocol.set_frame_handler(self._on_frames)
+        protocol.set_close_handler(self._on_protocol_closed)
 
     def set_listen_task(self, task):
         self._listen_task = task
 
-    def set_keep_alive_task(self, task):
-        self._keep_alive_task = task
+    def set_send_task(self, task):
+        self._send_task = task
+
+    def set_codec(self, codec: wire.Codec):
+        self.codec = codec
+
+    def set_compression(self, frame_compression: compression.FrameCompression):
+        self.compression = frame_compression
+
+    def register_frame_handler(self, kind: int, handler: callable):
+        # Handlers run synchronously from _on_frames and must copy any data they keep.
+        self._frame_handlers[kind] = handler
+
+    def add_close_handler(self, handler: callable):
+        self._close_handlers.append(handler)
+
+    @property
+    def last_send(self) -> float:
+        return self.send_queue.last_write
+
+    @property
+    def is_sending(self) -> bool:
+        return self.send_queue.is_busy
+
+    @property
+    def is_closing(self) -> bool:
+        return self._is_closing
+
+    @property
+    def is_lost(self) -> bool:
+        return self._is_lost
 
-    async def send_message(self, message:str):
-        encoded_message = message.encode()
-        length = len(encoded_message).to_bytes(4, 'big')
+    async def send_message(self, message: messages.Message) -> bool:
+        channel = CONTROL_CHANNEL if message.type == 'system' else message.channel
+        return await self.send_frame(wire.encode_message(message, self.codec, self.compression), channel)
+
+    async def send_keepalive(self) -> bool:
+        return await self.send_frame(wire.encode_keepalive(self.codec), CONTROL_CHANNEL)
+
+    def send_keepalive_nowait(self) -> bool:
+        return self.send_frame_nowait(wire.encode_keepalive(self.codec), CONTROL_CHANNEL)
+
+    async def send_frame(self, frame: bytes, channel: int = wire.DEFAULT_CHANNEL) -> bool:
         try:
-            self.writer.write(length + encoded_message)
-            await self.writer.drain()
-        except ConnectionResetError:
-            await self.on_connection_lost(self.uid, self.ip)
+            await self.send_queue.put(frame, channel)
+            return True
         except Exception as e:
             logging.warning(f'[PeerConnection] [{self.uid}]: Error sending message: {e}')
-    
-    async def _receive_message(self):
-        length_bytes = await self.reader.readexactly(4)
-        length = int.from_bytes(length_bytes, 'big')
-        message = await self.reader.readexactly(length)
-        return message.decode()
-    
+            return False
+
+    def send_frame_nowait(self, frame: bytes, channel: int = wire.DEFAULT_CHANNEL) -> bool:
+        try:
+            self.send_queue.put_nowait(frame, channel)
+            return True
+        except ConnectionError:
+            return False
+
+    async def report_lost(self):
+        if self._is_closing or self._lost_reported:
+            return
+        self._lost_reported = True
+        await self.on_connection_lost(self)
+
+    async def _on_send_error(self, error: Exception):
+        if self._is_closing:
+            return
+        if isinstance(error, ConnectionResetError):
+            await self.report_lost()
+        else:
+            logging.warning(f'[PeerConnection] [{self.uid}]: Error sending message: {error}')
+
+    def _on_frames(self, frames: list):
+        # Called synchronously by FrameProtocol; the memoryviews are only valid during this call.
+        self.last_receive = time.monotonic()
+        if metrics.enabled:
+            FRAMES_RECEIVED.inc(len(frames))
+            BYTES_RECEIVED.inc(sum(len(frame) for frame in frames))
+        offloaded = []
+        for frame in frames:
+            handler = self._frame_handlers.get(wire.frame_kind(frame))
+            if handler is not None:
+                try:
+                    handler(frame)
+                except Exception as e:
+                    logging.warning(f'[PeerConnection] [{self.uid}]: Dropping malformed frame: {e}')
+                continue
+            if self.decode_executor is not None and len(frame) >= self.decode_threshold:
+                # The sequence is checked before decoding, so the filter still sees frames in order.
+                if self.sequence_filter is not None:
+                    try:
+                        sequence = wire.frame_sequence(frame)
+                    except ValueError as e:
+                        logging.warning(f'[PeerConnection] [{self.uid}]: Dropping malformed frame: {e}')
+                        continue
+                    if sequence is not None and not self.sequence_filter(*sequence):
+                        continue
+                offloaded.append(bytes(frame))
+                continue
+            if offloaded:
+                self._offload(offloaded)
+                offloaded = []
+            try:
+                message = wire.decode_message(frame, self.compression)
+                if message is None:
+                    continue
+                sequence = wire.frame_sequence(frame) if self.sequence_filter is not None else None
+            except (ValueError, TypeError, KeyError) as e:
+                logging.warning(f'[PeerConnection] [{self.uid}]: Dropping malformed frame: {e}')
+                continue
+            if sequence is not None and not self.sequence_filter(*sequence):
+                continue
+            self._inbound.append(message)
+        if offloaded:
+            self._offload(offloaded)
+        if self._inbound:
+            self._inbound_ready.set()
+            if not self._reading_paused and len(self._inbound) >= self.INBOUND_HIGH_WATERMARK:
+                self._reading_paused = True
+                self.protocol.pause_reading()
+
+    def _offload(self, frames: list):
+        # The future takes the batch's place in the inbound queue, keeping messages in arrival order.
+        if metrics.enabled:
+            FRAMES_DECODED_OFFLOOP.inc(len(frames))
+        loop = asyncio.get_running_loop()
+        self._inbound.append(loop.run_in_executor(self.decode_executor, _decode_frames, frames, self.compression, self.uid))
+
+    def _on_protocol_closed(self, error: Exception):
+        self._is_lost = True
+        self._lost_error = error
+        self._inbound_ready.set()
+        handlers, self._close_handlers = self._close_handlers, []
+        for handler in handlers:
+            handler(error)
+
     async def close(self):
         if self._is_closing:
             return
         self._is_closing = True
-        self.writer.close()
-        await self.writer.wait_closed()
-        if self._listen_task:
-            self._listen_task.cancel()
+        self.send_queue.close()
+        if self._send_task:
+            self._send_task.cancel()
             try:
-                await self._listen_task
+                await self._send_task
             except asyncio.CancelledError:
                 pass
-        if self._keep_alive_task:
-            self._keep_alive_task.cancel()
+        self.protocol.close()
+        await self.protocol.wait_closed()
+        if self._listen_task:
+            self._listen_task.cancel()
             try:
-                await self._keep_alive_task
+                await self._listen_task
             except asyncio.CancelledError:
                 pass
         logging.info(f'[PeerConnection] [{self.uid}]: Connection closed')
-    
+
     async def start_listen(self):
         try:
             while True:
-                try:
-                    message = await self._receive_message()
-                    await self.on_message(message, self.uid)
-                except asyncio.IncompleteReadError as e:
-                    if e.partial == b'':
-                        await asyncio.sleep(0.1)
-                        continue
-                    else:
-                        logging.info(f'[PeerConnection] [{self.uid}]: The connection was not completely broken: {e}')
-                        await self.on_connection_lost(self.uid, self.ip)
+                if not self._inbound:
+                    if self._is_lost:
                         break
-        except (ConnectionResetError , asyncio.IncompleteReadError) as e:
-            logging.info(f'[PeerConnection] [{self.uid}]: The connection was lost due to an error: {e}')
-            await self.on_connection_lost(self.uid, self.ip)
+                    self._inbound_ready.clear()
+                    await self._inbound_ready.wait()
+                    continue
+                batch = self._inbound
+                self._inbound = deque()
+                for message in batch:
+                    if isinstance(message, asyncio.Future):
+                        for decoded in await message:
+                            await self.on_message(decoded, self.uid)
+                    else:
+                        await self.on_message(message, self.uid)
+                if self._reading_paused and len(self._inbound) <= self.INBOUND_LOW_WATERMARK:
+                    self._reading_paused = False
+                    self.protocol.resume_reading()
+            if not self._is_closing:
+                logging.info(f'[PeerConnection] [{self.uid}]: The connection was lost: {self._lost_error}')
+                await self.report_lost()
         except asyncio.CancelledError:
             pass
         except Exception as e:
-            logging.warning(f'[PeerConnection] [{self.uid}]: unexpected error: {e}')
-    
-    async def start_keep_alive(self, interval=10):
-        try:
-            while not self._is_closing:
-                await asyncio.sleep(interval)
-                try:
-                    await self.send_message('__keepalive__')
-                except Exception as e:
-                    logging.warning(f'[TcpTransport] [{self.uid}]: Failed to send keepalive: {e}')
-                    break
-        except asyncio.CancelledError:
-            pass
+            # Without report_lost the peer would stay registered with nobody reading its frames.
+            logging.warning(f'[PeerConnection] [{self.uid}]: unexpected error, dropping the connection: {e!r}')
+            await self.report_lost()
 
 class TcpTransport(Transport):
-     
-    def __init__(self, event_bus):
+    """
+    TCP-транспорт: по одному соединению на узел.
+
+    Соединяться начинают обе стороны, как только узнают друг о друге. Кадр
+    с идентификатором (и накопленные ранние данные) записывается в сокет сразу
+    при установке соединения, без ожидания ответа. Если соединений с узлом
+    оказалось два, обе стороны оставляют то, которое открыл узел с меньшим uid.
+    С auto_connect=False узлы не соединяются сами: с кем соединяться, решает
+    ConnectionManager, а max_inbound ограничивает число входящих соединений.
+    """
+
+    HANDSHAKE_TIMEOUT = 5.0
+    EARLY_DATA_LIMIT = 64 * 1024
+    DECODE_WORKERS = 1
+    SPECULATIVE_ATTEMPTS = 2
+
+    def __init__(self, event_bus, codecs: list = None, max_frame_size: int = None,
+                 heartbeat_interval: float = None, heartbeat_timeout: float = None, channel_weights: dict = None,
+                 compressors: list = None, compression_dictionaries: list = None, compression_threshold: int = None,
+                 dial_concurrency: int = None, connect_timeout: float = None, handshake_timeout: float = None,
+                 verify_peers: bool = False, reuse_port: bool = False, decode_workers: int = None,
+                 decode_threshold: int = None, loop_monitor_interval: float = None, auto_connect: bool = True,
+                 max_inbound: int = None):
         super().__init__(event_bus)
-        self.peer_connections = {}
+        # Compression is opt-in: offered only when compressors are given, but compressed frames are always accepted.
+        self.compressors = list(compressors or [])
+        self.compression_threshold = compression_threshold
+        self.compression_dictionaries = [compression.register_dictionary(data) for data in compression_dictionaries or []]
+        self.channel_weights = dict(channel_weights or {})
+        self.codecs = codecs if codecs is not None else wire.available_codecs()
+        self.max_frame_size = max_frame_size if max_frame_size is not None else framing.FrameProtocol.MAX_FRAME_SIZE
+        self.peers = PeerRegistry()
+        self.sessions = {}
+        self.rpc_handlers = {}
+        self.frame_handlers = {}
+        self.heartbeat = HeartbeatScheduler(heartbeat_interval, heartbeat_timeout)
+        self.dialer = DialScheduler(self._dial, dial_concurrency, connect_timeout)
+        self.handshake_timeout = handshake_timeout if handshake_timeout is not None else self.HANDSHAKE_TIMEOUT
+        # With verify_peers only nodes reported by discovery may connect; otherwise unknown ids are accepted.
+        self.verify_peers = verify_peers
+        # With reuse_port several processes can listen on the same port (see sharding.ShardedTransport).
+        self.reuse_port = reuse_port
+        # Large frames are parsed by decode_workers threads (0 keeps all decoding on the event loop).
+        # One thread is enough: decoding mostly holds the GIL, the point is to keep the loop responsive.
+        self.decode_workers = decode_workers if decode_workers is not None else self.DECODE_WORKERS
+        self.decode_threshold = decode_threshold
+        self._decode_executor: ThreadPoolExecutor = None
+        self.loop_monitor = LoopMonitor(loop_monitor_interval)
+        # Without auto_connect discovered nodes are not dialed; a ConnectionManager picks the peers instead.
+        self.auto_connect = auto_connect
+        self.max_inbound = max_inbound
+        self.known_nodes = {}
+        self.handshake_stats = {'accepted': 0, 'timed_out': 0, 'rejected': 0, 'duplicates': 0, 'refused': 0, 'closed_early': 0}
+        self._early_data = {}
+        _transports.add(self)
         self._server = None
-        self.lock = asyncio.Lock()
         self.event_bus.subscribe(events.NodeLostEvent, self.delete_peer)
         self.event_bus.subscribe(events.NodeDiscoveredEvent, self.open_connection)
 
+    @property
+    def is_serving(self) -> bool:
+        return self._server is not None and self._server.is_serving()
+
+    @property
+    def peer_connections(self) -> dict:
+        return self.peers.snapshot()
+
+    def set_channel_weight(self, channel: int, weight: int):
+        """Задаёт вес канала в планировщике отправки для текущих и будущих соединений."""
+        self.channel_weights[channel] = weight
+        for peer in self.peers.snapshot().values():
+            peer.send_queue.set_weight(channel, weight)
+
     async def delete_peer(self, event: events.NodeLostEvent):
-        peer = None
         uid = event.node_id
-        async with self.lock:
-            if uid in self.peer_connections.keys():
-                    peer, _ = self.peer_connections[uid]
-                    del self.peer_connections[uid]
+        self.known_nodes.pop(uid, None)
+        self._early_data.pop(uid, None)
+        self.dialer.cancel(uid)
+        session = self.sessions.pop(uid, None)
+        if session:
+            session.close(ConnectionError(f'Node {uid} was lost'))
+        peer = self.peers.remove(uid)
         if peer:
-            await peer.close()
+            self.event_bus.publish_nowait(events.PeerDisconnectedEvent(uid))
+            await self._close_peer(peer)
             logging.info(f'PeerConnection object was closed for {uid}')
 
-               
+    async def _close_peer(self, peer: PeerConnection):
+        self.heartbeat.remove(peer)
+        await peer.close()
+
+    def _new_protocol(self, on_connection_made: callable = None) -> framing.FrameProtocol:
+        return framing.FrameProtocol(self.max_frame_size, on_connection_made=on_connection_made)
+
+    def _on_accepted(self, protocol: framing.FrameProtocol):
+        asyncio.create_task(self._on_connected(protocol))
 
-    async def _on_connected(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    async def _on_connected(self, protocol: framing.FrameProtocol):
         try:
-            length_bytes = await reader.readexactly(4)
-            length = int.from_bytes(length_bytes, 'big')
-            message_data = await reader.readexactly(length)
-            message = messages.MessageFactory.get_message(message_data.decode())
-            if message == None:
-                writer.close()
-                await writer.wait_closed()
+            try:
+                message_data = await asyncio.wait_for(protocol.read_frame(), self.handshake_timeout)
+            except asyncio.TimeoutError:
+                self._count_handshake('timed_out')
+                logging.info(f'[TcpTransport] No handshake within {self.handshake_timeout}s, closing connection')
+                message_data = None
+            except ConnectionError:
+                # Port probes (SweepDiscovery in TCP mode) connect and close without a handshake.
+                self._count_handshake('closed_early')
+                logging.debug(f'[TcpTransport] {protocol.get_extra_info("peername")} closed the connection before the handshake')
+                protocol.close()
+                await protocol.wait_closed()
+                return
+            try:
+                message = wire.decode_message(message_data) if message_data is not None else None
+            except ValueError:
+                message = None
+            if message is None or message.type != 'system' or not self._verify_identity(message.data, protocol):
+                protocol.close()
+                await protocol.wait_closed()
+                return
+            id = message.data.get('id')
+            if self.max_inbound is not None and id not in self.peers and self._inbound_count() >= self.max_inbound:
+                self._count_handshake('refused')
+                logging.info(f'[TcpTransport] [{id}]: Refusing connection, {self.max_inbound} inbound connections are open')
+                protocol.close()
+                await protocol.wait_closed()
                 return
-            elif message.type == 'system':
-                ip = message.data.get('ip')
-                id = message.data.get('id')
-                logging.info(f"[TcpTransport] New connection from {ip}")
-                await self._create_peer_connection(id, ip, reader, writer)
-                logging.info(f"[TcpTransport] PeerConnection object was created for [{id}]")
+            peername = protocol.get_extra_info('peername')
+            ip = peername[0] if peername else message.data.get('ip')
+            logging.info(f"[TcpTransport] New connection from {ip}")
+            peer = await self._create_peer_connection(id, ip, protocol)
+            if peer is None:
+                return
+            self._count_handshake('accepted')
+            logging.info(f"[TcpTransport] PeerConnection object was created for [{id}]")
+            offered = message.data.get('codecs')
+            if offered:
+                codec_name = wire.negotiate_codec(offered, self.codecs)
+                compressor_name, dictionary_id = compression.negotiate(message.data.get('compression') or [], self.compressors,
+                                                                       message.data.get('dictionaries'))
+                reply = messages.SystemMessage({'id': self.uid, 'ip': self.addr, 'wire': wire.WIRE_VERSION, 'codec': codec_name,
+                                                'compression': compressor_name, 'dictionary': dictionary_id})
+                await peer.send_message(reply)
+                if codec_name:
+                    peer.set_codec(wire.get_codec(codec_name))
+                    logging.info(f"[TcpTransport] [{id}]: Negotiated '{codec_name}' codec")
+                    self._set_compression(peer, compressor_name, dictionary_id)
+                    self._on_peer_ready(peer)
+                else:
+                    self._on_peer_json_only(peer)
+            else:
+                self._on_peer_json_only(peer)
         except Exception as e:
             logging.warning(f'[TcpTransport] unexpected error: {e}')
 
+    def _inbound_count(self) -> int:
+        return sum(1 for peer in self.peers.snapshot().values() if not peer.outbound)
+
+    def _verify_identity(self, data, protocol: framing.FrameProtocol) -> bool:
+        """Проверяет идентификатор из handshake по таблице узлов, известных от обнаружения."""
+        id = data.get('id') if isinstance(data, dict) else None
+        if not isinstance(id, str) or not id or id == self.uid:
+            reason = 'invalid id'
+        elif id not in self.known_nodes:
+            reason = 'unknown node' if self.verify_peers else None
+        else:
+            peername = protocol.get_extra_info('peername')
+            known_ip = self.known_nodes[id]
+            reason = f'address does not match {known_ip}' if peername and known_ip and peername[0] != known_ip else None
+        if reason is None:
+            return True
+        self._count_handshake('rejected')
+        logging.warning(f'[TcpTransport] Rejected handshake from {protocol.get_extra_info("peername")} claiming [{id}]: {reason}')
+        return False
+
     async def start(self):
-        self._server = await asyncio.start_server(self._on_connected,self.addr, self.port)
+        loop = asyncio.get_running_loop()
+        self._server = await loop.create_server(lambda: self._new_protocol(self._on_accepted), self.addr, self.port,
+                                                reuse_port=self.reuse_port or None)
+        self.heartbeat.start()
+        self.dialer.start()
+        self.loop_monitor.start()
         async with self._server:
             await self._server.serve_forever()
     
@@ -148,47 +480,75 @@ class TcpTransport(Transport):
             self._server.close()
             await self._server.wait_closed()
             self._server = None
-            async with self.lock:
-                peer_ids = list(self.peer_connections.keys())
-                for peer_id in peer_ids:
-                    peer_info = self.peer_connections.get(peer_id)
-                    peer, _ = peer_info
-                    del self.peer_connections[peer_id]
-                asyncio.create_task(peer.close())
+            await self.heartbeat.stop()
+            await self.dialer.stop()
+            await self.loop_monitor.stop()
+            self._early_data.clear()
+            for session in self.sessions.values():
+                session.close(ConnectionError('Transport stopped'))
+            self.sessions.clear()
+            peers = self.peers.clear()
+            await asyncio.gather(*(peer.close() for peer in peers), return_exceptions=True)
+            if self._decode_executor is not None:
+                self._decode_executor.shutdown(wait=False, cancel_futures=True)
+                self._decode_executor = None
             logging.info('[TcpTransport] Server stopped')
         
-    async def _create_peer_connection(self, id, ip, reader, writer):
-        peer: PeerConnection = PeerConnection(id, ip, self._on_message, self._on_connection_lost, reader, writer)
+    async def _create_peer_connection(self, id, ip, protocol, outbound: bool = False):
+        current: PeerConnection = self.peers.get(id)
+        if (current is not None and current.outbound != outbound and not current.is_closing and not current.is_lost
+                and not self._is_preferred(id, outbound)):
+            # Simultaneous open: both sides keep the connection dialed by the smaller uid.
+            self._count_handshake('duplicates')
+            logging.info(f'[TcpTransport] [{id}]: Dropping duplicate {"outbound" if outbound else "inbound"} connection')
+            protocol.close()
+            return None
+        peer: PeerConnection = PeerConnection(id, ip, lambda message, uid: self._on_message(message, uid, peer),
+                                              self._on_connection_lost, protocol, self.channel_weights, outbound,
+                                              self._get_decode_executor(), self.decode_threshold)
+        peer.streams = StreamMultiplexer(peer, self.uid, self._on_stream_opened)
+        peer.rpc = RpcChannel(peer, self.rpc_handlers)
+        peer.register_frame_handler(wire.KIND_ACK, lambda frame: self._on_ack_frame(peer, frame))
+        peer.sequence_filter = lambda epoch, seq: self._accept_sequenced(peer, epoch, seq)
+        for kind, handler in self.frame_handlers.items():
+            peer.register_frame_handler(kind, partial(handler, peer))
+        send_task = asyncio.create_task(peer.send_queue.run())
+        peer.set_send_task(send_task)
         listen_task = asyncio.create_task(peer.start_listen())
-        keep_alive_task = asyncio.create_task(peer.start_keep_alive())
-        peer.set_keep_alive_task(keep_alive_task)
         peer.set_listen_task(listen_task)
-        async with self.lock:
-            self.peer_connections[id] = (peer, listen_task)
+        previous = self.peers.add(peer)
+        self.heartbeat.add(peer)
+        if previous is not None and previous is not peer:
+            asyncio.create_task(self._close_peer(previous))
+        # Published for replacements too: the event describes the connection now in use.
+        self.event_bus.publish_nowait(events.PeerConnectedEvent(id, outbound))
         return peer
 
-    async def _on_connection_lost(self, id, ip):
-        asyncio.create_task(self._try_reconnect(id, ip))
+    def _get_decode_executor(self) -> "ThreadPoolExecutor | None":
+        if self.decode_workers and self._decode_executor is None:
+            self._decode_executor = ThreadPoolExecutor(self.decode_workers, thread_name_prefix='p2p-decode')
+        return self._decode_executor
 
-    async def _try_reconnect(self, id, ip):
+    def _is_preferred(self, uid: str, outbound: bool) -> bool:
+        # The connection dialed by the smaller uid wins on both sides.
+        return outbound == (self.uid < uid)
+
+    async def _on_connection_lost(self, peer: PeerConnection):
+        if metrics.enabled:
+            CONNECTIONS_LOST.inc()
+        asyncio.create_task(self._try_reconnect(peer))
+
+    async def _try_reconnect(self, peer: PeerConnection):
         try:
-            async with self.lock:
-                pair = self.peer_connections.get(id, None)
-                peer = None
-                if pair:
-                    peer, _ = pair
-                if peer:
-                    del self.peer_connections[id]
-            if peer:
-                await peer.close()
-                for i in range(3):
-                    try:
-                        await self.open_connection(id, ip, self.port)
-                        break
-                    except ConnectionRefusedError:
-                        logging.info(f"[TcpTransport] [{id}]: Reconnection attempt {i+1} failed (connection refused)")
-                    if i < 2:
-                        await asyncio.sleep(0.5)
+            removed = self.peers.remove(peer.uid, peer)
+            if removed:
+                self.event_bus.publish_nowait(events.PeerDisconnectedEvent(peer.uid))
+            await self._close_peer(peer)
+            if removed and self.auto_connect:
+                # Peers dialed from the cache are retried only briefly until discovery reports them.
+                known = peer.uid in self.known_nodes
+                self.dialer.schedule(peer.uid, self.known_nodes.get(peer.uid, peer.ip),
+                                     None if known else self.SPECULATIVE_ATTEMPTS)
         except Exception as e:
             logging.warning(f'[TcpTransport] unexpected error:{e}')
 
@@ -196,40 +556,275 @@ class TcpTransport(Transport):
         logging.info(f'[TcpTransport] NodeDiscoveredEvent detected, open_connection started')
         id = event.node_id
         ip = event.node_metadata.get('ip')
-        async with self.lock:
-            if id in self.peer_connections:
-                return
-        if id > self.uid:
-            logging.info(f"[TcpTransport] Connecting to node {id} at address {ip} via TCP")
-            try:
-                reader, writer = await asyncio.open_connection(ip, self.port)
-                peer = await self._create_peer_connection(id, ip, reader, writer)
-                message_data = {'id': self.uid, 'ip': self.addr}
-                message = messages.SystemMessage(message_data)
-                await peer.send_message(message.to_json())
-                logging.info(f"[TcpTransport] Connected and sent system message to [{id}]")
-            except ConnectionRefusedError as e:
-                logging.info(f'[TcpTransport] Unable to connect: {e}')
-            except Exception as e:
-                logging.warning(f'[TcpTransport] unexpected error: {e}')
-        else:
+        self.known_nodes[id] = ip
+        if self.auto_connect and id != self.uid and id not in self.peers:
+            self.dialer.schedule(id, ip)
+
+    def dial_peer(self, uid: str, ip: str, max_attempts: int = None):
+        """Ставит соединение с узлом в очередь DialScheduler; без max_attempts попытки не прекращаются."""
+        if uid != self.uid and uid not in self.peers:
+            self.dialer.schedule(uid, ip, max_attempts)
+
+    async def disconnect_peer(self, uid: str):
+        """Закрывает соединение с узлом; в отличие от delete_peer, узел остаётся известным."""
+        self.dialer.cancel(uid)
+        peer = self.peers.remove(uid)
+        if peer:
+            self.event_bus.publish_nowait(events.PeerDisconnectedEvent(uid))
+            await self._close_peer(peer)
+
+    def dial_cached_peer(self, uid: str, ip: str):
+        """Соединяется с узлом из кэша, не дожидаясь обнаружения; после SPECULATIVE_ATTEMPTS неудач попытки прекращаются."""
+        if uid not in self.known_nodes:
+            self.dial_peer(uid, ip, self.SPECULATIVE_ATTEMPTS)
+
+    async def _dial(self, id, ip):
+        """Одна попытка соединения; ошибки обрабатывает DialScheduler."""
+        if not self.peers.begin_dial(id):
             return
-    
-    async def send_to_peer(self, uid, message_data):
-        peer: PeerConnection = None
-        async with self.lock:
-            pair = self.peer_connections.get(uid, None)
-            if pair:
-                peer, _ = pair
+        logging.info(f"[TcpTransport] Connecting to node {id} at address {ip} via TCP")
+        try:
+            identity = messages.SystemMessage({'id': self.uid, 'ip': self.addr, 'wire': wire.WIRE_VERSION, 'codecs': self.codecs,
+                                               'compression': self.compressors, 'dictionaries': self.compression_dictionaries})
+            frames = [wire.encode_message(identity)]
+            early_data = self._early_data.get(id)
+            if early_data:
+                frames.extend(early_data[1])
+
+            def on_connection_made(protocol: framing.FrameProtocol):
+                # Written before the connection is handed back, so the identity leaves with the first segment.
+                protocol.writelines([part for frame in frames for part in (len(frame).to_bytes(4, 'big'), frame)])
+
+            loop = asyncio.get_running_loop()
+            # Dial from the listening address so the acceptor sees the same ip that discovery reported.
+            local_addr = (self.addr, 0) if self.addr else None
+            _, protocol = await loop.create_connection(lambda: self._new_protocol(on_connection_made), ip, self.port,
+                                                       local_addr=local_addr)
+            if early_data is not None and self._early_data.get(id) is early_data:
+                del self._early_data[id]
+            await self._create_peer_connection(id, ip, protocol, outbound=True)
+            logging.info(f"[TcpTransport] Connected and sent system message to [{id}]")
+        finally:
+            self.peers.end_dial(id)
+
+    def _queue_early_data(self, uid: str, message: messages.Message) -> bool:
+        # Early data are sent as legacy JSON frames: the codec is not negotiated yet.
+        if message.channel != wire.DEFAULT_CHANNEL or not self.dialer.is_pending(uid):
+            return False
+        frame = wire.encode_message(message)
+        early_data = self._early_data.setdefault(uid, [0, []])
+        if early_data[0] + len(frame) > self.EARLY_DATA_LIMIT:
+            return False
+        early_data[0] += len(frame)
+        early_data[1].append(frame)
+        return True
+
+    def _count_handshake(self, result: str):
+        self.handshake_stats[result] += 1
+        if metrics.enabled:
+            HANDSHAKES.inc(1, (result,))
+
+    def get_handshake_stats(self) -> dict:
+        return dict(self.handshake_stats)
+
+    def get_loop_stats(self) -> dict:
+        return self.loop_monitor.get_stats()
+
+    def get_dial_stats(self) -> dict:
+        return self.dialer.get_stats()
+
+    def _set_compression(self, peer: PeerConnection, compressor_name: str, dictionary_id: int):
+        compressor = compression.get_compressor(compressor_name or '')
+        if compressor is None:
+            return
+        peer.set_compression(compression.FrameCompression(compressor, dictionary_id, self.compression_threshold))
+        logging.info(f"[TcpTransport] [{peer.uid}]: Negotiated '{compressor.name}' compression"
+                     f"{f' with dictionary {dictionary_id}' if dictionary_id is not None else ''}")
+
+    def register_frame_handler(self, kind: int, handler: callable):
+        """Обработчик handler(peer, frame) кадров kind на всех текущих и будущих соединениях (см. relay.py)."""
+        self.frame_handlers[kind] = handler
+        for peer in self.peers.snapshot().values():
+            peer.register_frame_handler(kind, partial(handler, peer))
+
+    def register_handler(self, method: str, handler: callable):
+        """Регистрирует обработчик запросов: async handler(payload, uid) -> результат."""
+        self.rpc_handlers[method] = handler
+
+    def unregister_handler(self, method: str):
+        self.rpc_handlers.pop(method, None)
+
+    async def request(self, uid: str, method: str, payload=None, timeout: float = None, channel: int = wire.DEFAULT_CHANNEL):
+        """
+        Вызывает метод method на узле uid и возвращает результат обработчика.
+
+        Raises:
+            ConnectionError: Если соединения с узлом нет или оно оборвалось.
+            asyncio.TimeoutError: Если ответ не пришёл за timeout секунд.
+            rpc.RpcError: Если обработчик не найден, упал или не уложился в срок.
+        """
+        peer: PeerConnection = self.peers.get(uid)
+        if peer is None:
+            raise ConnectionError(f'No connection to {uid}')
+        return await peer.rpc.request(method, payload, timeout, channel)
+
+    def get_rpc_stats(self) -> dict:
+        return {uid: peer.rpc.get_stats() for uid, peer in self.peers.snapshot().items()}
+
+    def _session(self, uid: str) -> ReliableSession:
+        session = self.sessions.get(uid)
+        if session is None:
+            session = self.sessions[uid] = ReliableSession(uid)
+            peer = self.peers.get(uid)
+            if peer is not None and peer.codec is not None:
+                session.attach(peer)
+        return session
+
+    def _on_peer_ready(self, peer: PeerConnection):
+        # Reliable frames need the binary format, so resending waits for codec negotiation.
+        session = self.sessions.get(peer.uid)
+        if session:
+            session.attach(peer)
+
+    def _on_peer_json_only(self, peer: PeerConnection):
+        # Sequenced frames and ACKs need the binary format, so messages waiting in a session would never be acknowledged.
+        peer.json_only = True
+        session = self.sessions.pop(peer.uid, None)
+        if session:
+            session.close(ConnectionError(f'Peer {peer.uid} does not support reliable delivery'))
+
+    def _on_ack_frame(self, peer: PeerConnection, frame):
+        session = self.sessions.get(peer.uid)
+        if session:
+            session.on_ack_frame(frame)
+
+    def _accept_sequenced(self, peer: PeerConnection, epoch: int, seq: int) -> bool:
+        session = self._session(peer.uid)
+        if session.peer is None:
+            session.attach(peer)
+        return session.accept(epoch, seq)
+
+    def get_reliable_stats(self) -> dict:
+        return {uid: session.get_stats() for uid, session in self.sessions.items()}
+
+    def get_compression_stats(self) -> dict:
+        return {uid: peer.compression.get_stats() for uid, peer in self.peers.snapshot().items()}
+
+    async def open_stream(self, uid: str, metadata: dict = None, channel: int = wire.DEFAULT_CHANNEL) -> Stream:
+        """
+        Открывает поток к узлу uid. Метаданные (например, имя и размер файла)
+        передаются получателю вместе с StreamOpenedEvent.
+
+        Raises:
+            ConnectionError: Если соединения с узлом нет или он не поддерживает бинарные кадры.
+        """
+        peer: PeerConnection = self.peers.get(uid)
+        if peer is None:
+            raise ConnectionError(f'No connection to {uid}')
+        return await peer.streams.open(metadata, channel)
+
+    def _on_stream_opened(self, stream: Stream):
+        self.event_bus.publish_nowait(events.StreamOpenedEvent(stream, stream.uid))
+
+    def get_queue_stats(self) -> dict:
+        stats = {}
+        for uid, peer in self.peers.snapshot().items():
+            stats[uid] = {
+                'queued_bytes': peer.send_queue.queued_bytes,
+                'queued_messages': peer.send_queue.queued_messages,
+                'channels': peer.send_queue.get_channel_stats(),
+            }
+        return stats
+
+    async def send_to_peer(self, uid, message_data, channel: int = wire.DEFAULT_CHANNEL, reliable: bool = False):
+        """
+        Отправляет сообщение узлу uid.
+
+        В обычном режиме возвращает True, если кадр поставлен в очередь отправки.
+        С reliable=True сообщение буферизуется до подтверждения и переживает
+        переподключение; возвращается future, который получит True после
+        подтверждения или исключение, если узел потерян.
+
+        Raises:
+            ConnectionError: Если reliable=True, а узел не поддерживает бинарные кадры.
+        """
+        if reliable:
+            peer: PeerConnection = self.peers.get(uid)
+            if peer is not None and peer.json_only:
+                raise ConnectionError(f'Peer {uid} does not support reliable delivery')
+            return await self._session(uid).send(messages.UserMessage(message_data, channel))
+        peer: PeerConnection = self.peers.get(uid)
         if peer:
-            message = messages.UserMessage(message_data)
-            await peer.send_message(message.to_json())
+            message = messages.UserMessage(message_data, channel)
+            return await peer.send_message(message)
+        elif self._queue_early_data(uid, messages.UserMessage(message_data, channel)):
+            return True
         else:
             logging.info(f'[TcpTransport] No connection to {uid}')
+            return False
+
+    async def send_to_many(self, uids, message_data, *, channel: int = wire.DEFAULT_CHANNEL, timeout: float = None) -> dict:
+        message = messages.UserMessage(message_data, channel)
+        frames = {}
+        results = {}
+        blocked = []
+        for uid in uids:
+            peer: PeerConnection = self.peers.get(uid)
+            if peer is None:
+                results[uid] = False
+                continue
+            # Frames are self-describing, so one buffer per codec and compression setting is shared
+            # by every peer using it; compression stats are charged to the first such peer.
+            key = (peer.codec.name if peer.codec else None, peer.compression.compressor, peer.compression.dictionary_id)
+            frame = frames.get(key)
+            if frame is None:
+                frame = frames[key] = wire.encode_message(message, peer.codec, peer.compression)
+            if peer.send_queue.is_writable(channel):
+                results[uid] = peer.send_frame_nowait(frame, channel)
+            else:
+                blocked.append((uid, peer, frame))
+        if blocked:
+            outcomes = await asyncio.gather(*(self._send_frame_with_timeout(peer, frame, timeout, channel) for _, peer, frame in blocked))
+            for (uid, _, _), delivered in zip(blocked, outcomes):
+                results[uid] = delivered
+        return results
 
+    async def broadcast(self, message_data, *, channel: int = wire.DEFAULT_CHANNEL, timeout: float = None) -> dict:
+        return await self.send_to_many(list(self.peers.snapshot()), message_data, channel=channel, timeout=timeout)
+
+    async def _send_frame_with_timeout(self, peer: PeerConnection, frame: bytes, timeout: float = None,
+                                       channel: int = wire.DEFAULT_CHANNEL) -> bool:
+        try:
+            return await asyncio.wait_for(peer.send_frame(frame, channel), timeout)
+        except asyncio.TimeoutError:
+            logging.info(f'[TcpTransport] [{peer.uid}]: Send queue stayed full for {timeout}s, frame dropped')
+            return False
+
+
+    async def _on_message(self, message, uid, peer: PeerConnection = None):
+        if message.type == 'system' and isinstance(message.data, dict) and 'codec' in message.data:
+            await self._on_handshake_reply(message, uid, peer)
+            return
+        await self.publish_message_received_event(message, uid)
 
-    async def _on_message(self, message_data, uid):
-        if message_data == '__keepalive__':
+    async def _on_handshake_reply(self, message, uid, peer: PeerConnection = None):
+        codec = wire.get_codec(message.data.get('codec') or '')
+        peer = peer or self.peers.get(uid)
+        answered = message.data.get('id')
+        if peer and peer.outbound and answered is not None and answered != uid:
+            # A stale address (e.g. from the peer cache) now belongs to another node.
+            logging.warning(f'[TcpTransport] [{uid}]: {peer.ip} answered as [{answered}], closing connection')
+            if self.peers.remove(uid, peer):
+                self.event_bus.publish_nowait(events.PeerDisconnectedEvent(uid))
+            if uid not in self.known_nodes:
+                self.dialer.cancel(uid)
+            # Runs on the peer's listen task, which close() cancels and awaits.
+            asyncio.create_task(self._close_peer(peer))
             return
-        message = messages.MessageFactory.get_message(message_data)
-        await self.publish_message_received_event(message, uid)
\ No newline at end of file
+        if peer and codec and peer.outbound and peer.codec is None:
+            peer.set_codec(codec)
+            logging.info(f"[TcpTransport] [{uid}]: Negotiated '{codec.name}' codec")
+            self._set_compression(peer, message.data.get('compression'), message.data.get('dictionary'))
+            self._on_peer_ready(peer)
+        elif peer and codec is None and peer.outbound and peer.codec is None:
+            self._on_peer_json_only(peer)
\ No newline at end of file
@@ -0,0 +1,403 @@
+from p2p_networking import messages
+from p2p_networking.compression import FrameCompression, decompress_body
+import json
+import struct
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Binary frame layout (inside the 4-byte big-endian length prefix):
+#   byte 0: wire version (high nibble) | body codec id (low nibble)
+#   byte 1: flags (high nibble) | frame kind (low nibble)
+#   byte 2: channel id, present only when FLAG_CHANNEL is set
+#   then:   4-byte epoch and 8-byte sequence number, only when FLAG_SEQUENCED is set
+#   then:   4-byte correlation id, only when FLAG_CORRELATED is set
+#   rest:   body encoded with the codec from byte 0, compressed as described
+#           in compression.py when FLAG_COMPRESSED is set
+# Legacy peers send JSON text, which always starts with '{' or '_' and
+# therefore never collides with a valid version nibble.
+WIRE_VERSION = 1
+
+KIND_KEEPALIVE = 0
+KIND_SYSTEM = 1
+KIND_USER = 2
+# Stream frames carry a 4-byte stream id after the header; see streams.py.
+KIND_STREAM_OPEN = 3
+KIND_STREAM_DATA = 4
+KIND_STREAM_CREDIT = 5
+KIND_STREAM_CLOSE = 6
+# Cumulative and selective acknowledgements of sequenced frames; see reliable.py.
+KIND_ACK = 7
+# Request/response frames carry a correlation id in the header; see rpc.py.
+KIND_REQUEST = 8
+KIND_RESPONSE = 9
+KIND_CANCEL = 10
+# Flooded multi-hop messages carry a fixed relay header after the wire header; see relay.py.
+KIND_RELAY = 11
+
+KIND_MASK = 0x0F
+FLAGS_MASK = 0xF0
+
+FLAG_CHANNEL = 0x10
+FLAG_COMPRESSED = 0x20
+FLAG_SEQUENCED = 0x40
+FLAG_CORRELATED = 0x80
+
+HEADER_SIZE = 2
+
+DEFAULT_CHANNEL = 0
+
+_SEQUENCE = struct.Struct('>IQ')
+_CORRELATION = struct.Struct('>I')
+
+LEGACY_KEEPALIVE = b'__keepalive__'
+
+_MESSAGE_CLASSES = {
+    KIND_SYSTEM: messages.SystemMessage,
+    KIND_USER: messages.UserMessage,
+}
+_KINDS_BY_TYPE = {
+    'system': KIND_SYSTEM,
+    'user': KIND_USER,
+}
+
+
+class Codec:
+    name = None
+    id = None
+    priority = 0
+
+    def encode(self, data) -> bytes:
+        raise NotImplementedError("Subclasses must implement encode")
+
+    def decode(self, payload):
+        raise NotImplementedError("Subclasses must implement decode")
+
+
+class JsonCodec(Codec):
+    name = 'json'
+    id = 0
+    priority = 0
+
+    def encode(self, data) -> bytes:
+        return json.dumps(data, separators=(',', ':')).encode()
+
+    def decode(self, payload):
+        if isinstance(payload, memoryview):
+            payload = payload.tobytes()
+        return json.loads(payload)
+
+
+class StructCodec(Codec):
+    """Компактный бинарный кодек на основе struct, не требующий внешних зависимостей."""
+    name = 'struct'
+    id = 1
+    priority = 10
+
+    _INT64 = struct.Struct('>q')
+    _DOUBLE = struct.Struct('>d')
+    _UINT32 = struct.Struct('>I')
+
+    def encode(self, data) -> bytes:
+        out = bytearray()
+        self._pack(data, out)
+        return bytes(out)
+
+    MAX_DEPTH = 256
+
+    def decode(self, payload):
+        view = memoryview(payload)
+        try:
+            obj, offset = self._unpack(view, 0, 0)
+        except (struct.error, IndexError) as e:
+            raise ValueError(f'Truncated struct payload: {e}') from None
+        except TypeError as e:
+            # An unhashable map key, e.g. a list.
+            raise ValueError(f'Malformed struct payload: {e}') from None
+        if offset != len(view):
+            raise ValueError('Trailing bytes after struct payload')
+        return obj
+
+    def _pack(self, obj, out: bytearray):
+        if obj is None:
+            out += b'N'
+        elif obj is True:
+            out += b'T'
+        elif obj is False:
+            out += b'F'
+        elif isinstance(obj, int):
+            if -2**63 <= obj < 2**63:
+                out += b'i'
+                out += self._INT64.pack(obj)
+            else:
+                raw = str(obj).encode()
+                out += b'I'
+                out += self._UINT32.pack(len(raw))
+                out += raw
+        elif isinstance(obj, float):
+            out += b'd'
+            out += self._DOUBLE.pack(obj)
+        elif isinstance(obj, str):
+            raw = obj.encode()
+            out += b's'
+            out += self._UINT32.pack(len(raw))
+            out += raw
+        elif isinstance(obj, (bytes, bytearray, memoryview)):
+            out += b'b'
+            out += self._UINT32.pack(len(obj))
+            out += obj
+        elif isinstance(obj, (list, tuple)):
+            out += b'l'
+            out += self._UINT32.pack(len(obj))
+            for item in obj:
+                self._pack(item, out)
+        elif isinstance(obj, dict):
+            out += b'm'
+            out += self._UINT32.pack(len(obj))
+            for key, value in obj.items():
+                self._pack(key, out)
+                self._pack(value, out)
+        else:
+            raise TypeError(f'Object of type {type(obj).__name__} is not supported by StructCodec')
+
+    def _unpack(self, view: memoryview, offset: int, depth: int):
+        tag = view[offset]
+        offset += 1
+        if tag == 0x4E:  # N
+            return None, offset
+        elif tag == 0x54:  # T
+            return True, offset
+        elif tag == 0x46:  # F
+            return False, offset
+        elif tag == 0x69:  # i
+            return self._INT64.unpack_from(view, offset)[0], offset + 8
+        elif tag == 0x64:  # d
+            return self._DOUBLE.unpack_from(view, offset)[0], offset + 8
+        size = self._UINT32.unpack_from(view, offset)[0]
+        offset += 4
+        if tag in (0x73, 0x62, 0x49) and offset + size > len(view):
+            raise ValueError('Truncated struct payload')
+        if tag in (0x6C, 0x6D) and depth >= self.MAX_DEPTH:
+            raise ValueError('Struct payload is nested too deeply')
+        if tag == 0x73:  # s
+            return str(view[offset:offset + size], 'utf-8'), offset + size
+        elif tag == 0x62:  # b
+            return view[offset:offset + size].tobytes(), offset + size
+        elif tag == 0x49:  # I
+            return int(str(view[offset:offset + size], 'ascii')), offset + size
+        elif tag == 0x6C:  # l
+            items = []
+            for _ in range(size):
+                item, offset = self._unpack(view, offset, depth + 1)
+                items.append(item)
+            return items, offset
+        elif tag == 0x6D:  # m
+            result = {}
+            for _ in range(size):
+                key, offset = self._unpack(view, offset, depth + 1)
+                value, offset = self._unpack(view, offset, depth + 1)
+                result[key] = value
+            return result, offset
+        raise ValueError(f'Unknown struct tag: {tag:#x}')
+
+
+class MsgpackCodec(Codec):
+    name = 'msgpack'
+    id = 2
+    priority = 20
+
+    def encode(self, data) -> bytes:
+        return msgpack.packb(data, use_bin_type=True)
+
+    def decode(self, payload):
+        return msgpack.unpackb(payload, raw=False)
+
+
+_codecs_by_name = {}
+_codecs_by_id = {}
+
+
+def register_codec(codec: Codec) -> None:
+    if codec.name is None or codec.id is None:
+        raise ValueError('Codec must define name and id')
+    if not 0 <= codec.id <= 0x0F:
+        raise ValueError('Codec id must fit in 4 bits')
+    existing = _codecs_by_id.get(codec.id)
+    if existing is not None and existing.name != codec.name:
+        raise ValueError(f'Codec id {codec.id} is already taken by {existing.name}')
+    _codecs_by_name[codec.name] = codec
+    _codecs_by_id[codec.id] = codec
+
+
+def get_codec(name: str) -> "Codec | None":
+    return _codecs_by_name.get(name)
+
+
+def get_codec_by_id(codec_id: int) -> "Codec | None":
+    return _codecs_by_id.get(codec_id)
+
+
+def available_codecs() -> list[str]:
+    codecs = sorted(_codecs_by_name.values(), key=lambda codec: codec.priority, reverse=True)
+    return [codec.name for codec in codecs]
+
+
+def negotiate_codec(offered: list, supported: list) -> "str | None":
+    """Выбирает первый кодек из списка, предложенного инициатором, который поддерживается локально."""
+    for name in offered:
+        if name in supported and name in _codecs_by_name:
+            return name
+    return None
+
+
+register_codec(JsonCodec())
+register_codec(StructCodec())
+if msgpack is not None:
+    register_codec(MsgpackCodec())
+
+
+def is_binary_frame(payload) -> bool:
+    return len(payload) >= HEADER_SIZE and payload[0] >> 4 == WIRE_VERSION
+
+
+def frame_kind(payload) -> "int | None":
+    """Возвращает тип бинарного кадра или None для устаревшего JSON-кадра."""
+    if is_binary_frame(payload):
+        return payload[1] & KIND_MASK
+    return None
+
+
+def frame_channel(payload) -> int:
+    if is_binary_frame(payload) and payload[1] & FLAG_CHANNEL:
+        body_offset(payload)
+        return payload[HEADER_SIZE]
+    return DEFAULT_CHANNEL
+
+
+def frame_sequence(payload) -> "tuple[int, int] | None":
+    """Возвращает (эпоха, номер) кадра с FLAG_SEQUENCED или None."""
+    if is_binary_frame(payload) and payload[1] & FLAG_SEQUENCED:
+        body_offset(payload)
+        return _SEQUENCE.unpack_from(payload, HEADER_SIZE + 1 if payload[1] & FLAG_CHANNEL else HEADER_SIZE)
+    return None
+
+
+def frame_correlation(payload) -> "int | None":
+    if is_binary_frame(payload) and payload[1] & FLAG_CORRELATED:
+        return _CORRELATION.unpack_from(payload, body_offset(payload) - _CORRELATION.size)[0]
+    return None
+
+
+def body_offset(payload) -> int:
+    """
+    Смещение тела бинарного кадра с учётом необязательных полей заголовка.
+
+    Raises:
+        ValueError: Если кадр короче заголовка, заявленного его флагами.
+    """
+    if len(payload) < HEADER_SIZE:
+        raise ValueError('Truncated frame header')
+    offset = HEADER_SIZE + 1 if payload[1] & FLAG_CHANNEL else HEADER_SIZE
+    if payload[1] & FLAG_SEQUENCED:
+        offset += _SEQUENCE.size
+    if payload[1] & FLAG_CORRELATED:
+        offset += _CORRELATION.size
+    if len(payload) < offset:
+        raise ValueError('Truncated frame header')
+    return offset
+
+
+def frame_header(kind: int, codec: Codec, flags: int = 0, channel: int = DEFAULT_CHANNEL, sequence: tuple = None,
+                 correlation: int = None) -> bytes:
+    flags &= FLAGS_MASK
+    if sequence is not None:
+        flags |= FLAG_SEQUENCED
+    if correlation is not None:
+        flags |= FLAG_CORRELATED
+    if channel == DEFAULT_CHANNEL:
+        header = bytes(((WIRE_VERSION << 4) | codec.id, flags | kind))
+    elif not 0 <= channel <= 0xFF:
+        raise ValueError('Channel id must fit in one byte')
+    else:
+        header = bytes(((WIRE_VERSION << 4) | codec.id, flags | FLAG_CHANNEL | kind, channel))
+    if sequence is not None:
+        header += _SEQUENCE.pack(*sequence)
+    if correlation is not None:
+        header += _CORRELATION.pack(correlation)
+    return header
+
+
+def encode_frame(kind: int, data, codec: Codec, flags: int = 0, channel: int = DEFAULT_CHANNEL,
+                 compression: "FrameCompression | None" = None, sequence: tuple = None, correlation: int = None) -> bytes:
+    if data is None:
+        return frame_header(kind, codec, flags, channel, sequence, correlation)
+    body = codec.encode(data)
+    if compression is not None:
+        compressed = compression.compress(body)
+        if compressed is not None:
+            return frame_header(kind, codec, flags | FLAG_COMPRESSED, channel, sequence, correlation) + compressed
+    return frame_header(kind, codec, flags, channel, sequence, correlation) + body
+
+
+def decode_frame(payload, compression: "FrameCompression | None" = None):
+    """
+    Разбирает кадр (без префикса длины) и возвращает кортеж (kind, flags, data).
+
+    Поддерживает как бинарный формат, так и устаревший JSON-текст.
+
+    Raises:
+        ValueError: Если кадр повреждён или использует неизвестную версию/кодек.
+    """
+    try:
+        return _decode_frame(payload, compression)
+    except (struct.error, IndexError, RecursionError) as e:
+        # Codecs and header parsing must not let a malformed frame escape as anything but ValueError.
+        raise ValueError(f'Malformed frame: {e!r}') from None
+
+
+def _decode_frame(payload, compression: "FrameCompression | None"):
+    if is_binary_frame(payload):
+        codec = _codecs_by_id.get(payload[0] & 0x0F)
+        if codec is None:
+            raise ValueError(f'Unknown codec id: {payload[0] & 0x0F}')
+        kind = payload[1] & KIND_MASK
+        flags = payload[1] & FLAGS_MASK
+        body = memoryview(payload)[body_offset(payload):]
+        if flags & FLAG_COMPRESSED:
+            body = compression.decompress(body) if compression is not None else decompress_body(body)
+        data = codec.decode(body) if len(body) else None
+        return kind, flags, data
+    if payload == LEGACY_KEEPALIVE:
+        return KIND_KEEPALIVE, 0, None
+    if payload[:1] != b'{':
+        raise ValueError('Unsupported frame format')
+    message = messages.MessageFactory.get_message(bytes(payload).decode())
+    if message is None:
+        raise ValueError('Malformed legacy JSON frame')
+    return _KINDS_BY_TYPE[message.type], 0, message.data
+
+
+def encode_message(message: messages.Message, codec: "Codec | None" = None,
+                   compression: "FrameCompression | None" = None, sequence: tuple = None) -> bytes:
+    if codec is None:
+        return message.to_json().encode()
+    return encode_frame(_KINDS_BY_TYPE[message.type], message.data, codec, channel=message.channel,
+                        compression=compression, sequence=sequence)
+
+
+def encode_keepalive(codec: "Codec | None" = None) -> bytes:
+    if codec is None:
+        return LEGACY_KEEPALIVE
+    return encode_frame(KIND_KEEPALIVE, None, codec)
+
+
+def decode_message(payload, compression: "FrameCompression | None" = None) -> "messages.Message | None":
+    kind, _, data = decode_frame(payload, compression)
+    if kind == KIND_KEEPALIVE:
+        return None
+    message_class = _MESSAGE_CLASSES.get(kind)
+    if message_class is None:
+        raise ValueError(f'Unknown frame kind: {kind}')
+    return message_class(data, frame_channel(payload))
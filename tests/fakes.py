@@ -0,0 +1,52 @@
+from p2p_networking import wire
+import asyncio
+
+
+class FakePeer:
+    """Соединение в памяти: кадры доставляются обработчикам другой стороны на следующей итерации цикла."""
+
+    def __init__(self, uid: str, codec: str = 'struct'):
+        self.uid = uid
+        self.codec = wire.get_codec(codec) if codec else None
+        self.compression = None
+        self.other = None
+        self.closed = False
+        self.handlers = {}
+        self.close_handlers = []
+
+    def register_frame_handler(self, kind, handler):
+        self.handlers[kind] = handler
+
+    def add_close_handler(self, handler):
+        self.close_handlers.append(handler)
+
+    def send_frame_nowait(self, frame, channel=wire.DEFAULT_CHANNEL) -> bool:
+        if self.closed:
+            return False
+        asyncio.get_running_loop().call_soon(self.other.receive, bytes(frame))
+        return True
+
+    async def send_frame(self, frame, channel=wire.DEFAULT_CHANNEL) -> bool:
+        return self.send_frame_nowait(frame, channel)
+
+    def receive(self, frame):
+        if not self.closed:
+            self.handlers[wire.frame_kind(frame)](frame)
+
+    def close(self, error: Exception = None):
+        for peer in (self, self.other):
+            peer.closed = True
+            for handler in peer.close_handlers:
+                handler(error)
+
+
+def peer_pair(codec: str = 'struct') -> tuple:
+    """Пара связанных FakePeer: первый — соединение узла 'a' с узлом 'b', второй — наоборот."""
+    a, b = FakePeer('b', codec), FakePeer('a', codec)
+    a.other, b.other = b, a
+    return a, b
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
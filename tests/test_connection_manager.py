@@ -0,0 +1,149 @@
+from fakes import settle
+from p2p_networking import events
+from p2p_networking.connection_manager import ConnectionManager, rendezvous_score
+from types import SimpleNamespace
+import asyncio
+
+
+class FakePeers(dict):
+
+    def snapshot(self) -> dict:
+        return dict(self)
+
+
+class FakeDialer:
+
+    def __init__(self):
+        self.pending = set()
+
+    def is_pending(self, uid: str) -> bool:
+        return uid in self.pending
+
+    def cancel(self, uid: str):
+        self.pending.discard(uid)
+
+
+class FakeTransport:
+
+    def __init__(self, uid: str):
+        self.uid = uid
+        self.event_bus = events.EventBus()
+        self.peers = FakePeers()
+        self.dialer = FakeDialer()
+        self.dialed = []
+        self.disconnected = []
+
+    def dial_peer(self, uid: str, ip: str, max_attempts: int = None):
+        self.dialed.append(uid)
+        self.dialer.pending.add(uid)
+
+    async def disconnect_peer(self, uid: str):
+        self.disconnected.append(uid)
+        if self.peers.pop(uid, None) is not None:
+            await self.event_bus.publish(events.PeerDisconnectedEvent(uid))
+
+    async def discover(self, *uids):
+        for uid in uids:
+            await self.event_bus.publish(events.NodeDiscoveredEvent(uid, {'ip': f'10.0.0.{len(uid)}'}))
+        await settle()
+
+    async def connect(self, uid: str, outbound: bool = True):
+        self.dialer.pending.discard(uid)
+        self.peers[uid] = SimpleNamespace(outbound=outbound)
+        await self.event_bus.publish(events.PeerConnectedEvent(uid, outbound))
+        await settle()
+
+
+def top(uid: str, others, count: int) -> set:
+    return set(sorted(others, key=lambda other: rendezvous_score(uid, other), reverse=True)[:count])
+
+
+NODES = [f'node{n}' for n in range(20)]
+
+
+def test_rendezvous_score_is_symmetric():
+    assert rendezvous_score('a', 'b') == rendezvous_score('b', 'a')
+    assert rendezvous_score('a', 'b') != rendezvous_score('a', 'c')
+
+
+def test_connects_to_nodes_with_highest_scores():
+    async def main():
+        transport = FakeTransport('self')
+        manager = ConnectionManager(transport, degree=4)
+        await transport.discover(*NODES, 'self')
+        assert manager.wanted == top('self', NODES, 4)
+        assert sorted(transport.dialed) == sorted(manager.wanted)
+        assert not transport.auto_connect and transport.max_inbound == 8
+        await manager.stop()
+    asyncio.run(main())
+
+
+def test_membership_change_moves_at_most_one_connection():
+    async def main():
+        transport = FakeTransport('self')
+        manager = ConnectionManager(transport, degree=4)
+        previous = set()
+        for uid in NODES:
+            await transport.discover(uid)
+            assert len(previous - manager.wanted) <= 1
+            previous = set(manager.wanted)
+        lost = sorted(manager.wanted)[0]
+        await transport.event_bus.publish(events.NodeLostEvent(lost))
+        await settle()
+        remaining = [uid for uid in NODES if uid != lost]
+        assert manager.wanted == top('self', remaining, 4)
+        assert len(previous - manager.wanted) == 1
+        assert manager.get_stats()['known'] == len(remaining)
+        await manager.stop()
+    asyncio.run(main())
+
+
+def test_unreachable_node_is_replaced_during_cooldown():
+    async def main():
+        transport = FakeTransport('self')
+        manager = ConnectionManager(transport, degree=2)
+        await transport.discover(*NODES)
+        first, second, third = sorted(NODES, key=lambda uid: rendezvous_score('self', uid), reverse=True)[:3]
+        await transport.connect(second)
+        # The dialer gives up on the best node.
+        transport.dialer.pending.discard(first)
+        manager._changed.set()
+        await settle()
+        assert manager.wanted == {second, third}
+        assert manager.stats['cooldowns'] == 1 and manager.get_stats()['cooling_down'] == 1
+        assert third in transport.dialed
+        await manager.stop()
+    asyncio.run(main())
+
+
+def test_deselected_outbound_connection_is_pruned_after_grace():
+    async def main():
+        transport = FakeTransport('self')
+        manager = ConnectionManager(transport, degree=2, prune_grace=0)
+        worst = min(NODES, key=lambda uid: rendezvous_score('self', uid))
+        await transport.discover(worst)
+        await transport.connect(worst)
+        await transport.connect('inbound', outbound=False)
+        await transport.discover(*NODES)
+        assert worst not in manager.wanted
+        assert transport.disconnected == [worst] and manager.stats['pruned_deselected'] == 1
+        assert 'inbound' in transport.peers
+        await manager.stop()
+    asyncio.run(main())
+
+
+def test_connections_over_the_limit_close_lowest_scores_first():
+    async def main():
+        transport = FakeTransport('self')
+        manager = ConnectionManager(transport, degree=1, max_inbound=2)
+        await transport.discover(*NODES)
+        inbound = NODES[:5]
+        for uid in inbound:
+            transport.peers[uid] = SimpleNamespace(outbound=False)
+        spare = sorted(set(inbound) - top('self', NODES, 1), key=lambda uid: rendezvous_score('self', uid))
+        manager._changed.set()
+        await settle()
+        assert sorted(transport.disconnected) == sorted(spare[:len(inbound) - manager.max_connections])
+        assert manager.stats['pruned_over_limit'] == 2
+        await manager.stop()
+    asyncio.run(main())
@@ -0,0 +1,186 @@
+from concurrent.futures import ThreadPoolExecutor
+from fakes import settle
+from p2p_networking import events
+from p2p_networking import messages
+import asyncio
+import pytest
+import threading
+import time
+
+
+def message(uid: str, n: int) -> events.MessageReceivedEvent:
+    return events.MessageReceivedEvent(messages.UserMessage(n), uid)
+
+
+def gated_handler(received: list, gate: asyncio.Event):
+    async def handler(event):
+        await gate.wait()
+        received.append(event.message.data)
+    return handler
+
+
+def test_unqueued_handler_runs_inside_publish():
+    async def main():
+        bus = events.EventBus()
+        received = []
+
+        async def handler(event):
+            received.append(event.message.data)
+        bus.subscribe(events.MessageReceivedEvent, handler)
+        await bus.publish(message('a', 1))
+        assert received == [1]
+    asyncio.run(main())
+
+
+def test_slow_queued_subscriber_does_not_delay_others():
+    async def main():
+        bus = events.EventBus()
+        gate = asyncio.Event()
+        slow, fast = [], []
+
+        async def handler(event):
+            fast.append(event.message.data)
+        bus.subscribe(events.MessageReceivedEvent, gated_handler(slow, gate), queue_size=10)
+        bus.subscribe(events.MessageReceivedEvent, handler)
+        for n in range(5):
+            await bus.publish(message('a', n))
+        assert fast == list(range(5)) and slow == []
+        gate.set()
+        await settle()
+        assert slow == list(range(5))
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize('overflow, expected', [(events.DROP_NEWEST, [0, 1]), (events.DROP_OLDEST, [3, 4])])
+def test_full_queue_drops_by_policy(overflow, expected):
+    async def main():
+        bus = events.EventBus()
+        gate = asyncio.Event()
+        received = []
+        subscription = bus.subscribe(events.MessageReceivedEvent, gated_handler(received, gate), queue_size=2, overflow=overflow)
+        for n in range(5):
+            await bus.publish(message('a', n))
+        assert subscription.queue_depth == 2 and subscription.dropped == 3
+        gate.set()
+        await settle()
+        assert received == expected
+    asyncio.run(main())
+
+
+def test_full_queue_blocks_publisher():
+    async def main():
+        bus = events.EventBus()
+        gate = asyncio.Event()
+        received = []
+        subscription = bus.subscribe(events.MessageReceivedEvent, gated_handler(received, gate), queue_size=2)
+
+        async def publish_all():
+            for n in range(5):
+                await bus.publish(message('a', n))
+        publisher = asyncio.create_task(publish_all())
+        await settle()
+        # The worker holds one event, two more wait in the queue.
+        assert not publisher.done() and subscription.queue_depth == 2
+        gate.set()
+        await asyncio.wait_for(publisher, 1)
+        await settle()
+        assert received == list(range(5)) and subscription.dropped == 0
+    asyncio.run(main())
+
+
+def test_publish_nowait_drops_when_blocking_queue_is_full():
+    async def main():
+        bus = events.EventBus()
+        gate = asyncio.Event()
+        received = []
+        subscription = bus.subscribe(events.MessageReceivedEvent, gated_handler(received, gate), queue_size=2)
+        for n in range(4):
+            bus.publish_nowait(message('a', n))
+        gate.set()
+        await settle()
+        assert received == [0, 1] and subscription.dropped == 2
+    asyncio.run(main())
+
+
+def test_handler_error_does_not_stop_the_queue():
+    async def main():
+        bus = events.EventBus()
+        received = []
+
+        async def handler(event):
+            if event.message.data == 1:
+                raise RuntimeError('boom')
+            received.append(event.message.data)
+        subscription = bus.subscribe(events.MessageReceivedEvent, handler, queue_size=10)
+        for n in range(3):
+            await bus.publish(message('a', n))
+        await settle()
+        assert received == [0, 2] and subscription.errors == 1 and subscription.handled == 3
+    asyncio.run(main())
+
+
+def test_executor_lanes_keep_order_per_node_and_run_nodes_in_parallel():
+    async def main():
+        bus = events.EventBus(thread_workers=4)
+        received = {'a': [], 'b': []}
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def handler(event):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.005)
+            with lock:
+                running[0] -= 1
+                received[event.node_id].append(event.message.data)
+        subscription = bus.subscribe(events.MessageReceivedEvent, handler, executor=events.THREAD)
+        for n in range(10):
+            await bus.publish(message('a', n))
+            await bus.publish(message('b', n))
+        assert subscription.get_stats()['lanes'] == 2
+        for _ in range(200):
+            if subscription.queue_depth == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert received == {'a': list(range(10)), 'b': list(range(10))}
+        # One lane per node: never more than two events of this subscription at once, and both nodes progressed together.
+        assert running[1] == 2
+        assert subscription.get_stats()['lanes'] == 0
+        await bus.close()
+    asyncio.run(main())
+
+
+def test_executor_drop_oldest_keeps_the_running_event():
+    async def main():
+        bus = events.EventBus()
+        release = threading.Event()
+        received = []
+
+        def handler(event):
+            release.wait(1)
+            received.append(event.message.data)
+        executor = ThreadPoolExecutor(1)
+        subscription = bus.subscribe(events.MessageReceivedEvent, handler, queue_size=2, overflow=events.DROP_OLDEST,
+                                     executor=executor)
+        for n in range(4):
+            await bus.publish(message('a', n))
+        assert subscription.dropped == 2
+        release.set()
+        for _ in range(100):
+            if subscription.queue_depth == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert received == [0, 3]
+        executor.shutdown()
+    asyncio.run(main())
+
+
+def test_executor_handler_must_be_a_regular_function():
+    async def handler(event):
+        pass
+
+    with pytest.raises(ValueError):
+        events.Subscription(events.MessageReceivedEvent, handler, executor=ThreadPoolExecutor(1))
+    with pytest.raises(ValueError):
+        events.Subscription(events.MessageReceivedEvent, handler, overflow='spill')
@@ -0,0 +1,33 @@
+from p2p_networking import events
+from p2p_networking.gossip_discovery import ALIVE, GossipDiscovery
+import asyncio
+
+
+def make(uid: str, port: int = 0) -> GossipDiscovery:
+    gossip = GossipDiscovery(events.EventBus())
+    gossip.set_uid(uid)
+    gossip.set_addr('127.0.0.1')
+    gossip.set_port(port)
+    return gossip
+
+
+def test_restarted_node_is_accepted_past_its_tombstone():
+    async def main():
+        observer = make('observer')
+        node = make('node')
+        await node.start()
+        observer._apply_update(['node', '127.0.0.1', 1, ALIVE, node.incarnation])
+        await node.stop()
+        # What peers do with the DEAD update the leaving node broadcasts.
+        observer._remove(observer.members['node'], node.incarnation)
+
+        # Even a fast restart takes longer than a few milliseconds.
+        await asyncio.sleep(0.01)
+        restarted = make('node')
+        await restarted.start()
+        try:
+            observer._apply_update(['node', '127.0.0.1', 1, ALIVE, restarted.incarnation])
+            assert 'node' in observer.members
+        finally:
+            await restarted.stop()
+    asyncio.run(main())
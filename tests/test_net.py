@@ -0,0 +1,14 @@
+from p2p_networking.net import Net
+import pytest
+
+
+def test_membership():
+    net = Net(('192.168.0.5', '24'))
+    assert '192.168.0.77' in net
+    assert '192.168.1.1' not in net
+
+
+@pytest.mark.parametrize('ip', ['192.168.1', '192.168.0', '1.2.3.4.5', '256.1.1.1', '0x7f.0.0.1', 'abc'])
+def test_malformed_address_is_rejected(ip):
+    with pytest.raises(ValueError):
+        ip in Net(('192.168.0.5', '24'))
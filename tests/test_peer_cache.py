@@ -0,0 +1,114 @@
+from p2p_networking.peer_cache import PeerCache
+import asyncio
+import json
+import time
+
+
+def file_lines(path) -> list[str]:
+    with open(path, encoding='utf-8') as file:
+        return file.read().splitlines()
+
+
+def test_entries_survive_reload(tmp_path):
+    path = tmp_path / 'peers.jsonl'
+
+    async def main():
+        cache = PeerCache(str(path))
+        cache.update('a', '10.0.0.1', {'role': 'seed'})
+        cache.update('b', '10.0.0.2')
+        await cache.flush()
+        cache.remove('b')
+        cache.update('a', '10.0.0.3')
+        await cache.flush()
+    asyncio.run(main())
+    cache = PeerCache(str(path))
+    cache.load()
+    assert cache.peers() == [('a', '10.0.0.3')]
+    assert cache.entries['a']['metadata'] == {'role': 'seed'}
+    assert cache.skipped_lines == 0
+
+
+def test_missing_file_loads_empty(tmp_path):
+    cache = PeerCache(str(tmp_path / 'missing.jsonl'))
+    cache.load()
+    assert len(cache) == 0
+
+
+def test_torn_last_line_is_skipped_and_repaired(tmp_path):
+    path = tmp_path / 'peers.jsonl'
+    now = time.time()
+    good = json.dumps({'uid': 'a', 'ip': '10.0.0.1', 'last_seen': now})
+    path.write_text(good + '\n' + '{"uid": "b", "ip": "10.0', encoding='utf-8')
+    cache = PeerCache(str(path))
+    cache.load()
+    assert list(cache.entries) == ['a'] and cache.skipped_lines == 1
+    # The file is rewritten, so the next append does not continue the broken line.
+    assert path.read_text(encoding='utf-8').endswith('\n')
+
+    async def main():
+        cache.update('c', '10.0.0.3')
+        await cache.flush()
+    asyncio.run(main())
+    reloaded = PeerCache(str(path))
+    reloaded.load()
+    assert sorted(reloaded.entries) == ['a', 'c'] and reloaded.skipped_lines == 0
+
+
+def test_corrupt_lines_are_skipped(tmp_path):
+    path = tmp_path / 'peers.jsonl'
+    now = time.time()
+    lines = [
+        json.dumps({'uid': 'a', 'ip': '10.0.0.1', 'last_seen': now}),
+        'not json',
+        '[1, 2]',
+        '"a"',
+        json.dumps({'ip': '10.0.0.9', 'last_seen': now}),
+        json.dumps({'uid': 'b', 'ip': '10.0.0.2', 'last_seen': now}),
+    ]
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    cache = PeerCache(str(path))
+    cache.load()
+    assert sorted(cache.entries) == ['a', 'b'] and cache.skipped_lines == 4
+    assert len(file_lines(path)) == 2
+
+
+def test_expired_entries_are_dropped_on_load(tmp_path):
+    path = tmp_path / 'peers.jsonl'
+    records = [{'uid': 'old', 'ip': '10.0.0.1', 'last_seen': time.time() - 100},
+               {'uid': 'new', 'ip': '10.0.0.2', 'last_seen': time.time()}]
+    path.write_text(''.join(json.dumps(record) + '\n' for record in records), encoding='utf-8')
+    cache = PeerCache(str(path), max_age=10)
+    cache.load()
+    assert list(cache.entries) == ['new']
+
+
+def test_log_is_compacted_when_mostly_stale(tmp_path):
+    path = tmp_path / 'peers.jsonl'
+
+    async def main():
+        cache = PeerCache(str(path))
+        cache.update('a', '10.0.0.1')
+        cache.update('b', '10.0.0.2')
+        await cache.flush()
+        for _ in range(PeerCache.COMPACT_MIN_LINES):
+            cache.touch('a')
+            await cache.flush()
+        return cache
+    cache = asyncio.run(main())
+    assert cache.compactions == 1
+    assert cache.lines < PeerCache.COMPACT_MIN_LINES
+    assert len(file_lines(path)) == cache.lines
+    assert not (tmp_path / 'peers.jsonl.tmp').exists()
+    reloaded = PeerCache(str(path))
+    reloaded.load()
+    assert sorted(reloaded.entries) == ['a', 'b'] and reloaded.compactions == 0
+
+
+def test_large_stale_log_is_compacted_on_load(tmp_path):
+    path = tmp_path / 'peers.jsonl'
+    now = time.time()
+    records = [{'uid': 'a', 'ip': f'10.0.0.{n % 250}', 'last_seen': now} for n in range(PeerCache.COMPACT_MIN_LINES)]
+    path.write_text(''.join(json.dumps(record) + '\n' for record in records), encoding='utf-8')
+    cache = PeerCache(str(path))
+    cache.load()
+    assert cache.compactions == 1 and file_lines(path) == [json.dumps(cache.entries['a'], separators=(',', ':'))]
@@ -0,0 +1,183 @@
+from p2p_networking import relay
+from p2p_networking import wire
+from p2p_networking.relay import Relay, SeenFilter
+from collections import deque
+import pytest
+
+
+class FakeQueue:
+
+    def __init__(self):
+        self.queued_bytes = 0
+        self.high_watermark = 1024
+
+
+class FakePeers(dict):
+
+    def snapshot(self) -> dict:
+        return dict(self)
+
+
+class FakeBus:
+
+    def __init__(self):
+        self.events = []
+
+    def publish_nowait(self, event):
+        self.events.append(event)
+
+
+class FakeLink:
+    """Соединение узла с соседом uid: кадры копятся в общей очереди сети."""
+
+    def __init__(self, network, owner: str, uid: str, codec: str = 'struct'):
+        self.network = network
+        self.owner = owner
+        self.uid = uid
+        self.codec = wire.get_codec(codec)
+        self.is_closing = False
+        self.send_queue = FakeQueue()
+
+    def send_frame_nowait(self, frame, channel=wire.DEFAULT_CHANNEL) -> bool:
+        self.network.frames.append((self.owner, self.uid, bytes(frame)))
+        return True
+
+
+class FakeTransport:
+
+    def __init__(self, uid: str):
+        self.uid = uid
+        self.peers = FakePeers()
+        self.event_bus = FakeBus()
+        self.handlers = {}
+
+    def register_frame_handler(self, kind, handler):
+        self.handlers[kind] = handler
+
+    @property
+    def received(self) -> list:
+        return [(event.node_id, event.message.data) for event in self.event_bus.events]
+
+
+class Network:
+
+    def __init__(self, edges: list, **kwargs):
+        self.frames = deque()
+        self.transports = {}
+        self.sent = []
+        for a, b in edges:
+            for uid in (a, b):
+                if uid not in self.transports:
+                    self.transports[uid] = FakeTransport(uid)
+            self.transports[a].peers[b] = FakeLink(self, a, b)
+            self.transports[b].peers[a] = FakeLink(self, b, a)
+        self.relays = {uid: Relay(transport, **kwargs) for uid, transport in self.transports.items()}
+
+    def run(self):
+        while self.frames:
+            sender, receiver, frame = self.frames.popleft()
+            self.sent.append((sender, receiver))
+            transport = self.transports[receiver]
+            transport.handlers[wire.KIND_RELAY](transport.peers[sender], frame)
+
+
+def test_broadcast_stops_when_ttl_runs_out():
+    network = Network([('a', 'b'), ('b', 'c'), ('c', 'd')])
+    assert network.relays['a'].broadcast('hello', ttl=2) == 1
+    network.run()
+    assert network.transports['b'].received == [('a', 'hello')]
+    assert network.transports['c'].received == [('a', 'hello')]
+    assert network.transports['d'].received == []
+    assert network.relays['c'].stats['expired'] == 1
+    assert network.relays['c'].get_reachable() == {'a': 2}
+
+
+def test_duplicates_are_delivered_and_forwarded_once():
+    network = Network([('a', 'b'), ('a', 'c'), ('b', 'c'), ('b', 'd'), ('c', 'd')])
+    network.relays['a'].broadcast({'n': 1})
+    network.run()
+    for uid in 'bcd':
+        assert network.transports[uid].received == [('a', {'n': 1})]
+    assert network.transports['a'].received == []
+    assert sum(relay.stats['duplicates'] for relay in network.relays.values()) > 0
+    assert all(relay.stats['forwarded'] <= 3 for relay in network.relays.values())
+
+
+def test_message_for_a_direct_neighbour_goes_only_to_it():
+    network = Network([('a', 'b'), ('a', 'c'), ('a', 'd'), ('b', 'c')])
+    assert network.relays['a'].send('b', 'direct') == 1
+    network.run()
+    assert network.sent == [('a', 'b')]
+    assert network.transports['b'].received == [('a', 'direct')]
+
+
+def test_intermediate_node_forwards_to_a_direct_destination_only():
+    network = Network([('a', 'b'), ('b', 'c'), ('b', 'd'), ('b', 'e')])
+    network.relays['a'].send('d', 'via b')
+    network.run()
+    assert network.sent == [('a', 'b'), ('b', 'd')]
+    assert network.transports['d'].received == [('a', 'via b')]
+    assert network.transports['b'].received == []
+
+
+def test_congested_peer_misses_the_flood():
+    network = Network([('a', 'b'), ('a', 'c')])
+    link = network.transports['a'].peers['c']
+    link.send_queue.queued_bytes = link.send_queue.high_watermark
+    assert network.relays['a'].broadcast('x') == 1
+    network.run()
+    assert network.transports['c'].received == []
+    assert network.relays['a'].stats['dropped'] == 1
+
+
+def test_reachable_table_is_bounded(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(relay.time, 'monotonic', lambda: now[0])
+    network = Network([('hub', 'x')])
+    hub = network.relays['hub']
+    hub.REACHABLE_SIZE = 3
+    hub.REACHABLE_TTL = 10.0
+    sender = Relay(network.transports['x'])
+    for n in range(5):
+        network.transports['x'].uid = f'origin{n}'
+        sender.broadcast(n)
+        network.run()
+    assert list(hub.reachable) == ['origin2', 'origin3', 'origin4']
+    now[0] += 10.0
+    assert hub.get_reachable() == {}
+    network.transports['x'].uid = 'fresh'
+    sender.broadcast('x')
+    network.run()
+    assert list(hub.reachable) == ['fresh']
+
+
+def test_seen_filter_forgets_after_all_buckets_rotate():
+    seen = SeenFilter(capacity=10, buckets=2, interval=1000)
+    assert seen.add(b'first') and not seen.add(b'first')
+    for n in range(10):
+        seen.add(b'fill-%d' % n)
+    # One rotation: the key is still in the previous bucket.
+    assert not seen.add(b'first')
+    for n in range(10):
+        seen.add(b'more-%d' % n)
+    seen.add(b'rotate')
+    assert seen.add(b'first')
+
+
+def test_seen_filter_rotates_by_time(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(relay.time, 'monotonic', lambda: now[0])
+    seen = SeenFilter(capacity=100, buckets=3, interval=10)
+    seen.add(b'id')
+    now[0] += 25
+    assert not seen.add(b'id')
+    now[0] += 10
+    assert seen.add(b'id')
+    assert seen.memory_bytes == 3 * ((seen.bits + 7) // 8)
+
+
+def test_invalid_parameters_are_rejected():
+    with pytest.raises(ValueError):
+        SeenFilter(error_rate=1)
+    with pytest.raises(ValueError):
+        Relay(FakeTransport('a'), ttl=0)
@@ -0,0 +1,126 @@
+from fakes import peer_pair, settle
+from p2p_networking import wire
+from p2p_networking.rpc import STATUS_DEADLINE_EXCEEDED, MethodNotFoundError, RemoteError, RpcChannel
+import asyncio
+import pytest
+
+
+def connect(handlers: dict) -> tuple:
+    a, b = peer_pair()
+    return RpcChannel(a, {}), RpcChannel(b, handlers)
+
+
+def test_request_returns_the_handler_result():
+    async def echo(payload, uid):
+        return {'echo': payload, 'from': uid}
+
+    async def main():
+        client, server = connect({'echo': echo})
+        assert await client.request('echo', [1, 'x'], timeout=1) == {'echo': [1, 'x'], 'from': 'a'}
+        assert client.pending == 0 and server.requests_served == 1
+    asyncio.run(main())
+
+
+def test_concurrent_requests_are_matched_by_correlation_id():
+    async def delayed(payload, uid):
+        await asyncio.sleep(0.01 * (5 - payload))
+        return payload
+
+    async def main():
+        client, _ = connect({'delayed': delayed})
+        assert await asyncio.gather(*(client.request('delayed', n, timeout=1) for n in range(5))) == list(range(5))
+    asyncio.run(main())
+
+
+def test_handler_error_is_raised_as_remote_error():
+    async def fail(payload, uid):
+        raise KeyError('missing')
+
+    async def main():
+        client, _ = connect({'fail': fail})
+        with pytest.raises(RemoteError, match='KeyError'):
+            await client.request('fail', timeout=1)
+        with pytest.raises(MethodNotFoundError):
+            await client.request('unknown', timeout=1)
+    asyncio.run(main())
+
+
+def test_unencodable_result_is_reported_as_error():
+    async def returns_set(payload, uid):
+        return {1, 2}
+
+    async def main():
+        client, _ = connect({'set': returns_set})
+        with pytest.raises(RemoteError, match='Cannot encode'):
+            await asyncio.wait_for(client.request('set'), 1)
+    asyncio.run(main())
+
+
+def test_caller_timeout_cancels_the_handler():
+    started = []
+
+    async def slow(payload, uid):
+        started.append(True)
+        await asyncio.sleep(10)
+
+    async def main():
+        client, server = connect({'slow': slow})
+        with pytest.raises(asyncio.TimeoutError):
+            await client.request('slow', timeout=0.05)
+        await asyncio.sleep(0.05)
+        assert started and server.get_stats()['serving'] == 0
+    asyncio.run(main())
+
+
+def test_handler_past_its_deadline_returns_deadline_exceeded():
+    async def slow(payload, uid):
+        await asyncio.sleep(10)
+
+    async def main():
+        a, b = peer_pair()
+        RpcChannel(b, {'slow': slow})
+        responses = []
+        a.register_frame_handler(wire.KIND_RESPONSE, responses.append)
+        a.send_frame_nowait(wire.encode_frame(wire.KIND_REQUEST, ['slow', None, 0.01], a.codec, correlation=7))
+        await asyncio.sleep(0.05)
+        [frame] = responses
+        assert wire.frame_correlation(frame) == 7
+        assert wire.decode_frame(frame)[2][0] == STATUS_DEADLINE_EXCEEDED
+    asyncio.run(main())
+
+
+def test_cancelled_request_cancels_the_handler():
+    async def main():
+        handler_cancelled = asyncio.Event()
+
+        async def slow(payload, uid):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                handler_cancelled.set()
+                raise
+
+        client, server = connect({'slow': slow})
+        task = asyncio.create_task(client.request('slow'))
+        await settle()
+        assert server.get_stats()['serving'] == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.wait_for(handler_cancelled.wait(), 1)
+        assert client.pending == 0
+    asyncio.run(main())
+
+
+def test_connection_loss_fails_pending_requests():
+    async def slow(payload, uid):
+        await asyncio.sleep(10)
+
+    async def main():
+        client, _ = connect({'slow': slow})
+        task = asyncio.create_task(client.request('slow'))
+        await settle()
+        client.peer.close(ConnectionResetError('reset'))
+        with pytest.raises(ConnectionError):
+            await task
+    asyncio.run(main())
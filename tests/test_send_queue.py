@@ -0,0 +1,152 @@
+from p2p_networking.send_queue import CONTROL_CHANNEL, SendQueue
+import asyncio
+import pytest
+
+
+class FakeWriter:
+
+    def __init__(self):
+        self.batches = []
+        self.error: Exception = None
+
+    def writelines(self, chunks):
+        self.batches.append(list(chunks))
+
+    async def drain(self):
+        if self.error:
+            raise self.error
+
+
+def frames_of(batch: list) -> list:
+    """Кадры пакета без четырёхбайтовых префиксов длины."""
+    assert all(int.from_bytes(prefix, 'big') == len(frame) for prefix, frame in zip(batch[::2], batch[1::2]))
+    return batch[1::2]
+
+
+def frame(channel: int, size: int) -> bytes:
+    return bytes([channel % 256]) * size
+
+
+async def on_error(error):
+    pass
+
+
+def test_concurrent_frames_are_written_in_one_batch():
+    async def main():
+        writer = FakeWriter()
+        queue = SendQueue(writer, on_error)
+        task = asyncio.create_task(queue.run())
+        for n in range(10):
+            queue.put_nowait(bytes([n]))
+        await asyncio.sleep(0.01)
+        assert [frames_of(batch) for batch in writer.batches] == [[bytes([n]) for n in range(10)]]
+        assert queue.queued_messages == 0 and queue.queued_bytes == 0 and not queue.is_busy
+        task.cancel()
+        await task
+    asyncio.run(main())
+
+
+def test_batch_is_limited_by_max_batch_bytes():
+    queue = SendQueue(FakeWriter(), on_error, max_batch_bytes=3000)
+    for channel in range(10):
+        queue.put_nowait(frame(channel, 1000), channel)
+    sizes = []
+    while queue.queued_messages:
+        sizes.append(len(frames_of(queue._next_batch()[0])))
+    assert sizes == [3, 3, 3, 1]
+
+
+def test_control_frames_go_first():
+    queue = SendQueue(FakeWriter(), on_error)
+    queue.put_nowait(b'data', 0)
+    queue.put_nowait(b'ping', CONTROL_CHANNEL)
+    assert frames_of(queue._next_batch()[0]) == [b'ping', b'data']
+
+
+def test_full_channel_blocks_only_its_senders():
+    async def main():
+        quantum = SendQueue.QUANTUM
+        queue = SendQueue(FakeWriter(), on_error, high_watermark=4 * quantum, low_watermark=quantum, max_batch_bytes=1)
+        for _ in range(4):
+            queue.put_nowait(frame(1, quantum), 1)
+        assert not queue.is_writable(1) and queue.is_writable(2)
+        blocked = asyncio.create_task(queue.put(frame(1, quantum), 1))
+        await queue.put(b'data', 2)
+        await queue.put(b'ping', CONTROL_CHANNEL)
+        await asyncio.sleep(0)
+        assert not blocked.done()
+        # The control frame fills the first batch; each next one takes a quantum from one channel.
+        # The full channel reopens only at the low watermark.
+        for _ in range(4):
+            queue._next_batch()
+        await asyncio.sleep(0)
+        assert not blocked.done()
+        queue._next_batch()
+        await asyncio.wait_for(blocked, 1)
+        assert queue.is_writable(1)
+    asyncio.run(main())
+
+
+def test_close_wakes_blocked_senders():
+    async def main():
+        queue = SendQueue(FakeWriter(), on_error, high_watermark=10, low_watermark=0)
+        queue.put_nowait(frame(0, 10))
+        blocked = asyncio.create_task(queue.put(b'x'))
+        await asyncio.sleep(0)
+        queue.close()
+        with pytest.raises(ConnectionError):
+            await blocked
+        with pytest.raises(ConnectionError):
+            queue.put_nowait(b'x')
+    asyncio.run(main())
+
+
+def test_low_watermark_above_high_is_rejected():
+    with pytest.raises(ValueError):
+        SendQueue(FakeWriter(), on_error, high_watermark=10, low_watermark=20)
+
+
+def test_channels_share_bandwidth_by_weight():
+    queue = SendQueue(FakeWriter(), on_error, max_batch_bytes=SendQueue.QUANTUM * 4, weights={1: 3})
+    for _ in range(200):
+        queue.put_nowait(frame(1, 1024), 1)
+        queue.put_nowait(frame(2, 1024), 2)
+    sent = frames_of(queue._next_batch()[0])
+    assert sent.count(frame(1, 1024)) == 3 * sent.count(frame(2, 1024)) == 48
+
+
+def test_bulk_channel_does_not_delay_others_by_more_than_a_quantum():
+    queue = SendQueue(FakeWriter(), on_error, max_batch_bytes=1)
+    for _ in range(100):
+        queue.put_nowait(frame(1, 1024), 1)
+    queue.put_nowait(b'urgent', 2)
+    batches = [frames_of(queue._next_batch()[0]) for _ in range(2)]
+    assert len(batches[0]) == SendQueue.QUANTUM // 1024
+    assert batches[1] == [b'urgent']
+
+
+def test_frame_larger_than_quantum_waits_for_accumulated_deficit():
+    queue = SendQueue(FakeWriter(), on_error)
+    large = frame(1, SendQueue.QUANTUM + 1)
+    queue.put_nowait(large, 1)
+    queue.put_nowait(b'small', 2)
+    assert frames_of(queue._next_batch()[0]) == [b'small', large]
+    assert queue._lanes[1].deficit == 0
+
+
+def test_write_error_closes_the_queue():
+    async def main():
+        errors = []
+
+        async def on_error(error):
+            errors.append(error)
+        writer = FakeWriter()
+        writer.error = ConnectionResetError('reset')
+        queue = SendQueue(writer, on_error)
+        task = asyncio.create_task(queue.run())
+        queue.put_nowait(b'x')
+        await asyncio.wait_for(task, 1)
+        assert errors == [writer.error]
+        with pytest.raises(ConnectionError):
+            queue.put_nowait(b'y')
+    asyncio.run(main())
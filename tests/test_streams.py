@@ -0,0 +1,115 @@
+from fakes import peer_pair, settle
+from p2p_networking.streams import StreamMultiplexer, StreamResetError
+import asyncio
+import pytest
+
+
+def connect(**kwargs):
+    a, b = peer_pair()
+    opened = []
+    left = StreamMultiplexer(a, 'a', opened.append, **kwargs)
+    right = StreamMultiplexer(b, 'b', opened.append, **kwargs)
+    return left, right, opened
+
+
+def test_streams_read_to_the_end_release_their_slot():
+    async def main():
+        left, right, opened = connect()
+        for index in range(StreamMultiplexer.MAX_STREAMS + 6):
+            stream = await left.open({'n': index})
+            await stream.write(b'payload')
+            await stream.close()
+            await settle()
+            incoming = opened.pop()
+            assert incoming.metadata == {'n': index}
+            assert await incoming.read() == b'payload'
+            assert await incoming.read() == b''
+        assert right.streams == {} and right.streams_refused == 0
+    asyncio.run(main())
+
+
+def test_streams_closed_by_both_sides_are_released():
+    async def main():
+        left, right, opened = connect()
+        for _ in range(StreamMultiplexer.MAX_STREAMS + 6):
+            stream = await left.open()
+            await stream.write(b'payload')
+            await stream.close()
+            await settle()
+            incoming = opened.pop()
+            assert await incoming.read() == b'payload'
+            await incoming.close()
+            await settle()
+            assert stream.is_closed and incoming.is_closed
+        assert left.streams == {} and right.streams == {}
+        assert right.streams_refused == 0
+    asyncio.run(main())
+
+
+def test_reply_after_reading_to_the_end():
+    async def main():
+        left, right, opened = connect()
+        stream = await left.open()
+        await stream.write(b'request')
+        await stream.close()
+        await settle()
+        incoming = opened.pop()
+        assert await incoming.read() == b'request'
+        assert await incoming.read() == b''
+        assert right.streams == {}
+        reply = b'r' * (3 * incoming.WINDOW)
+        reader = asyncio.create_task(read_all(stream))
+        await asyncio.wait_for(incoming.write(reply), 1)
+        await incoming.close()
+        assert await asyncio.wait_for(reader, 1) == reply
+        await settle()
+        assert left.streams == {} and right.streams == {}
+    asyncio.run(main())
+
+
+async def read_all(stream) -> bytes:
+    parts = []
+    async for chunk in stream:
+        parts.append(chunk)
+    return b''.join(parts)
+
+
+def test_bidirectional_stream_stays_open_until_both_sides_close():
+    async def main():
+        left, right, opened = connect()
+        stream = await left.open()
+        await stream.write(b'request')
+        await stream.close()
+        await settle()
+        incoming = opened.pop()
+        await incoming.write(b'reply')
+        assert await incoming.read() == b'request'
+        assert await incoming.read() == b''
+        await settle()
+        assert incoming.id in right.streams
+        await incoming.close()
+        await settle()
+        assert await stream.read() == b'reply'
+        assert await stream.read() == b''
+        assert left.streams == {} and right.streams == {}
+    asyncio.run(main())
+
+
+def test_excess_remote_streams_are_reset():
+    async def main():
+        left, right, opened = connect(max_streams=2)
+        streams = [await left.open() for _ in range(3)]
+        await settle()
+        assert len(opened) == 2 and right.streams_refused == 1
+        with pytest.raises(StreamResetError):
+            await streams[2].write(b'x')
+    asyncio.run(main())
+
+
+def test_read_zero_returns_immediately():
+    async def main():
+        left, right, opened = connect()
+        stream = await left.open()
+        await settle()
+        assert await asyncio.wait_for(opened[0].read(0), 1) == b''
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+from p2p_networking import events
+from p2p_networking import messages
+from p2p_networking.tcp_transport import TcpTransport
+import asyncio
+import pytest
+
+PORT = 53071
+
+
+async def start(uid: str, addr: str, **kwargs) -> TcpTransport:
+    transport = TcpTransport(events.EventBus(), **kwargs)
+    transport.set_uid(uid)
+    transport.set_addr(addr)
+    transport.set_port(PORT)
+    asyncio.create_task(transport.start())
+    await asyncio.sleep(0.05)
+    return transport
+
+
+async def wait_for(condition, timeout: float = 2):
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(poll(), timeout)
+
+
+def test_reliable_send_to_json_only_peer_fails_immediately():
+    async def main():
+        a = await start('a', '127.0.0.1')
+        b = await start('b', '127.0.0.2', codecs=[])
+        try:
+            await a.event_bus.publish(events.NodeDiscoveredEvent('b', {'ip': '127.0.0.2'}))
+            await wait_for(lambda: a.peers.get('b') is not None and a.peers.get('b').json_only)
+            with pytest.raises(ConnectionError):
+                await a.send_to_peer('b', 'x', reliable=True)
+            assert a.sessions == {}
+            assert await a.send_to_peer('b', 'x') is True
+        finally:
+            await a.stop()
+            await b.stop()
+    asyncio.run(main())
+
+
+def test_pending_reliable_messages_fail_when_peer_is_json_only():
+    async def main():
+        a = await start('a', '127.0.0.1')
+        b = await start('b', '127.0.0.2', codecs=[])
+        try:
+            future = await a.send_to_peer('b', 'x', reliable=True)
+            await b.event_bus.publish(events.NodeDiscoveredEvent('a', {'ip': '127.0.0.1'}))
+            with pytest.raises(ConnectionError):
+                await asyncio.wait_for(future, 2)
+        finally:
+            await a.stop()
+            await b.stop()
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize('body', [None, 'codec', ['codec']])
+def test_system_message_without_object_body_is_delivered(body):
+    async def main():
+        transport = TcpTransport(events.EventBus())
+        received = []
+
+        async def on_message(event):
+            received.append(event.message.data)
+        transport.event_bus.subscribe(events.MessageReceivedEvent, on_message)
+        await transport._on_message(messages.SystemMessage(body), 'b')
+        await wait_for(lambda: received)
+        assert received == [body]
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+from p2p_networking import compression
+from p2p_networking import wire
+import pytest
+
+STRUCT = wire.get_codec('struct')
+JSON = wire.get_codec('json')
+
+
+def test_struct_roundtrip():
+    data = {'a': [1, 2.5, 'x', b'\x00', None, True, False, 2**70], 'b': {}}
+    assert STRUCT.decode(STRUCT.encode(data)) == data
+
+
+@pytest.mark.parametrize('cut', range(1, 12))
+def test_truncated_struct_frame_raises_value_error(cut):
+    frame = wire.encode_frame(wire.KIND_USER, {'key': ['value', 12345]}, STRUCT)
+    with pytest.raises(ValueError):
+        wire.decode_frame(frame[:-cut])
+
+
+def test_truncated_header_fields_raise_value_error():
+    frame = wire.encode_frame(wire.KIND_USER, {'a': 1}, STRUCT, channel=3, sequence=(1, 2), correlation=7)
+    for size in range(wire.HEADER_SIZE, wire.body_offset(frame)):
+        with pytest.raises(ValueError):
+            wire.decode_frame(frame[:size])
+
+
+def test_short_string_length_raises_value_error():
+    with pytest.raises(ValueError):
+        STRUCT.decode(b's\x00\x00\x00\x10abc')
+
+
+def test_unhashable_key_raises_value_error():
+    with pytest.raises(ValueError):
+        STRUCT.decode(b'm\x00\x00\x00\x01l\x00\x00\x00\x00N')
+
+
+def test_deeply_nested_struct_raises_value_error():
+    payload = b'l\x00\x00\x00\x01' * 100_000 + b'N'
+    with pytest.raises(ValueError):
+        wire.decode_frame(wire.frame_header(wire.KIND_USER, STRUCT) + payload)
+
+
+def test_deeply_nested_json_raises_value_error():
+    payload = b'[' * 100_000 + b']' * 100_000
+    with pytest.raises(ValueError):
+        wire.decode_frame(wire.frame_header(wire.KIND_USER, JSON) + payload)
+
+
+def test_moderate_nesting_is_accepted():
+    data = []
+    for _ in range(100):
+        data = [data]
+    assert STRUCT.decode(STRUCT.encode(data)) == data
+
+
+@pytest.mark.parametrize('body', [b'', b'\x81', b'\x81\x00', b'\x81\x00\x00\x00'])
+def test_truncated_compressed_body_raises_value_error(body):
+    with pytest.raises(ValueError):
+        compression.decompress_body(body)
+
+
+@pytest.mark.parametrize('header, accessor', [
+    (wire.frame_header(wire.KIND_USER, STRUCT, channel=3), wire.frame_channel),
+    (wire.frame_header(wire.KIND_USER, STRUCT, sequence=(1, 2)), wire.frame_sequence),
+    (wire.frame_header(wire.KIND_REQUEST, STRUCT, correlation=7), wire.frame_correlation),
+])
+def test_header_accessors_reject_short_frames(header, accessor):
+    for size in range(wire.HEADER_SIZE, len(header)):
+        with pytest.raises(ValueError):
+            accessor(header[:size])
+        with pytest.raises(ValueError):
+            wire.decode_frame(header[:size])